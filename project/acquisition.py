@@ -0,0 +1,58 @@
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=30.0):
+    """Exponential backoff with full jitter for the given (1-based) retry attempt"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+def retry(func, name, max_retries=3, base_delay=1.0, max_delay=30.0, deadline=None, give_up_on=(),
+          sleep=time.sleep):
+    """
+    Call func until it succeeds, backing off exponentially with jitter between attempts.
+
+    Gives up after max_retries attempts, earlier when the next attempt would start
+    after the monotonic deadline, or at once on an exception listed in give_up_on,
+    and raises a RuntimeError with the last error.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return func()
+        except Exception as e:
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            out_of_time = deadline is not None and time.monotonic() + delay >= deadline
+            if attempt >= max_retries or out_of_time or isinstance(e, give_up_on):
+                logger.error(f"Failed to acquire {name} after {attempt} attempts")
+                raise RuntimeError(f"Failed to acquire {name}: {str(e)}") from e
+            logger.warning(f"Attempt {attempt} for {name} failed ({str(e)}), retrying in {delay:.1f}s...")
+            sleep(delay)
+
+def call_with_deadline(func, name, deadline):
+    """
+    Call func in a daemon thread and wait for it until the monotonic deadline.
+
+    Raises TimeoutError when it has not returned by then; a call that hangs, such as
+    a download without a socket timeout, is left behind instead of blocking the run.
+    """
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = func()
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, name=f'acquire {name}', daemon=True)
+    thread.start()
+    thread.join(max(0, deadline - time.monotonic()))
+    if thread.is_alive():
+        logger.error(f"Acquiring {name} did not finish before the deadline")
+        raise TimeoutError(f"Acquiring {name} did not finish before the deadline")
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
@@ -0,0 +1,285 @@
+"""
+Benchmarks for the pipeline stages on synthetic data.
+
+Generates renewable, pollution and EPA wide-format frames shaped like the real
+sources, times every stage, measures its peak traced memory, times the cold
+import of the modules scheduled jobs start from, and writes the results as
+JSON. Results can be compared against a baseline file to flag regressions:
+
+    python benchmark.py --rows 10000 1000000 --output bench.json --baseline baseline.json
+"""
+import argparse
+import json
+import logging
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pipeline import preprocess_renewable_energy, preprocess_pollution, process_emissions_data
+from storage import bulk_load, create_indexes
+
+RENEWABLE_ENERGY_COLUMNS = [
+    'Hydroelectric Power', 'Geothermal Energy', 'Solar Energy', 'Wind Energy', 'Wood Energy',
+    'Waste Energy', 'Fuel Ethanol, Excluding Denaturant', 'Biomass Losses and Co-products',
+    'Biomass Energy', 'Total Renewable Energy', 'Renewable Diesel Fuel', 'Other Biofuels',
+    'Conventional Hydroelectric Power', 'Biodiesel'
+]
+SECTORS = ['Commerical', 'Electric Power', 'Industrial', 'Residential', 'Transportation']
+STATES = ['Arizona', 'California', 'Colorado', 'New York', 'Ohio', 'Pennsylvania', 'Texas', 'Utah']
+STATE_CODES = ['AK', 'AL', 'AZ', 'CA', 'CO', 'NY', 'OH', 'PA', 'TX', 'UT']
+SOURCES = ['Fuel Comb. Elec. Util.', 'Fuel Comb. Industrial', 'Highway Vehicles', 'Off-Highway', 'Miscellaneous']
+POLLUTANTS = ['Black Carbon', 'CO', 'NH3', 'NOX', 'PM10-PRI', 'PM25-PRI', 'SO2', 'VOC']
+EMISSION_YEARS = [1990] + list(range(1996, 2024))
+
+def synthetic_renewable(rows, seed=0):
+    """Monthly renewable consumption by sector, like the Kaggle renewable dataset"""
+    rng = np.random.default_rng(seed)
+    months = np.arange(rows) // len(SECTORS)
+    df = pd.DataFrame({
+        'Year': 1973 + months // 12,
+        'Month': 1 + months % 12,
+        'Sector': np.resize(SECTORS, rows),
+    })
+    for col in RENEWABLE_ENERGY_COLUMNS:
+        values = rng.gamma(1.0, 20.0, rows).round(3)
+        values[rng.random(rows) < 0.3] = 0
+        df[col] = values
+    return df
+
+def synthetic_pollution(rows, seed=0, duplicate_ratio=0.01, missing_ratio=0.02):
+    """Daily site-level readings with some duplicates and gaps, like the Kaggle pollution CSV"""
+    rng = np.random.default_rng(seed)
+    sites = max(1, rows // 3000)
+    site = rng.integers(0, sites, rows)
+    dates = pd.Timestamp('2000-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 8766, rows)), unit='D')
+    df = pd.DataFrame({
+        'Unnamed: 0': np.arange(rows),
+        'Date': dates.strftime('%Y-%m-%d'),
+        'Address': [f"{i} MAIN ST" for i in site],
+        'State': [STATES[i % len(STATES)] + (' ' if i % 5 == 0 else '') for i in site],
+        'County': [f"County {i % 300}" for i in site],
+        'City': [f"City {i % 800}" for i in site],
+    })
+    for pollutant, scale in [('O3', 0.03), ('CO', 0.5), ('SO2', 2.0), ('NO2', 15.0)]:
+        df[f'{pollutant} Mean'] = rng.gamma(2.0, scale / 2, rows)
+        df[f'{pollutant} 1st Max Value'] = df[f'{pollutant} Mean'] * rng.uniform(1, 3, rows)
+        df[f'{pollutant} 1st Max Hour'] = rng.integers(0, 24, rows)
+        aqi = rng.integers(0, 150, rows)
+        if pollutant in ('CO', 'SO2'):
+            aqi = aqi.astype(float)
+            aqi[rng.random(rows) < missing_ratio] = np.nan
+        df[f'{pollutant} AQI'] = aqi
+    duplicates = df.sample(frac=duplicate_ratio, random_state=seed)
+    return pd.concat([df, duplicates]).sort_values('Unnamed: 0', kind='stable').reset_index(drop=True)
+
+def synthetic_emissions_wide(rows, seed=0):
+    """EPA State_Trends wide table with enough state/source/pollutant rows to melt into about `rows` rows"""
+    rng = np.random.default_rng(seed)
+    wide_rows = max(1, rows // len(EMISSION_YEARS))
+    # Every wide row is a distinct state, source and pollutant, as in the EPA sheet
+    row = rng.permutation(wide_rows)
+    state = row % len(STATE_CODES)
+    pollutant = row // len(STATE_CODES) % len(POLLUTANTS)
+    source = row // (len(STATE_CODES) * len(POLLUTANTS))
+    df = pd.DataFrame({
+        'State FIPS': [f"{i + 1:02d}" for i in state],
+        'State': np.take(STATE_CODES, state),
+        'Tier 1 Code': [f"{i + 1:02d}" for i in source],
+        'Tier 1 Description': [SOURCES[i % len(SOURCES)] + (f" {i // len(SOURCES)}" if i >= len(SOURCES) else '')
+                               for i in source],
+        'Pollutant': np.take(POLLUTANTS, pollutant),
+    })
+    for year in EMISSION_YEARS:
+        values = rng.gamma(1.0, 3.0, wide_rows)
+        values[rng.random(wide_rows) < 0.05] = np.nan
+        df[f'emissions{year}'] = values
+    return df
+
+def _melt_emissions(df):
+    """The wide-to-long reshape on its own"""
+    year_columns = [col for col in df.columns if col.startswith('emissions')]
+    return df.melt(id_vars=['State', 'Tier 1 Description', 'Pollutant'], value_vars=year_columns,
+                   var_name='Year', value_name='Emissions')
+
+def _load_pollution(df, load=bulk_load):
+    """Bulk load processed pollution rows into a throwaway database"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = sqlite3.connect(Path(tmp_dir) / 'bench.db')
+        try:
+            return load(conn, 'pollution', df)
+        finally:
+            conn.close()
+
+def _to_sql(conn, table, df):
+    """
+    The DataFrame.to_sql load that bulk_load replaced, with the same indexes built
+    afterwards, as the baseline of sqlite_load_pollution
+    """
+    rows = df.to_sql(table, conn, index=False)
+    create_indexes(conn, table)
+    return rows
+
+# Stage name -> (input generator, function under test)
+STAGES = {
+    'preprocess_renewable_energy': (synthetic_renewable, preprocess_renewable_energy),
+    'preprocess_pollution': (synthetic_pollution, preprocess_pollution),
+    'process_emissions_data': (synthetic_emissions_wide, process_emissions_data),
+    'emissions_melt': (synthetic_emissions_wide, _melt_emissions),
+    'sqlite_load_pollution': (lambda rows: preprocess_pollution(synthetic_pollution(rows)), _load_pollution),
+    'sqlite_to_sql_pollution': (lambda rows: preprocess_pollution(synthetic_pollution(rows)),
+                                partial(_load_pollution, load=_to_sql)),
+}
+
+# Modules whose cold import time is tracked, since short scheduled jobs pay it on every run
+IMPORT_MODULES = ['pipeline', 'query']
+
+def measure_import_time(module, repeat=3):
+    """
+    Cold import time of a module (best of repeat fresh interpreters), from -X importtime,
+    with the dependencies it imports directly that take longest
+    """
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=Path(__file__).parent, capture_output=True, text=True, check=True)
+        # Lines look like "import time: self [us] | cumulative | <indented name>", children
+        # before their parent, so the direct imports of a module are the depth 1 lines above it
+        children, imported = [], 0
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            depth = (len(name) - len(name.lstrip())) // 2
+            imported += 1
+            if depth == 1:
+                children.append((name.strip(), int(cumulative) / 1e6))
+            elif depth == 0 and name.strip() == module:
+                runs.append((int(cumulative) / 1e6, children, imported))
+            elif depth == 0:
+                children = []
+
+    seconds, children, imported = min(runs, key=lambda run: run[0])
+    children.sort(key=lambda child: child[1], reverse=True)
+    return {
+        'module': module,
+        'seconds': seconds,
+        'slowest_imports': [{'module': name, 'seconds': child_seconds} for name, child_seconds in children[:5]],
+        'modules_imported': imported,
+    }
+
+def benchmark_stage(stage, rows, repeat=3):
+    """Time a stage on synthetic input (best of repeat) and measure its peak traced memory"""
+    make_input, func = STAGES[stage]
+    df = make_input(rows)
+
+    timings = []
+    for _ in range(repeat):
+        data = df.copy()
+        started, cpu_started = time.perf_counter(), time.process_time()
+        func(data)
+        timings.append((time.perf_counter() - started, time.process_time() - cpu_started))
+
+    data = df.copy()
+    tracemalloc.start()
+    try:
+        func(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    seconds, cpu_seconds = min(timings)
+    return {
+        'stage': stage, 'rows': rows, 'input_rows': len(df),
+        'seconds': round(seconds, 6), 'cpu_seconds': round(cpu_seconds, 6), 'peak_bytes': peak
+    }
+
+def run_benchmarks(rows_list, stages=None, repeat=3, import_modules=IMPORT_MODULES):
+    """Benchmark every stage at every row count and the module imports, and return a JSON-serializable report"""
+    results = [
+        benchmark_stage(stage, rows, repeat=repeat)
+        for rows in rows_list for stage in (stages or STAGES)
+    ]
+    imports = [measure_import_time(module, repeat=repeat) for module in import_modules]
+    return {
+        'created_at': pd.Timestamp.now().isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'results': results,
+        'imports': imports,
+    }
+
+def find_regressions(report, baseline, threshold=0.2):
+    """List the stages that got slower or used more memory than the baseline by more than threshold"""
+    baseline_results = {(r['stage'], r['rows']): r for r in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        previous = baseline_results.get((result['stage'], result['rows']))
+        if previous is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if previous[metric] and result[metric] > previous[metric] * (1 + threshold):
+                regressions.append({
+                    'stage': result['stage'], 'rows': result['rows'], 'metric': metric,
+                    'baseline': previous[metric], 'current': result[metric],
+                    'change': round(result[metric] / previous[metric] - 1, 3)
+                })
+    baseline_imports = {r['module']: r for r in baseline.get('imports', [])}
+    for result in report.get('imports', []):
+        previous = baseline_imports.get(result['module'])
+        if previous and previous['seconds'] and result['seconds'] > previous['seconds'] * (1 + threshold):
+            regressions.append({
+                'stage': f"import {result['module']}", 'rows': 0, 'metric': 'seconds',
+                'baseline': previous['seconds'], 'current': result['seconds'],
+                'change': round(result['seconds'] / previous['seconds'] - 1, 3)
+            })
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000],
+                        help="row counts to benchmark, e.g. 10000 1000000 50000000")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=None,
+                        help="stages to benchmark (default: all)")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per stage, the best one is kept")
+    parser.add_argument('--output', type=Path, default=Path('benchmark-results.json'),
+                        help="where to write the JSON results")
+    parser.add_argument('--baseline', type=Path, default=None,
+                        help="previous results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="relative slowdown or memory growth that counts as a regression")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    try:
+        report = run_benchmarks(args.rows, args.stages, args.repeat)
+    finally:
+        logging.disable(logging.NOTSET)
+    args.output.write_text(json.dumps(report, indent=2))
+    for r in report['results']:
+        print(f"{r['stage']:<30} {r['rows']:>10} rows  {r['seconds']:>9.3f}s  {r['peak_bytes'] / 1024 ** 2:>9.1f} MB")
+    for r in report['imports']:
+        slowest = ', '.join(f"{i['module']} {i['seconds']:.3f}s" for i in r['slowest_imports'][:3])
+        print(f"{'import ' + r['module']:<30} {'':>15}  {r['seconds']:>9.3f}s  ({slowest})")
+    print(f"Results written to {args.output}")
+
+    if args.baseline is not None:
+        regressions = find_regressions(report, json.loads(args.baseline.read_text()), args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['stage']} at {r['rows']} rows: {r['metric']} "
+                  f"{r['baseline']} -> {r['current']} (+{r['change']:.0%})")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+class CacheMissError(LookupError):
+    """Raised when an artifact is requested offline but is not in the cache"""
+
+def _sha256(path, block_size=1 << 20):
+    """SHA-256 of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class RawCache:
+    """
+    Content-addressed on-disk cache for raw source artifacts.
+
+    Each entry maps a source key (a Kaggle slug or a URL) to the files it produced.
+    File contents are stored once under objects/ by their SHA-256 and verified when
+    restored. An entry can record the remote version (fingerprint) it was downloaded
+    at; entries of another version than the one asked for, or older than max_age,
+    are refreshed unless the cache is offline. The least recently used entries are
+    evicted once the cache exceeds max_bytes.
+    """
+
+    def __init__(self, root='data/cache', max_bytes=2 * 1024 ** 3, max_age=24 * 3600, offline=False):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.offline = offline
+        self._lock = threading.RLock()
+        self._index_path = self.root / 'index.json'
+        (self.root / 'objects').mkdir(parents=True, exist_ok=True)
+        self._index = json.loads(self._index_path.read_text()) if self._index_path.exists() else {}
+
+    def _object_path(self, sha):
+        return self.root / 'objects' / sha[:2] / sha
+
+    def _save_index(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp_path, self._index_path)
+
+    def size(self):
+        """Total bytes of the objects referenced by the index"""
+        with self._lock:
+            objects = {(sha, size) for entry in self._index.values() for sha, size in entry['files'].values()}
+            return sum(size for _, size in objects)
+
+    def lookup(self, key, version=None):
+        """Return {file name: cached path} for a usable entry of the given version (if any), or None"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            if not self.offline and version is not None and entry.get('version') != version:
+                logger.info(f"Cache entry for {key} is not of version {version}, refreshing")
+                return None
+            if not self.offline and self.max_age is not None and time.time() - entry['stored_at'] > self.max_age:
+                logger.info(f"Cache entry for {key} is older than {self.max_age}s, refreshing")
+                return None
+            paths = {}
+            for name, (sha, _) in entry['files'].items():
+                path = self._object_path(sha)
+                if not path.exists() or _sha256(path) != sha:
+                    logger.warning(f"Cache entry for {key} failed its integrity check, dropping it")
+                    self._drop(key)
+                    return None
+                paths[name] = path
+            entry['last_access'] = time.time()
+            self._save_index()
+            return paths
+
+    def restore(self, key, target_dir, version=None):
+        """Place the cached files of key into target_dir; returns False on a miss"""
+        paths = self.lookup(key, version)
+        if paths is None:
+            if self.offline:
+                raise CacheMissError(f"{key} is not in the cache and the pipeline is offline")
+            return False
+        target_dir = Path(target_dir)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        for name, path in paths.items():
+            target = target_dir / name
+            target.unlink(missing_ok=True)
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copyfile(path, target)
+        logger.info(f"Restored {key} from cache ({len(paths)} files)")
+        return True
+
+    def store(self, key, files, version=None):
+        """Store {file name: path or bytes} under key, at a remote version if known, and evict old entries if needed"""
+        with self._lock:
+            stored = {}
+            for name, content in files.items():
+                if isinstance(content, bytes):
+                    sha, size = hashlib.sha256(content).hexdigest(), len(content)
+                else:
+                    sha, size = _sha256(content), os.path.getsize(content)
+                path = self._object_path(sha)
+                if not path.exists():
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+                    with os.fdopen(fd, 'wb') as f:
+                        if isinstance(content, bytes):
+                            f.write(content)
+                        else:
+                            with open(content, 'rb') as src:
+                                shutil.copyfileobj(src, f)
+                    os.replace(tmp_path, path)
+                stored[name] = (sha, size)
+            now = time.time()
+            self._index[key] = {'files': stored, 'version': version, 'stored_at': now, 'last_access': now}
+            self._evict(keep=key)
+            self._save_index()
+            logger.info(f"Cached {key} ({sum(size for _, size in stored.values())} bytes)")
+
+    def _drop(self, key):
+        """Remove an entry and delete objects no other entry references"""
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return
+        referenced = {sha for other in self._index.values() for sha, _ in other['files'].values()}
+        for sha, _ in entry['files'].values():
+            if sha not in referenced:
+                self._object_path(sha).unlink(missing_ok=True)
+        self._save_index()
+
+    def _evict(self, keep=None):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        by_last_access = sorted(self._index, key=lambda k: self._index[k]['last_access'])
+        for key in by_last_access:
+            if self.size() <= self.max_bytes:
+                break
+            if key != keep:
+                logger.info(f"Evicting {key} from cache")
+                self._drop(key)
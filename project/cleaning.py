@@ -0,0 +1,61 @@
+import logging
+
+import pandas as pd
+
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+def row_hashes(df):
+    """Hash every row, treating int and float columns alike so hashes match across chunks"""
+    numeric_cols = df.select_dtypes('number').columns
+    normalized = df.astype({col: 'float64' for col in numeric_cols}, copy=False)
+    return pd.util.hash_pandas_object(normalized, index=False)
+
+def drop_duplicate_rows(df, hashes=None):
+    """Drop rows whose hash was seen on an earlier row; returns the frame and the number dropped"""
+    if hashes is None:
+        hashes = row_hashes(df)
+    duplicated = hashes.duplicated().values
+    duplicates = int(duplicated.sum())
+    return (df[~duplicated] if duplicates else df), duplicates
+
+def fill_missing(df):
+    """
+    Forward then back fill only the columns that have missing values.
+
+    Returns the frame and {column: missing values before filling} for those columns.
+    The input frame is left unchanged.
+    """
+    missing = {col: int(count) for col, count in df.isna().sum().items() if count}
+    if not missing:
+        return df, missing
+    df = df.copy(deep=False)
+    for col in missing:
+        df[col] = df[col].ffill().bfill()
+    return df, missing
+
+def clean_frame(df, name):
+    """
+    Deduplicate a frame by row hash and fill its missing values in one pass per step.
+
+    Rows are hashed once with vectorized hashing, duplicates are dropped with a
+    single mask, and only columns with missing values are filled, forward then
+    backward. Returns the cleaned frame and its statistics, which are also added
+    to the current run's metrics.
+    """
+    with stage(f'clean {name}', rows_in=len(df)) as record:
+        df, duplicates = drop_duplicate_rows(df)
+        if duplicates:
+            logger.info(f"Removed {duplicates} duplicates in {name} data, {len(df)} rows left")
+        df, missing = fill_missing(df)
+        if missing:
+            logger.info(f"Filled missing values in {len(missing)} columns of {name} data: {missing}")
+        stats = {
+            'rows_in': record['rows_in'],
+            'duplicates': duplicates,
+            'rows_out': len(df),
+            'missing_filled': missing,
+        }
+        record.update(rows_out=len(df), duplicates=duplicates, missing_filled=missing)
+    return df, stats
@@ -0,0 +1,90 @@
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+logger = logging.getLogger(__name__)
+
+def _write_atomically(path, write):
+    """Call write() with a temporary file next to path and move it into place once it is complete"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.arrow')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+def write_columnar(df, path):
+    """Write a DataFrame as an uncompressed Arrow IPC file, so it can be memory-mapped"""
+    _write_atomically(path, lambda tmp_path: feather.write_feather(df, tmp_path, compression='uncompressed'))
+
+def write_columnar_batches(batches, schema, path):
+    """Write Arrow record batches one at a time as an uncompressed Arrow IPC file"""
+    def write(tmp_path):
+        with pa.ipc.new_file(tmp_path, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+    _write_atomically(path, write)
+
+def read_columnar(path, columns=None):
+    """Memory-map an Arrow IPC file and return the requested columns as a DataFrame"""
+    return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+class ColumnarStore:
+    """
+    Typed columnar copies of the raw sources and processed tables.
+
+    Raw sources are parsed once per version (a content hash) and later runs read
+    the Arrow file instead of re-parsing CSV or Excel. Processed tables are exported
+    under their table name for analysis code to read selected columns from.
+    """
+
+    def __init__(self, root='data/columnar'):
+        self.root = Path(root)
+
+    @staticmethod
+    def _safe_name(name):
+        return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_')
+
+    def path(self, name, version=None):
+        """Location of the Arrow file of a source version or a table"""
+        safe_name = self._safe_name(name)
+        return self.root / (f"{safe_name}-{version[:16]}.arrow" if version else f"{safe_name}.arrow")
+
+    def load(self, source, version, parse, columns=None):
+        """Return the parsed source version, calling parse() only if it is not stored yet"""
+        path = self.path(source, version)
+        if path.exists():
+            logger.info(f"Reading {source} from columnar store {path}")
+            return read_columnar(path, columns)
+
+        df = parse()
+        try:
+            write_columnar(df, path)
+            logger.info(f"Stored {source} in columnar store {path}")
+            # Older versions of the same source are no longer needed
+            old_version = re.compile(re.escape(self._safe_name(source)) + r'-[0-9a-f]{16}\.arrow')
+            for old_path in path.parent.glob('*.arrow'):
+                if old_path != path and old_version.fullmatch(old_path.name):
+                    old_path.unlink()
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            logger.warning(f"Could not store {source} in columnar format: {str(e)}")
+        return df if columns is None else df[columns]
+
+    def export(self, table, df):
+        """Write a processed table for analysis code to read"""
+        write_columnar(df, self.path(table))
+        logger.info(f"Exported {table} to {self.path(table)}")
+
+    def export_batches(self, table, batches, schema):
+        """Write a processed table from Arrow record batches, for tables too large to hold as a DataFrame"""
+        write_columnar_batches(batches, schema, self.path(table))
+        logger.info(f"Exported {table} to {self.path(table)}")
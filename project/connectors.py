@@ -0,0 +1,287 @@
+"""
+Connectors for the raw sources of the pipeline.
+
+A connector knows where one raw file comes from, how to parse it and which table
+it is loaded into. Sources are declared as configuration and built into
+connectors by type:
+
+    SOURCES = {
+        'emissions': {'type': 'http', 'url': 'https://.../state_tier1.xlsx', 'filename': 'workbook.xlsx',
+                      'parser': 'excel', 'sheet_name': 'State_Trends', 'skiprows': 1},
+    }
+    connectors = build_connectors(SOURCES)
+
+HTTP downloads share one pooled requests.Session, so files from the same host
+reuse their keep-alive connections, and are streamed to disk with interrupted
+downloads resumed by range requests.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from metrics import instrument
+
+logger = logging.getLogger(__name__)
+
+# Connections kept open per host by the shared session
+POOL_SIZE = 16
+
+# Parser name -> function reading a raw file; extra source options are passed to it
+PARSERS = {
+    'csv': pd.read_csv,
+    'excel': pd.read_excel,
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+def http_session():
+    """The process-wide requests.Session whose pooled keep-alive connections every HTTP download reuses"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+def kaggle_api():
+    """The default Kaggle API client, authenticated from the credentials when kaggle is first imported"""
+    import kaggle
+    return kaggle.api
+
+@instrument('download_dataset {dataset_name}')
+def download_dataset(dataset_name, path, api=None, cache=None, version=None):
+    """
+    Download dataset from Kaggle, using the given API client or the default one;
+    a cached copy is only used if it was downloaded at the given remote version
+    """
+    if cache is not None and cache.restore(dataset_name, path, version=version):
+        return
+    logger.info(f"Downloading dataset {dataset_name} to {path}")
+    if cache is None:
+        (api or kaggle_api()).dataset_download_files(dataset_name, path=path, unzip=True)
+    else:
+        # Download into a staging directory so we know which files belong to the dataset
+        Path(path).mkdir(parents=True, exist_ok=True)
+        staging_dir = Path(tempfile.mkdtemp(dir=path))
+        try:
+            (api or kaggle_api()).dataset_download_files(dataset_name, path=staging_dir, unzip=True)
+            files = {file.name: file for file in staging_dir.iterdir() if file.is_file()}
+            cache.store(dataset_name, files, version=version)
+            for name, file in files.items():
+                os.replace(file, Path(path) / name)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    logger.info(f"Successfully downloaded and unzipped {dataset_name}")
+
+def kaggle_dataset_fingerprint(dataset_name, api=None):
+    """Fingerprint a Kaggle dataset from its file listing without downloading it"""
+    try:
+        files = (api or kaggle_api()).dataset_list_files(dataset_name).files
+    except Exception as e:
+        logger.warning(f"Could not fetch file listing for {dataset_name}: {str(e)}")
+        return None
+    return ';'.join(sorted(
+        f"{f.ref}:{getattr(f, 'totalBytes', '')}:{getattr(f, 'creationDate', '')}" for f in files
+    ))
+
+def http_fingerprint(url, session=None):
+    """Fingerprint a remote file from its ETag or Last-Modified header"""
+    import requests
+
+    try:
+        response = (session or http_session()).head(url, allow_redirects=True, timeout=30)
+    except requests.RequestException as e:
+        logger.warning(f"Could not fetch headers for {url}: {str(e)}")
+        return None
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if response.status_code != 200 or not (etag or last_modified):
+        return None
+    return f"{etag or ''}|{last_modified or ''}"
+
+def download_file(url, target, timeout=120, block_size=1 << 20, session=None):
+    """
+    Stream url to target block by block over the shared session.
+
+    The body goes to target.part, which is renamed once complete. A .part file left
+    by an interrupted attempt is resumed with a range request, guarded by If-Range so
+    a changed remote file is downloaded again from the start. Returns False on an
+    HTTP error.
+    """
+    target = Path(target)
+    partial_path = target.with_name(target.name + '.part')
+    validator_path = target.with_name(target.name + '.validator')
+    headers = {}
+    if partial_path.exists() and validator_path.exists():
+        headers = {'Range': f'bytes={partial_path.stat().st_size}-', 'If-Range': validator_path.read_text()}
+
+    with (session or http_session()).get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code not in (200, 206):
+            logger.error(f"Failed to download {url}. Status code: {response.status_code}")
+            if response.status_code == 416:
+                # The partial file does not match the remote one, start over on the next attempt
+                partial_path.unlink(missing_ok=True)
+                validator_path.unlink(missing_ok=True)
+            return False
+        resumed = response.status_code == 206
+        if resumed:
+            logger.info(f"Resuming download of {url} at byte {partial_path.stat().st_size}")
+        else:
+            etag = response.headers.get('ETag')
+            validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+            if validator:
+                validator_path.write_text(validator)
+            else:
+                validator_path.unlink(missing_ok=True)
+        with open(partial_path, 'ab' if resumed else 'wb') as f:
+            for block in response.iter_content(block_size):
+                f.write(block)
+    partial_path.replace(target)
+    validator_path.unlink(missing_ok=True)
+    return True
+
+@instrument('fetch_http_file {url}')
+def fetch_http_file(url, path, filename, cache=None, timeout=120, block_size=1 << 20, session=None, version=None):
+    """
+    Download url to path/filename through the raw cache, where a copy is only used if
+    it was downloaded at the given remote version; returns the file path, or None on
+    an HTTP error
+    """
+    target = Path(path) / filename
+    if cache is not None and cache.restore(url, path, version=version):
+        return target
+
+    logger.info(f"Streaming {url} to {target}")
+    Path(path).mkdir(parents=True, exist_ok=True)
+    if not download_file(url, target, timeout=timeout, block_size=block_size, session=session):
+        return None
+    logger.info(f"Successfully downloaded {url} ({target.stat().st_size} bytes)")
+    if cache is not None:
+        cache.store(url, {filename: target}, version=version)
+    return target
+
+class Connector:
+    """
+    A raw source file: where it comes from, how it is parsed and the table it is loaded into.
+
+    Subclasses implement fetch(), which places the file in a directory and returns
+    its path, and may implement fingerprint(), a cheap remote version used to skip
+    unchanged sources and passed back to fetch() so a cached copy of another
+    version is not used. parser is a name in PARSERS or a function, called with the
+    file path and the remaining options.
+    """
+    kind = None
+
+    def __init__(self, name, table, filename, parser='csv', **parser_options):
+        self.name = name
+        self.table = table
+        self.filename = filename
+        self.parser = parser
+        self.parser_options = parser_options
+
+    def parse(self, path):
+        """Read a fetched file into a DataFrame"""
+        parse = PARSERS[self.parser] if isinstance(self.parser, str) else self.parser
+        return parse(path, **self.parser_options)
+
+    def fetch(self, path, cache=None, version=None):
+        """
+        Place the raw file in path and return its path, raising if it cannot be fetched.
+        With a version (a fingerprint()), cached copies of other versions are not used.
+        """
+        raise NotImplementedError
+
+    def fingerprint(self):
+        """Remote version of the file, or None if it cannot be determined without fetching it"""
+        return None
+
+    def describe(self):
+        """The connector's configuration, part of its download step's checkpoint key"""
+        parser = self.parser if isinstance(self.parser, str) else getattr(self.parser, '__qualname__', repr(self.parser))
+        return {'type': self.kind, 'name': self.name, 'table': self.table, 'filename': self.filename,
+                'parser': parser, **self.parser_options}
+
+class KaggleConnector(Connector):
+    """A file of a Kaggle dataset"""
+    kind = 'kaggle'
+
+    def __init__(self, dataset, filename, table, parser='csv', api=None, **parser_options):
+        super().__init__(dataset, table, filename, parser, **parser_options)
+        self.api = api
+
+    def fetch(self, path, cache=None, version=None):
+        download_dataset(self.name, path, api=self.api, cache=cache, version=version)
+        return Path(path) / self.filename
+
+    def fingerprint(self):
+        return kaggle_dataset_fingerprint(self.name, api=self.api)
+
+class HttpFileConnector(Connector):
+    """A file served over HTTP(S), downloaded over the shared session"""
+    kind = 'http'
+
+    def __init__(self, url, filename, table, parser='csv', timeout=120, session=None, **parser_options):
+        super().__init__(url, table, filename, parser, **parser_options)
+        self.timeout = timeout
+        self.session = session
+
+    def fetch(self, path, cache=None, version=None):
+        target = fetch_http_file(self.name, path, self.filename, cache=cache, timeout=self.timeout,
+                                 session=self.session, version=version)
+        if target is None:
+            raise RuntimeError(f"Failed to download {self.name}")
+        return target
+
+    def fingerprint(self):
+        return http_fingerprint(self.name, session=self.session)
+
+class LocalFileConnector(Connector):
+    """A file already on disk, e.g. a fixture in tests or a manually downloaded extract"""
+    kind = 'local'
+
+    def __init__(self, path, table, parser='csv', **parser_options):
+        super().__init__(str(path), table, Path(path).name, parser, **parser_options)
+
+    def fetch(self, path, cache=None, version=None):
+        source = Path(self.name)
+        if not source.exists():
+            raise FileNotFoundError(f"Source file {source} does not exist")
+        return source
+
+    def fingerprint(self):
+        stat = os.stat(self.name)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+# Connector type in a source configuration -> connector class
+CONNECTORS = {cls.kind: cls for cls in (KaggleConnector, HttpFileConnector, LocalFileConnector)}
+
+def register_connector(cls):
+    """Make a Connector subclass available to source configurations under its kind"""
+    CONNECTORS[cls.kind] = cls
+    return cls
+
+def build_connectors(sources):
+    """Build {table: connector} from {table: configuration}, whose 'type' selects the connector class"""
+    connectors = {}
+    for table, config in sources.items():
+        if isinstance(config, Connector):
+            connectors[table] = config
+            continue
+        config = dict(config)
+        kind = config.pop('type')
+        if kind not in CONNECTORS:
+            raise ValueError(f"Unknown connector type {kind} for {table}, expected one of {sorted(CONNECTORS)}")
+        connectors[table] = CONNECTORS[kind](table=table, **config)
+    return connectors
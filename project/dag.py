@@ -0,0 +1,279 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from pathlib import Path
+
+import pandas as pd
+
+from metrics import add_stages, call_recording_stages
+
+logger = logging.getLogger(__name__)
+
+def _file_hash(path, block_size=1 << 20):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def content_hash(value):
+    """Hash of a source node's output: file contents for paths, row hashes for DataFrames"""
+    if isinstance(value, Path):
+        return _file_hash(value)
+    if isinstance(value, pd.DataFrame):
+        digest = hashlib.sha256(json.dumps([str(col) for col in value.columns]).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=False).values.tobytes())
+        return digest.hexdigest()
+    return hashlib.sha256(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+def _func_name(func):
+    """Qualified name of a node function; arguments bound with partial are not part of it"""
+    while isinstance(func, partial):
+        func = func.func
+    return f"{getattr(func, '__module__', '')}.{getattr(func, '__qualname__', repr(func))}"
+
+class Node:
+    """A pipeline step: func is called with the outputs of its input nodes, in order, and params"""
+
+    def __init__(self, name, func, inputs=(), params=None, version=None, checkpoint=True, processes=False):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.params = params or {}
+        self.version = version
+        self.checkpoint = checkpoint
+        self.processes = processes
+
+    def key(self, input_hashes):
+        """Checkpoint key: the node, its function, params, version and the hashes of its inputs"""
+        payload = json.dumps([self.name, _func_name(self.func), self.params, self.version, input_hashes],
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+class DAG:
+    """
+    Run pipeline steps as a dependency graph with checkpointing and resume.
+
+    Every checkpointed node stores its output in checkpoint_dir under a key built
+    from its params and the output hashes of its inputs. On a later run a node whose
+    key matches its checkpoint is not executed, and its output is only loaded when a
+    node that does run needs it. The output hash of a node without inputs is the hash
+    of its content (a downloaded file, a frame); for every other node it is its key,
+    so unchanged inputs propagate without hashing large intermediate frames.
+
+    Nodes whose inputs are resolved run concurrently in a thread pool. Nodes with
+    processes=True are handed to the given process pool executor instead, and the
+    stages they record there are added to the active run (see metrics.py). Nodes with
+    checkpoint=False are computed on demand by the nodes that need them.
+    """
+
+    def __init__(self, checkpoint_dir='data/checkpoints', max_workers=None, executor=None):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.max_workers = max_workers
+        self.executor = executor
+        self.nodes = {}
+        self._manifest_path = self.checkpoint_dir / 'manifest.json'
+        self._manifest = json.loads(self._manifest_path.read_text()) if self._manifest_path.exists() else {}
+        self._lock = threading.RLock()
+        self._node_locks = {}
+        self._keys = {}
+        self._hashes = {}
+        self._values = {}
+        self._pending = set()
+        self.status = {}
+
+    def add(self, name, func, inputs=(), params=None, version=None, checkpoint=True, processes=False):
+        """
+        Add a node. params are passed to func and are part of its checkpoint key, as is
+        version (e.g. a source's remote fingerprint); arguments bound with partial are not.
+        """
+        if name in self.nodes:
+            raise ValueError(f"Node {name} is already defined")
+        self.nodes[name] = Node(name, func, inputs, params, version, checkpoint, processes)
+        return name
+
+    def clear(self):
+        """Drop every checkpoint so the next run executes all nodes"""
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+        with self._lock:
+            self._manifest = {}
+        logger.info(f"Cleared checkpoints in {self.checkpoint_dir}")
+
+    def _order(self):
+        """Nodes in topological order, rejecting unknown inputs and cycles"""
+        order, state = [], {}
+
+        def visit(name, path):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError(f"Cycle in pipeline graph: {' -> '.join(path + [name])}")
+            if name not in self.nodes:
+                raise ValueError(f"Unknown input {name} of node {path[-1]}")
+            state[name] = 'visiting'
+            for input_name in self.nodes[name].inputs:
+                visit(input_name, path + [name])
+            state[name] = 'done'
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name, [])
+        return order
+
+    def _checkpoint_path(self, name):
+        return self.checkpoint_dir / (re.sub(r'[^A-Za-z0-9_.-]+', '_', name) + '.pkl')
+
+    def _save_manifest(self):
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.checkpoint_dir, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._manifest, f, indent=1)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _cached_hash(self, node, key):
+        """Output hash of a usable checkpoint of node for key, or None"""
+        with self._lock:
+            entry = self._manifest.get(node.name)
+        if not node.checkpoint or entry is None or entry['key'] != key:
+            return None
+        path = self._checkpoint_path(node.name)
+        if not path.exists():
+            return None
+        if entry.get('file'):
+            # The output is a file: it must still be there with the same contents
+            file = Path(entry['file'])
+            if not file.exists() or _file_hash(file) != entry['file_hash']:
+                return None
+        return entry['output_hash']
+
+    def _store(self, node, key, value):
+        """Checkpoint the output of a node and return its output hash"""
+        file_hash = _file_hash(value) if isinstance(value, Path) else None
+        output_hash = (file_hash or content_hash(value)) if not node.inputs else key
+        if node.checkpoint:
+            path = self._checkpoint_path(node.name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.pkl')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._manifest[node.name] = {
+                    'key': key, 'output_hash': output_hash,
+                    'file': str(value) if file_hash else None, 'file_hash': file_hash,
+                }
+                self._save_manifest()
+        return output_hash
+
+    def value(self, name):
+        """Output of a node, loading its checkpoint or computing it when needed"""
+        with self._lock:
+            node_lock = self._node_locks.setdefault(name, threading.Lock())
+        with node_lock:
+            if name not in self._values:
+                node = self.nodes[name]
+                if node.checkpoint and name not in self._pending:
+                    with open(self._checkpoint_path(name), 'rb') as f:
+                        self._values[name] = pickle.load(f)
+                else:
+                    self._values[name] = self._execute(node)
+            return self._values[name]
+
+    def _execute(self, node):
+        """Run a node's function on its input values and checkpoint the result"""
+        logger.info(f"Running node {node.name}")
+        args = [self.value(input_name) for input_name in node.inputs]
+        if node.processes and self.executor is not None:
+            # The stages recorded in the worker process are added to this process's run
+            future = self.executor.submit(call_recording_stages, node.func, *args, **node.params)
+            try:
+                result, stages = future.result()
+            except Exception as e:
+                add_stages(getattr(e, 'stages', []))
+                raise
+            add_stages(stages)
+        else:
+            result = node.func(*args, **node.params)
+        output_hash = self._store(node, self._keys[node.name], result)
+        with self._lock:
+            self._hashes[node.name] = output_hash
+            self._pending.discard(node.name)
+        return result
+
+    def _resolve(self, name):
+        """Work out the key of a node; returns True when it has to be executed now"""
+        node = self.nodes[name]
+        key = node.key([self._hashes[input_name] for input_name in node.inputs])
+        self._keys[name] = key
+        cached = self._cached_hash(node, key)
+        if cached is not None:
+            logger.info(f"Node {name} is up to date, using its checkpoint")
+            self._hashes[name] = cached
+            self.status[name] = 'cached'
+            return False
+        if not node.checkpoint and node.inputs:
+            # Computed on demand by the nodes that need it
+            self._hashes[name] = key
+            self.status[name] = 'deferred'
+            return False
+        return True
+
+    def run(self):
+        """
+        Execute every node that has no usable checkpoint, independent nodes concurrently.
+
+        Returns {node name: 'ran' | 'cached' | 'deferred'}. When a node fails, the running
+        nodes are finished, no new ones are started, and a RuntimeError naming the node
+        is raised; the checkpoints written so far let the next run resume.
+        """
+        order = self._order()
+        self.status = {}
+        self._values = {}
+        self._hashes = {}
+        self._keys = {}
+        self._pending = set()
+        waiting = list(order)
+        running = {}
+        failure = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='dag') as pool:
+            while waiting or running:
+                if failure is None:
+                    for name in list(waiting):
+                        if all(input_name in self._hashes for input_name in self.nodes[name].inputs):
+                            waiting.remove(name)
+                            if self._resolve(name):
+                                self._pending.add(name)
+                                running[pool.submit(self.value, name)] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                        self.status[name] = 'ran'
+                    except Exception as e:
+                        logger.error(f"Node {name} failed: {str(e)}")
+                        if failure is None:
+                            failure = (name, e)
+
+        if failure is not None:
+            name, error = failure
+            raise RuntimeError(f"Pipeline node {name} failed: {str(error)}") from error
+        # Deferred nodes that some running node needed were computed along the way
+        for name in order:
+            if self.status.get(name) == 'deferred' and name in self._values:
+                self.status[name] = 'ran'
+        logger.info(f"Pipeline graph finished: {sum(s == 'ran' for s in self.status.values())} nodes ran, "
+                    f"{sum(s == 'cached' for s in self.status.values())} from checkpoints")
+        return self.status
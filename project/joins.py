@@ -0,0 +1,110 @@
+import logging
+
+from storage import TABLE_SCHEMAS, index_name, load_pragmas, quote
+
+logger = logging.getLogger(__name__)
+
+FACT_TABLE = 'pollution_energy_emissions'
+
+# Columns carried over from every daily site reading
+POLLUTION_FACT_COLUMNS = ['Date', 'State', 'County', 'City', 'Year', 'Month', 'Day'] + [
+    f'{pollutant} {measure}' for pollutant in ['O3', 'CO', 'SO2', 'NO2'] for measure in ['Mean', 'AQI']
+]
+# National monthly renewable consumption, summed over sectors
+RENEWABLE_FACT_COLUMNS = ['Total Renewable Energy', 'Solar Energy', 'Wind Energy',
+                          'Hydroelectric Power', 'Biomass Energy']
+FACT_INDEXES = [('State', 'Year', 'Month'), ('Year', 'Month')]
+
+def _create_dimensions(conn):
+    """
+    Pre-aggregate the two small sides of the join into temporary tables keyed like
+    the join: renewables by (Year, Month) and emissions by (State, Year), one column
+    per pollutant. Returns the emissions column names.
+    """
+    pollutants = [row[0] for row in conn.execute(
+        'SELECT DISTINCT "Pollutant" FROM emissions WHERE "Pollutant" IS NOT NULL ORDER BY "Pollutant"')]
+
+    conn.execute("DROP TABLE IF EXISTS temp.renewable_monthly")
+    conn.execute(
+        f"CREATE TEMP TABLE renewable_monthly (\"Year\" INTEGER, \"Month\" INTEGER, "
+        f"{', '.join(f'{quote(col)} REAL' for col in RENEWABLE_FACT_COLUMNS)}, PRIMARY KEY (\"Year\", \"Month\"))"
+    )
+    conn.execute(
+        f"INSERT INTO temp.renewable_monthly SELECT \"Year\", \"Month\", "
+        f"{', '.join(f'SUM({quote(col)})' for col in RENEWABLE_FACT_COLUMNS)} "
+        f"FROM renewable_energy GROUP BY \"Year\", \"Month\""
+    )
+
+    emissions_columns = [f'{pollutant} Emissions' for pollutant in pollutants]
+    conn.execute("DROP TABLE IF EXISTS temp.emissions_state_year")
+    conn.execute(
+        f"CREATE TEMP TABLE emissions_state_year (\"State\" TEXT, \"Year\" INTEGER"
+        f"{''.join(f', {quote(col)} REAL' for col in emissions_columns)}, PRIMARY KEY (\"State\", \"Year\"))"
+    )
+    pivot = ''.join(', SUM(CASE WHEN "Pollutant" = ? THEN "Emissions" END)' for _ in pollutants)
+    conn.execute(
+        f"INSERT INTO temp.emissions_state_year SELECT \"State\", \"Year\"{pivot} "
+        f"FROM emissions WHERE \"State\" IS NOT NULL GROUP BY \"State\", \"Year\"",
+        pollutants
+    )
+    return emissions_columns
+
+def fact_columns(emissions_columns):
+    """(column, type) pairs of the fact table"""
+    pollution_types = dict(TABLE_SCHEMAS['pollution'])
+    return ([(col, pollution_types[col]) for col in POLLUTION_FACT_COLUMNS]
+            + [(f'National {col}', 'REAL') for col in RENEWABLE_FACT_COLUMNS]
+            + [(col, 'REAL') for col in emissions_columns])
+
+def build_fact_table(conn, table=FACT_TABLE, partition_by=('Year',)):
+    """
+    Join daily pollution readings with national monthly renewables and yearly state
+    emissions on Year, Month and State into an analysis-ready fact table.
+
+    The renewable and emissions sides are first aggregated into small temporary
+    tables whose primary keys are the join keys. Pollution is then joined one
+    partition (by default one Year) at a time, read through its (Year, Month)
+    index, so memory stays bounded by SQLite's page cache however many years,
+    states or countries the tables hold. Returns the number of fact rows.
+    """
+    logger.info(f"Building fact table {table}")
+    select = [f'p.{quote(col)}' for col in POLLUTION_FACT_COLUMNS]
+    select += [f'r.{quote(col)}' for col in RENEWABLE_FACT_COLUMNS]
+    partition_filter = ' AND '.join(f'p.{quote(col)} = ?' for col in partition_by)
+    partitions = conn.execute(
+        f"SELECT DISTINCT {', '.join(quote(col) for col in partition_by)} FROM pollution "
+        f"ORDER BY {', '.join(quote(col) for col in partition_by)}"
+    ).fetchall()
+
+    conn.commit()
+    rows = 0
+    # Changing temp_store drops temporary tables, so the dimensions are built under the load pragmas
+    with load_pragmas(conn):
+        try:
+            emissions_columns = _create_dimensions(conn)
+            select += [f'e.{quote(col)}' for col in emissions_columns]
+            insert_sql = (
+                f"INSERT INTO {quote(table)} SELECT {', '.join(select)} FROM pollution p "
+                f"LEFT JOIN temp.renewable_monthly r ON r.\"Year\" = p.\"Year\" AND r.\"Month\" = p.\"Month\" "
+                f"LEFT JOIN temp.emissions_state_year e ON e.\"State\" = p.\"State\" AND e.\"Year\" = p.\"Year\" "
+                f"WHERE {partition_filter}"
+            )
+            conn.commit()
+            conn.execute("BEGIN")
+            conn.execute(f"DROP TABLE IF EXISTS {quote(table)}")
+            columns = ', '.join(f'{quote(col)} {col_type}' for col, col_type in fact_columns(emissions_columns))
+            conn.execute(f"CREATE TABLE {quote(table)} ({columns})")
+            for partition in partitions:
+                rows += conn.execute(insert_sql, partition).rowcount
+            for keys in FACT_INDEXES:
+                conn.execute(f"CREATE INDEX {quote(index_name(table, keys))} "
+                             f"ON {quote(table)} ({', '.join(quote(col) for col in keys)})")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("DROP TABLE IF EXISTS temp.renewable_monthly")
+            conn.execute("DROP TABLE IF EXISTS temp.emissions_state_year")
+    logger.info(f"Built {table} with {rows} rows in {len(partitions)} partitions")
+    return rows
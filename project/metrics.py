@@ -0,0 +1,213 @@
+import functools
+import inspect
+import json
+import logging
+import os
+import resource
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# The run that stages are currently recorded into, if any
+_active_run = None
+
+def _rss_bytes():
+    """Current resident set size, falling back to the peak where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak * 1024 if os.uname().sysname == 'Linux' else peak
+
+def _io_bytes():
+    """Bytes read and written by the process so far (Linux only), including sockets"""
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def _row_count(value):
+    """Rows of a DataFrame result, or the value itself for loaders that return a count"""
+    if hasattr(value, 'shape') and hasattr(value, 'columns'):
+        return len(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return None
+
+class RunMetrics:
+    """Stage records of one pipeline run"""
+
+    def __init__(self, **details):
+        self.run_id = uuid.uuid4().hex
+        self.details = details
+        self.started_at = time.time()
+        self.finished_at = None
+        self.status = 'running'
+        self.error = None
+        self.stages = []
+        self._lock = threading.Lock()
+
+    def add_stage(self, record):
+        with self._lock:
+            self.stages.append(record)
+
+    def to_dict(self):
+        return {
+            'run_id': self.run_id,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'status': self.status,
+            'error': self.error,
+            'wall_seconds': None if self.finished_at is None else round(self.finished_at - self.started_at, 6),
+            'details': self.details,
+            'stages': self.stages,
+        }
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Record wall time, CPU time, RSS delta and I/O bytes of a block into the active run.
+
+    Yields a dict the block can add rows_out (or other fields) to. CPU time and I/O
+    are process-wide, so stages running concurrently in threads overlap. Does nothing
+    but yield when no run is active.
+    """
+    record = {'stage': name, 'rows_in': rows_in, 'rows_out': None}
+    run = _active_run
+    if run is None:
+        yield record
+        return
+
+    rss_before = _rss_bytes()
+    read_before, written_before = _io_bytes()
+    started, cpu_started = time.perf_counter(), time.process_time()
+    record['status'] = 'succeeded'
+    try:
+        yield record
+    except BaseException:
+        record['status'] = 'failed'
+        raise
+    finally:
+        read_after, written_after = _io_bytes()
+        record.update({
+            'wall_seconds': round(time.perf_counter() - started, 6),
+            'cpu_seconds': round(time.process_time() - cpu_started, 6),
+            'rss_delta_bytes': _rss_bytes() - rss_before,
+            'bytes_read': None if read_before is None else read_after - read_before,
+            'bytes_written': None if written_before is None else written_after - written_before,
+        })
+        run.add_stage(record)
+        logger.info(f"Stage {name} took {record['wall_seconds']:.2f}s "
+                    f"(rows in: {record['rows_in']}, rows out: {record['rows_out']})")
+
+def instrument(name=None):
+    """
+    Decorator that records every call of a pipeline function as a stage. The stage
+    is named after the function, or name, which can refer to the arguments of the
+    call, e.g. 'read_source {connector.table}'.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active_run is None:
+                return func(*args, **kwargs)
+            stage_name = name or func.__name__
+            if '{' in stage_name:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                stage_name = stage_name.format(**bound.arguments)
+            rows_in = _row_count(args[0]) if args else None
+            with stage(stage_name, rows_in=rows_in) as record:
+                result = func(*args, **kwargs)
+                record['rows_out'] = _row_count(result)
+                return result
+        return wrapper
+    return decorator
+
+def call_recording_stages(func, *args, **kwargs):
+    """
+    Call func with a run of its own active and return its result together with the
+    stage records, for calls in worker processes, where the parent's run is not
+    active. When func raises, the records are attached to the exception as stages.
+    """
+    global _active_run
+    run = RunMetrics()
+    _active_run = run
+    try:
+        return func(*args, **kwargs), run.stages
+    except Exception as e:
+        e.stages = run.stages
+        raise
+    finally:
+        _active_run = None
+
+def add_stages(records):
+    """Add stage records collected elsewhere, e.g. by call_recording_stages in a worker, to the active run"""
+    run = _active_run
+    if run is not None:
+        for record in records:
+            run.add_stage(record)
+
+def save_run(run, db_path='data/data.db', jsonl_path='data/pipeline_runs.jsonl'):
+    """Append the run record to the JSON lines file and the pipeline_runs table"""
+    record = run.to_dict()
+    if jsonl_path is not None:
+        Path(jsonl_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(jsonl_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    if db_path is not None:
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(db_path)
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pipeline_runs (
+                    run_id TEXT PRIMARY KEY,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP,
+                    status TEXT,
+                    error TEXT,
+                    wall_seconds REAL,
+                    details TEXT,
+                    stages TEXT
+                )
+            """)
+            conn.execute(
+                "INSERT INTO pipeline_runs VALUES (?, datetime(?, 'unixepoch'), datetime(?, 'unixepoch'), ?, ?, ?, ?, ?)",
+                (record['run_id'], record['started_at'], record['finished_at'], record['status'], record['error'],
+                 record['wall_seconds'], json.dumps(record['details']), json.dumps(record['stages']))
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+@contextmanager
+def track_run(db_path='data/data.db', jsonl_path='data/pipeline_runs.jsonl', **details):
+    """Collect the stages of a run and save the run record when it ends, even on failure"""
+    global _active_run
+    run = RunMetrics(**details)
+    _active_run = run
+    try:
+        yield run
+        run.status = 'succeeded'
+    except BaseException as e:
+        run.status = 'failed'
+        run.error = str(e)
+        raise
+    finally:
+        _active_run = None
+        run.finished_at = time.time()
+        try:
+            save_run(run, db_path, jsonl_path)
+            logger.info(f"Run {run.run_id} {run.status} in {run.to_dict()['wall_seconds']:.2f}s, metrics saved")
+        except Exception as e:
+            logger.error(f"Could not save run metrics: {str(e)}")
@@ -0,0 +1,278 @@
+"""
+Partitioned storage of large tables.
+
+A partitioned table is split by its partition keys into one SQLite table per
+partition, named <table>__<key values> (pollution__2020 or pollution__2020__ohio),
+with the schema and indexes of the table. A view named like the table unions
+all partitions, so rollups, joins and ad hoc SQL read it unchanged:
+
+    write_partitions(conn, 'pollution', df, keys=['Year'])
+
+The partitions catalog keeps the key values, row count, content hash and
+the min/max of the stat columns of every partition. A reload rewrites only the
+partitions whose rows changed. Queries with filters on the stat columns read only
+the partitions whose ranges can match (see prune_partitions and query.py).
+"""
+import hashlib
+import json
+import logging
+import re
+import time
+
+from cleaning import row_hashes
+from metrics import stage
+from storage import TABLE_SCHEMAS, bulk_load, create_indexes, create_table_sql, load_pragmas, quote
+
+logger = logging.getLogger(__name__)
+
+CATALOG_TABLE = 'partitions'
+
+# Tables that can be partitioned: the columns they can be partitioned by, in key
+# order, and the columns whose min/max is kept per partition for pruning
+PARTITIONED_TABLES = {
+    'pollution': {'keys': ['Year', 'State'], 'stats': ['Date', 'Year', 'State']},
+}
+
+# SQLite's limit on the SELECTs in one compound statement; views over more
+# partitions than this union views of at most this many partitions
+MAX_COMPOUND_SELECT = 500
+
+def staging_table(table):
+    """Table a partitioned table is streamed into before it is split into partitions"""
+    return f'{table}__staging'
+
+def partition_name(table, values):
+    """Table name of the partition with these key values"""
+    parts = [re.sub(r'[^0-9a-z]+', '_', str(_python_value(value)).lower()).strip('_') for value in values]
+    return '__'.join([table] + parts)
+
+def _python_value(value):
+    """A key value as a JSON-serializable scalar, with NaN as None"""
+    if hasattr(value, 'item'):
+        value = value.item()
+    return None if value is None or value != value else value
+
+def ensure_catalog(conn):
+    """Create the partitions catalog if it does not exist"""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} (
+            table_name TEXT,
+            partition_table TEXT,
+            key_values TEXT,
+            row_count INTEGER,
+            stats TEXT,
+            content_hash TEXT,
+            updated_at REAL,
+            PRIMARY KEY (table_name, partition_table)
+        )
+    """)
+    conn.commit()
+
+def partition_catalog(conn, table):
+    """Catalog entries of the partitions of table, in partition order; empty if it is not partitioned"""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (CATALOG_TABLE,)).fetchone()
+    if not exists:
+        return []
+    rows = conn.execute(
+        f"SELECT partition_table, key_values, row_count, stats, content_hash FROM {CATALOG_TABLE} "
+        f"WHERE table_name = ? ORDER BY partition_table", (table,)
+    ).fetchall()
+    return [{'partition_table': name, 'keys': json.loads(keys), 'row_count': row_count,
+             'stats': json.loads(stats), 'content_hash': content_hash}
+            for name, keys, row_count, stats, content_hash in rows]
+
+def _save_entry(conn, table, name, keys, content_hash):
+    """Record a written partition in the catalog, with its row count and the min/max of the stat columns"""
+    stat_columns = PARTITIONED_TABLES[table]['stats']
+    row = conn.execute(
+        f"SELECT COUNT(*), {', '.join(f'MIN({quote(col)}), MAX({quote(col)})' for col in stat_columns)} "
+        f"FROM {quote(name)}"
+    ).fetchone()
+    stats = {col: [row[1 + 2 * i], row[2 + 2 * i]] for i, col in enumerate(stat_columns)}
+    conn.execute(
+        f"INSERT OR REPLACE INTO {CATALOG_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (table, name, json.dumps(keys), row[0], json.dumps(stats), content_hash, time.time())
+    )
+    return row[0], stats
+
+def _drop_views(conn, table):
+    """Drop the union view of table and the nested union views under it"""
+    views = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='view'")
+             if row[0] == table or row[0].startswith(f'{table}__union_')]
+    for view in views:
+        conn.execute(f"DROP VIEW IF EXISTS {quote(view)}")
+
+def _union_sql(tables):
+    return ' UNION ALL '.join(f"SELECT * FROM {quote(name)}" for name in tables)
+
+def _create_view(conn, table):
+    """Recreate the view named table over all its partitions"""
+    _drop_views(conn, table)
+    tables = [entry['partition_table'] for entry in partition_catalog(conn, table)]
+    if not tables:
+        return
+    if len(tables) > MAX_COMPOUND_SELECT:
+        groups = [tables[i:i + MAX_COMPOUND_SELECT] for i in range(0, len(tables), MAX_COMPOUND_SELECT)]
+        tables = []
+        for i, group in enumerate(groups):
+            tables.append(f'{table}__union_{i}')
+            conn.execute(f"CREATE VIEW {quote(tables[-1])} AS {_union_sql(group)}")
+    conn.execute(f"CREATE VIEW {quote(table)} AS {_union_sql(tables)}")
+
+def _drop_plain_table(conn, table):
+    """Drop an unpartitioned table of this name left by an earlier load; returns whether there was one"""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+    if row is None or row[0] != 'table':
+        return False
+    logger.info(f"Replacing the unpartitioned {table} table with partitions")
+    conn.execute(f"DROP TABLE {quote(table)}")
+    return True
+
+def _check_keys(table, keys):
+    if table not in PARTITIONED_TABLES:
+        raise ValueError(f"Table {table} cannot be partitioned, expected one of {sorted(PARTITIONED_TABLES)}")
+    allowed = PARTITIONED_TABLES[table]['keys']
+    if not keys or any(key not in allowed for key in keys):
+        raise ValueError(f"Cannot partition {table} by {list(keys)}, expected some of {allowed}")
+    return [key for key in allowed if key in keys]
+
+def partition_keys(conn, table):
+    """Keys table is partitioned by, or None if it is not partitioned"""
+    catalog = partition_catalog(conn, table)
+    return list(catalog[0]['keys']) if catalog else None
+
+def layout_matches(conn, table, keys=None):
+    """Whether table is stored partitioned by keys, or unpartitioned when keys is empty"""
+    if not keys or table not in PARTITIONED_TABLES:
+        return partition_keys(conn, table) is None
+    return partition_keys(conn, table) == _check_keys(table, keys)
+
+def drop_partitions(conn, table):
+    """Drop the partitions, union view and catalog entries of table, e.g. before loading it unpartitioned"""
+    catalog = partition_catalog(conn, table)
+    _drop_views(conn, table)
+    for entry in catalog:
+        conn.execute(f"DROP TABLE IF EXISTS {quote(entry['partition_table'])}")
+    if catalog:
+        conn.execute(f"DELETE FROM {CATALOG_TABLE} WHERE table_name = ?", (table,))
+        logger.info(f"Dropped {len(catalog)} partitions of {table}")
+    conn.commit()
+
+def write_partitions(conn, table, df, keys=('Year',), mode='replace'):
+    """
+    Write a processed frame into the partitions of table.
+
+    With mode='replace' the frame holds the whole table: partitions whose content
+    hash matches the catalog are left alone, changed ones are rewritten and those
+    without rows in the frame are dropped. Replacing a table stored unpartitioned or
+    by other keys rebuilds all partitions. With mode='append' the rows are added to
+    their partitions, which must already be partitioned by keys. Returns the
+    partitions written, the number skipped, the partitions dropped, since_year, the
+    first year whose rows changed (None if none did), and rebuilt, whether an
+    unpartitioned table or other partitions were replaced.
+    """
+    keys = _check_keys(table, keys)
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone() is not None
+    if mode == 'append' and exists and not layout_matches(conn, table, keys):
+        # Appending would drop the rows stored in the other layout
+        raise ValueError(f"Cannot append to {table}, it is not stored partitioned by {keys}; replace it instead")
+    ensure_catalog(conn)
+    rebuilt = _drop_plain_table(conn, table)
+    catalog = {entry['partition_table']: entry for entry in partition_catalog(conn, table)}
+    if any(list(entry['keys']) != keys for entry in catalog.values()):
+        logger.info(f"Repartitioning {table} by {keys}")
+        drop_partitions(conn, table)
+        catalog, rebuilt = {}, True
+
+    written, dropped, changed_years = [], [], []
+    skipped = 0
+    with stage(f'write_partitions {table}', rows_in=len(df)) as record:
+        for values, part in df.groupby(keys, sort=True, observed=True, dropna=False):
+            name = partition_name(table, values)
+            content_hash = hashlib.sha256(row_hashes(part).values.tobytes()).hexdigest()
+            previous = catalog.pop(name, None)
+            if mode == 'replace' and previous is not None and previous['content_hash'] == content_hash:
+                skipped += 1
+                continue
+            if_exists = 'append' if mode == 'append' and previous is not None else 'replace'
+            if if_exists == 'append':
+                # The partition now holds the old rows followed by the new ones
+                content_hash = hashlib.sha256(f"{previous['content_hash']}{content_hash}".encode()).hexdigest()
+            bulk_load(conn, name, part, if_exists=if_exists)
+            _, stats = _save_entry(conn, table, name, dict(zip(keys, map(_python_value, values))), content_hash)
+            written.append(name)
+            changed_years.append(stats['Year'][0])
+
+        if mode == 'replace':
+            for name, entry in catalog.items():
+                conn.execute(f"DROP TABLE IF EXISTS {quote(name)}")
+                conn.execute(f"DELETE FROM {CATALOG_TABLE} WHERE table_name = ? AND partition_table = ?", (table, name))
+                dropped.append(name)
+                changed_years.append(entry['stats']['Year'][0])
+        _create_view(conn, table)
+        conn.commit()
+        record.update(rows_out=len(df), partitions_written=len(written), partitions_skipped=skipped,
+                      partitions_dropped=len(dropped))
+
+    logger.info(f"Partitions of {table}: {len(written)} written, {skipped} unchanged, {len(dropped)} dropped")
+    changed_years = [year for year in changed_years if year is not None]
+    return {'written': written, 'skipped': skipped, 'dropped': dropped,
+            'since_year': min(changed_years) if changed_years else None, 'rebuilt': rebuilt}
+
+def partition_from_table(conn, source, table, keys=('Year',)):
+    """
+    Split a table already in the database, such as a streamed staging table, into
+    the partitions of table in SQL and drop it. All partitions are rewritten.
+    Returns the number of partitions.
+    """
+    keys = _check_keys(table, keys)
+    ensure_catalog(conn)
+    drop_partitions(conn, table)
+    _drop_plain_table(conn, table)
+    key_sql = ', '.join(quote(key) for key in keys)
+    columns = ', '.join(quote(col) for col, _ in TABLE_SCHEMAS[table])
+    condition = ' AND '.join(f"{quote(key)} IS ?" for key in keys)
+
+    with stage(f'write_partitions {table}') as record, load_pragmas(conn):
+        partitions = conn.execute(f"SELECT DISTINCT {key_sql} FROM {quote(source)} ORDER BY {key_sql}").fetchall()
+        rows = 0
+        for values in partitions:
+            name = partition_name(table, values)
+            conn.execute(f"DROP TABLE IF EXISTS {quote(name)}")
+            conn.execute(create_table_sql(name))
+            conn.execute(f"INSERT INTO {quote(name)} ({columns}) SELECT {columns} FROM {quote(source)} "
+                         f"WHERE {condition}", values)
+            create_indexes(conn, name)
+            rows += _save_entry(conn, table, name, dict(zip(keys, values)), None)[0]
+        conn.execute(f"DROP TABLE {quote(source)}")
+        _create_view(conn, table)
+        conn.commit()
+        record.update(rows_in=rows, rows_out=rows, partitions_written=len(partitions))
+
+    logger.info(f"Split {source} into {len(partitions)} partitions of {table}")
+    return len(partitions)
+
+def _may_match(stats, col, value):
+    """Whether a partition with these min/max stats can hold rows where col matches value"""
+    if col not in stats or value is None:
+        return True
+    low, high = stats[col]
+    if low is None:
+        # Every value of the column is null in this partition
+        return False
+    try:
+        if isinstance(value, slice):
+            return (value.start is None or value.start <= high) and (value.stop is None or value.stop >= low)
+        if isinstance(value, list):
+            return any(v is not None and low <= v <= high for v in value)
+        return low <= value <= high
+    except TypeError:
+        return True
+
+def prune_partitions(catalog, filters):
+    """
+    Partition tables that can match every (column, value) filter, where value is a
+    scalar, a list of values or an inclusive slice, compared with the min/max stats
+    """
+    return [entry['partition_table'] for entry in catalog
+            if all(_may_match(entry['stats'], col, value) for col, value in filters)]
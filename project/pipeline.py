@@ -1,23 +1,91 @@
 import os
-import kaggle
+import hashlib
+import json
 import pandas as pd
+import pyarrow as pa
 import sqlite3
 from pathlib import Path
-import requests
-from io import BytesIO
 import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('pipeline.log'),
-        logging.StreamHandler()
-    ]
+from acquisition import call_with_deadline, retry
+from cache import CacheMissError, RawCache
+from cleaning import clean_frame, fill_missing, row_hashes
+from columnar import ColumnarStore
+from connectors import KaggleConnector, build_connectors
+from dag import DAG
+from joins import FACT_TABLE, build_fact_table
+from metrics import instrument, track_run
+from partitions import (
+    PARTITIONED_TABLES,
+    drop_partitions,
+    layout_matches,
+    partition_from_table,
+    staging_table,
+    write_partitions,
 )
+from query import table as query_table
+from rollups import refresh_rollups
+from storage import TABLE_SCHEMAS, bulk_insert, bulk_load, create_indexes, quote
+from validation import TABLE_RULES, validate_frame
+
+# kaggle authenticates on import, and kaggle, openpyxl and requests together take
+# longer to import than the rest of the module, so the functions that need them
+# (here and in connectors.py) import them when they run
 logger = logging.getLogger(__name__)
 
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Mapping of the state abbreviations in the EPA data to full state names
+STATE_ABBREVIATIONS = {
+    "AK": "Alaska", "AL": "Alabama", "AR": "Arkansas", "AZ": "Arizona",
+    "CA": "California", "CO": "Colorado", "CT": "Connecticut", "DE": "Delaware",
+    "FL": "Florida", "GA": "Georgia", "HI": "Hawaii", "IA": "Iowa",
+    "ID": "Idaho", "IL": "Illinois", "IN": "Indiana", "KS": "Kansas",
+    "KY": "Kentucky", "LA": "Louisiana", "MA": "Massachusetts", "MD": "Maryland",
+    "ME": "Maine", "MI": "Michigan", "MN": "Minnesota", "MO": "Missouri",
+    "MS": "Mississippi", "MT": "Montana", "NC": "North Carolina", "ND": "North Dakota",
+    "NE": "Nebraska", "NH": "New Hampshire", "NJ": "New Jersey", "NM": "New Mexico",
+    "NV": "Nevada", "NY": "New York", "OH": "Ohio", "OK": "Oklahoma",
+    "OR": "Oregon", "PA": "Pennsylvania", "RI": "Rhode Island", "SC": "South Carolina",
+    "SD": "South Dakota", "TN": "Tennessee", "TX": "Texas", "UT": "Utah",
+    "VA": "Virginia", "VT": "Vermont", "WA": "Washington", "WI": "Wisconsin",
+    "WV": "West Virginia", "WY": "Wyoming", "DC": "District of Columbia",
+    "AS": "American Samoa", "GU": "Guam GU", "MP": "Northern Mariana Islands",
+    "PR": "Puerto Rico PR", "VI": "U.S. Virgin Islands"
+}
+# Repeated text fields of the pollution data that are stored as categoricals
+POLLUTION_CATEGORICAL_COLUMNS = ['Address', 'State', 'County', 'City']
+EMISSIONS_URL = "https://www.epa.gov/system/files/other-files/2024-02/state_tier1_08feb2024_ktons.xlsx"
+EMISSIONS_SHEET = 'State_Trends'
+# Raw source of every table (see connectors.py). Another EPA tier or file is a new
+# entry here with its own table, or a changed URL and sheet for the emissions table.
+# Tables without their own preprocessing and watermark are loaded as parsed and
+# replaced whenever their source changes
+SOURCES = {
+    'renewable_energy': {'type': 'kaggle', 'dataset': 'alistairking/renewable-energy-consumption-in-the-u-s',
+                         'filename': 'dataset.csv'},
+    'pollution': {'type': 'kaggle', 'dataset': 'guslovesmath/us-pollution-data-200-to-2022',
+                  'filename': 'pollution_2000_2023.csv'},
+    'emissions': {'type': 'http', 'url': EMISSIONS_URL, 'filename': 'workbook.xlsx',
+                  'parser': 'excel', 'sheet_name': EMISSIONS_SHEET, 'skiprows': 1},
+}
+# Kaggle datasets with the CSV file each one provides and the table it is loaded into
+DATASETS = {config['dataset']: (config['filename'], table)
+            for table, config in SOURCES.items() if config['type'] == 'kaggle'}
+# Seconds all sources together may take to download, retries included
+ACQUISITION_TIMEOUT = 600
+
+def configure_logging(log_file='pipeline.log', level=logging.INFO):
+    """Log to the console and to log_file; only the entry point calls this, so importing the module has no side effects"""
+    logging.basicConfig(level=level, format=LOG_FORMAT,
+                        handlers=[logging.FileHandler(log_file), logging.StreamHandler()])
+
 def setup_kaggle_credentials():
     """Ensure Kaggle API credentials are set up"""
     logger.info("Setting up Kaggle credentials...")
@@ -28,107 +96,448 @@ def setup_kaggle_credentials():
     # Set permissions for kaggle.json
     # os.chmod(os.path.expanduser('~/.kaggle/kaggle.json'), 600)
 
-def download_dataset(dataset_name, path):
-    """Download dataset from Kaggle"""
-    logger.info(f"Downloading dataset {dataset_name} to {path}")
-    kaggle.api.dataset_download_files(dataset_name, path=path, unzip=True)
-    logger.info(f"Successfully downloaded and unzipped {dataset_name}")
-
-def download_emissions_data():
-    """Download and process emissions data from EPA website"""
-    url = "https://www.epa.gov/system/files/other-files/2024-02/state_tier1_08feb2024_ktons.xlsx"
-    logger.info(f"Downloading emissions data from {url}")
-    response = requests.get(url)
-
-    # Check if download was successful
-    if response.status_code == 200:
-        logger.info("Successfully downloaded emissions data")
-        # Read Excel file into pandas DataFrame
-        excel_data = BytesIO(response.content)
-        df_emissions = pd.read_excel(excel_data, sheet_name='State_Trends', skiprows=1)
-        logger.info(f"Loaded emissions data: {len(df_emissions)} rows")
-        return df_emissions
-    else:
-        logger.error(f"Failed to download emissions data. Status code: {response.status_code}")
-        return None
-    
+def fetch_source(connector, path, cache=None, deadline=None, version=None, **retry_options):
+    """
+    Fetch a connector's raw file into path, retried with backoff until the monotonic
+    deadline, by which an attempt still running is abandoned; a file missing from an
+    offline cache fails at once. With the remote version (fingerprint) of the source,
+    a cached copy of another version is downloaded again. Returns its path.
+    """
+    fetch = partial(connector.fetch, path, cache=cache, version=version)
+    if deadline is not None:
+        fetch = partial(call_with_deadline, fetch, connector.name, deadline)
+    return retry(fetch, connector.name, deadline=deadline, give_up_on=(CacheMissError,), **retry_options)
+
+@instrument('read_source {connector.table}')
+def read_source(connector, raw_path, columnar=None):
+    """Parse a fetched raw file, only once per file version with a columnar store"""
+    if columnar is None:
+        return connector.parse(raw_path)
+    return columnar.load(connector.name, file_content_hash(raw_path), partial(connector.parse, raw_path))
+
 def create_database():
     """Create SQLite database and necessary tables"""
     db_path = Path('data/data.db')
     logger.info(f"Creating database at {db_path}")
     db_path.parent.mkdir(parents=True, exist_ok=True)
     
-    conn = sqlite3.connect(db_path)
+    # Loads run in the pipeline graph's worker threads, one at a time
+    conn = sqlite3.connect(db_path, check_same_thread=False)
     cursor = conn.cursor()
     logger.info("Database connection established")
 
     conn.commit()
     return conn
 
+def ensure_metadata_table(conn):
+    """Create the table that stores per-source fingerprints for incremental refreshes"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS source_metadata (
+            source TEXT PRIMARY KEY,
+            table_name TEXT,
+            remote_fingerprint TEXT,
+            content_hash TEXT,
+            row_count INTEGER,
+            max_watermark INTEGER,
+            year_hashes TEXT,
+            updated_at TEXT
+        )
+    """)
+    # Databases created before per-year hashes were stored
+    columns = {row[1] for row in conn.execute("SELECT * FROM pragma_table_info('source_metadata')")}
+    if 'year_hashes' not in columns:
+        conn.execute("ALTER TABLE source_metadata ADD COLUMN year_hashes TEXT")
+    conn.commit()
+
+def get_source_metadata(conn, source):
+    """Return the stored fingerprint of a source as a dict, or None if it was never loaded"""
+    cursor = conn.execute("SELECT * FROM source_metadata WHERE source = ?", (source,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([col[0] for col in cursor.description], row))
+
+def save_source_metadata(conn, source, table_name, **fields):
+    """Insert or update the fingerprint of a source"""
+    fields['updated_at'] = pd.Timestamp.now().isoformat()
+    columns = ['source', 'table_name'] + list(fields)
+    updates = ', '.join(f"{col} = excluded.{col}" for col in columns[1:])
+    conn.execute(
+        f"INSERT INTO source_metadata ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+        f"ON CONFLICT(source) DO UPDATE SET {updates}",
+        [source, table_name] + list(fields.values())
+    )
+    conn.commit()
+
+def source_unchanged(metadata, remote_fingerprint=None, content_hash=None):
+    """Check a freshly computed fingerprint or content hash against the stored metadata"""
+    if metadata is None:
+        return False
+    if remote_fingerprint is not None and metadata['remote_fingerprint'] == remote_fingerprint:
+        return True
+    return content_hash is not None and metadata['content_hash'] == content_hash
+
+def file_content_hash(path, block_size=1 << 20):
+    """SHA-256 of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def dataframe_content_hash(df):
+    """SHA-256 over the row hashes of a DataFrame"""
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+# Tables whose raw file can be streamed into the database when a chunksize is given
+STREAMING_LOADS = {'pollution', 'emissions'}
+
+# Monotonic integer watermark per table, used to find rows newer than the last load
+WATERMARKS = {
+    'renewable_energy': lambda df: df['Year'] * 100 + df['Month'],
+    'pollution': lambda df: df['Date'].dt.strftime('%Y%m%d').astype(int),
+    'emissions': lambda df: df['Year'],
+}
+
+# The same watermarks computed in SQL, for tables that are streamed into the database
+WATERMARK_SQL = {
+    'pollution': "MAX(CAST(strftime('%Y%m%d', Date) AS INTEGER))",
+    'emissions': "MAX(Year)",
+}
+
+def table_exists(conn, table):
+    """Check whether a table, or the view over a partitioned table, exists in the database"""
+    cursor = conn.execute("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table,))
+    return cursor.fetchone() is not None
+
+def write_table(conn, table, df, if_exists='replace', partition_by=None):
+    """
+    Write a processed DataFrame into its table and refresh the table's rollups,
+    from the first appended year on when appending. With partition_by the rows are
+    written into partitions by those keys instead (see partitions.py): only the
+    partitions whose rows changed are rewritten and the rollups are refreshed from
+    the first changed year.
+    """
+    if partition_by and table in PARTITIONED_TABLES:
+        written = write_partitions(conn, table, df, keys=partition_by, mode=if_exists)
+        if written['rebuilt']:
+            refresh_rollups(conn, table)
+        elif written['since_year'] is not None:
+            refresh_rollups(conn, table, since_year=written['since_year'])
+        return
+    if if_exists == 'append' and not layout_matches(conn, table):
+        raise ValueError(f"Cannot append to {table}, it is stored in partitions; replace it instead")
+    drop_partitions(conn, table)
+    bulk_load(conn, table, df, if_exists=if_exists)
+    if if_exists == 'replace':
+        refresh_rollups(conn, table)
+    elif len(df):
+        refresh_rollups(conn, table, since_year=int(df['Year'].min()))
+
+def year_hashes(df):
+    """SHA-256 over the row hashes of every year of a DataFrame, as {year: digest}"""
+    hashes = row_hashes(df)
+    return {str(year): hashlib.sha256(group.values.tobytes()).hexdigest()
+            for year, group in hashes.groupby(df['Year'].values)}
+
+def changed_years(df, metadata, history):
+    """
+    Years whose rows up to the stored watermark differ from the last load, from the
+    stored per-year hashes. Loads that only stored a row count give None (every
+    year) when the count differs.
+    """
+    if not metadata.get('year_hashes'):
+        return None if history.sum() != metadata['row_count'] else []
+    stored = json.loads(metadata['year_hashes'])
+    current = year_hashes(df[history])
+    return sorted(int(year) for year in set(stored) | set(current) if stored.get(year) != current.get(year))
+
+def load_incremental(conn, table, df, metadata, partition_by=None):
+    """
+    Upsert a processed DataFrame into a table using the stored watermark.
+
+    Rows past the last stored watermark are appended, and the rollups of the table
+    are refreshed from the first appended year on. Years whose earlier rows were
+    revised, found from per-year hashes, are replaced as well, and the rollups are
+    refreshed from the first of them. When partition_by differs from the stored
+    layout appending would lose the stored rows, and when a load without per-year
+    hashes no longer matches the stored row count the history changed in an unknown
+    year, so in those cases the table and its rollups are rebuilt instead, as are
+    tables without a watermark. Returns the metadata fields to store.
+    """
+    if table not in WATERMARKS:
+        logger.info(f"{table} has no watermark, replacing it with {len(df)} rows")
+        write_table(conn, table, df, partition_by=partition_by)
+        return {'row_count': len(df), 'max_watermark': None, 'year_hashes': None}
+    watermark = WATERMARKS[table](df)
+    fields = {'row_count': len(df), 'max_watermark': int(watermark.max()), 'year_hashes': json.dumps(year_hashes(df))}
+    if metadata is None or metadata['max_watermark'] is None or not table_exists(conn, table):
+        logger.info(f"No previous load of {table}, writing all {len(df)} rows")
+        write_table(conn, table, df, partition_by=partition_by)
+        return fields
+    if not layout_matches(conn, table, partition_by):
+        logger.info(f"Storage layout of {table} changed since the last load, replacing {len(df)} rows")
+        write_table(conn, table, df, partition_by=partition_by)
+        return fields
+
+    new = (watermark > metadata['max_watermark']).values
+    years = changed_years(df, metadata, ~new)
+    if years is None:
+        logger.info(f"History of {table} changed since the last load, replacing {len(df)} rows")
+        write_table(conn, table, df, partition_by=partition_by)
+    elif years and partition_by and table in PARTITIONED_TABLES:
+        # Only the partitions whose rows changed are rewritten
+        logger.info(f"Rows of {table} in {years} changed since the last load, rewriting their partitions")
+        write_table(conn, table, df, partition_by=partition_by)
+    elif years:
+        rows = df[new | df['Year'].isin(years).values]
+        logger.info(f"Rows of {table} in {years} changed since the last load, upserting {len(rows)} rows")
+        conn.execute(f"DELETE FROM {quote(table)} WHERE \"Year\" IN ({', '.join('?' * len(years))})", years)
+        bulk_load(conn, table, rows, if_exists='append')
+        refresh_rollups(conn, table, since_year=years[0])
+    else:
+        logger.info(f"Appending {int(new.sum())} new rows to {table}")
+        write_table(conn, table, df[new], if_exists='append', partition_by=partition_by)
+    return fields
+
+def frame_memory(df):
+    """
+    Bytes used by a DataFrame, including the contents of object columns.
+
+    Measuring object columns means visiting every value, so this returns None
+    unless debug logging is enabled and the memory report is wanted.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return None
+    return int(df.memory_usage(deep=True).sum())
+
+def log_memory_reduction(name, memory_before, df):
+    """Log the memory of a frame before and after a transform at debug level"""
+    if memory_before is None:
+        return
+    memory_after = frame_memory(df)
+    logger.debug(
+        f"Memory of {name} data: {memory_before / 1024 ** 2:.1f} MB before, "
+        f"{memory_after / 1024 ** 2:.1f} MB after ({memory_before / max(memory_after, 1):.1f}x smaller)"
+    )
+
+@instrument()
 def preprocess_renewable_energy(df):
     """Preprocess renewable energy dataset"""
     logger.info("Starting renewable energy data preprocessing")
-    # Basic data validation
-    assert not df.empty, "Renewable energy dataset is empty"
     logger.info(f"Initial renewable energy dataset size: {len(df)} rows")
     
-    # Handle duplicates
-    if df.duplicated().sum() > 0:
-        dups = df.duplicated().sum()
-        logger.info(f"Found {dups} duplicates in renewable energy data. Removing duplicates...")
-        df = df.drop_duplicates()
-        logger.info(f"After removing duplicates: {len(df)} rows")
-    
-    # Check for missing values
-    missing_values = df.isnull().sum()
-    if missing_values.any():
-        logger.info("Found missing values. Filling with forward fill method...")
-        df = df.fillna(method='ffill')
-        # For any remaining NaN at the start, fill with backward fill
-        df = df.fillna(method='bfill')
-        logger.info("Missing values handled successfully")
+    df, _ = clean_frame(df, 'renewable energy')
+    validate_frame(df, 'renewable_energy')
     
     logger.info("Renewable energy preprocessing completed")
     return df
 
+def derive_pollution_columns(df):
+    """Convert Date, drop the CSV index column and add Year, Month, Day"""
+    df['Date'] = pd.to_datetime(df['Date'])
+    df.drop(columns=['Unnamed: 0'], inplace=True)
+    
+    # Strip whitespace from 'State' column
+    df['State'] = strip_categorical(df['State'])
+    # Extract year, month, and day from Date
+    df['Year'] = df['Date'].dt.year.astype('int16')
+    df['Month'] = df['Date'].dt.month.astype('int8')
+    df['Day'] = df['Date'].dt.day.astype('int8')
+    return df
+
+def strip_categorical(series):
+    """Strip whitespace once per distinct value and return a categorical with sorted categories"""
+    categorical = series.astype('category')
+    stripped = categorical.cat.categories.str.strip()
+    categories = stripped.unique().sort_values()
+    codes = categories.get_indexer(stripped).take(categorical.cat.codes)
+    codes[categorical.cat.codes.values == -1] = -1
+    return pd.Series(pd.Categorical.from_codes(codes, categories), index=series.index, name=series.name)
+
+def optimize_pollution_dtypes(df):
+    """Store the repeated site fields as categoricals and downcast integer columns"""
+    categorical_cols = [col for col in POLLUTION_CATEGORICAL_COLUMNS if col in df.columns]
+    integer_cols = [col for col in df.columns if pd.api.types.is_integer_dtype(df[col])]
+    return df.astype({col: 'category' for col in categorical_cols}).assign(
+        **{col: pd.to_numeric(df[col], downcast='integer') for col in integer_cols}
+    )
+
+@instrument()
 def preprocess_pollution(df):
     """Preprocess pollution dataset"""
     logger.info("Starting pollution data preprocessing")
-    # Basic data validation
-    assert not df.empty, "Pollution dataset is empty"
     logger.info(f"Initial pollution dataset size: {len(df)} rows")
+    memory_before = frame_memory(df)
 
-    if df.duplicated().sum() > 0:
-        dups = df.duplicated().sum()
-        logger.info(f"Found {dups} duplicates in pollution data. Removing duplicates...")
-        df = df.drop_duplicates()
-        logger.info(f"After removing duplicates: {len(df)} rows")
-    
-    # Check for missing values
-    missing_values = df.isnull().sum()
-    if missing_values.any():
-        logger.info("Found missing values. Filling with forward fill method...")
-        df = df.fillna(method='ffill')
-        # For any remaining NaN at the start, fill with backward fill
-        df = df.fillna(method='bfill')
-        logger.info("Missing values handled successfully")
+    df, _ = clean_frame(df, 'pollution')
     
     logger.info("Converting Date column to datetime")
-    df['Date'] = pd.to_datetime(df['Date'])
-    df.drop(columns=['Unnamed: 0'], inplace=True)
-    logger.info("Dropped Unnamed: 0 column")
-    
-    # Strip whitespace from 'State' column
-    df['State'] = df['State'].apply(lambda x: x.strip())
-    # Extract year, month, and day from Date
-    df['Year'] = df['Date'].dt.year
-    df['Month'] = df['Date'].dt.month
-    df['Day'] = df['Date'].dt.day
-    logger.info("Added Year, Month, Day columns")
+    df = derive_pollution_columns(df)
+    logger.info("Dropped Unnamed: 0 column and added Year, Month, Day columns")
+    df = optimize_pollution_dtypes(df)
+    log_memory_reduction("pollution", memory_before, df)
+    validate_frame(df, 'pollution')
     
     logger.info("Pollution preprocessing completed")
     return df
 
+@instrument('preprocess_passthrough {table}')
+def preprocess_passthrough(df, table):
+    """Preprocessing of tables without their own: the parsed frame, checked against the table's rules if it has any"""
+    if table in TABLE_RULES:
+        validate_frame(df, table)
+    return df
+
+def _sql_value(value):
+    """Convert a pandas/numpy scalar into something sqlite3 can bind"""
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value.item() if hasattr(value, 'item') else value
+
+@instrument()
+def preprocess_pollution_chunked(csv_path, conn, table='pollution', chunksize=100_000, keep_staging=False):
+    """
+    Stream the pollution CSV into SQLite in bounded chunks.
+
+    Produces the same rows as preprocess_pollution: duplicates are removed across
+    chunks with a set of row hashes, forward fill carries the last row of each chunk
+    into the next one, and leading NaNs are back-filled in the table at the end.
+
+    The chunks go into the staging table, which replaces table only once every
+    chunk is in and validated, so a failure part way leaves table as it was. With
+    keep_staging the rows are left in the staging table for the caller to move,
+    e.g. into partitions.
+    """
+    logger.info(f"Starting chunked pollution preprocessing of {csv_path} (chunksize={chunksize})")
+    staging = staging_table(table)
+    try:
+        rows_in, rows_out = _stream_pollution_chunks(csv_path, conn, staging, chunksize)
+    except Exception:
+        conn.rollback()
+        conn.execute(f"DROP TABLE IF EXISTS {quote(staging)}")
+        conn.commit()
+        raise
+
+    if not keep_staging:
+        drop_partitions(conn, table)
+        conn.execute("BEGIN")
+        conn.execute(f"DROP TABLE IF EXISTS {quote(table)}")
+        conn.execute(f"ALTER TABLE {quote(staging)} RENAME TO {quote(table)}")
+        conn.commit()
+        create_indexes(conn, table)
+
+    logger.info(f"Chunked pollution preprocessing completed: {rows_in} rows read, {rows_out} rows written")
+    return rows_out
+
+def _stream_pollution_chunks(csv_path, conn, table, chunksize):
+    """Write the deduplicated, filled and validated chunks of the pollution CSV to table"""
+    seen_hashes = set()
+    carry = None
+    backfill = {}
+    rows_in = rows_out = dups = 0
+
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        rows_in += len(chunk)
+
+        # Drop rows already seen in this chunk or an earlier one
+        hashes = row_hashes(chunk)
+        already_seen = [h in seen_hashes for h in hashes.tolist()]
+        keep = ~hashes.duplicated() & ~pd.Series(already_seen, index=hashes.index)
+        dups += int((~keep).sum())
+        chunk = chunk[keep.values]
+        if chunk.empty:
+            continue
+        seen_hashes.update(hashes[keep].tolist())
+
+        # Forward fill using the last row of the previous chunk as the seed
+        if carry is not None:
+            chunk = pd.concat([carry, chunk]).ffill().iloc[1:]
+        else:
+            chunk = chunk.ffill()
+        carry = chunk.iloc[[-1]]
+
+        chunk = derive_pollution_columns(chunk.copy())
+
+        # After ffill the only NaNs left are the leading ones; remember the first
+        # valid value of each such column so it can be back-filled later
+        for col in chunk.columns[chunk.isnull().any()]:
+            backfill.setdefault(col, None)
+        for col, value in backfill.items():
+            if value is None and chunk[col].notna().any():
+                backfill[col] = chunk[col].loc[chunk[col].first_valid_index()]
+
+        # Validate the rows as they will be stored, back-filled; columns whose first
+        # valid value has not been read yet are checked once it is
+        known = {col: value for col, value in backfill.items() if value is not None}
+        validate_frame(chunk.fillna(known) if known else chunk, 'pollution',
+                       exempt=[col for col, value in backfill.items() if value is None])
+        last_row = chunk.iloc[[-1]]
+
+        bulk_load(conn, table, chunk, if_exists='replace' if rows_out == 0 else 'append', indexes=False)
+        rows_out += len(chunk)
+
+    if rows_in == 0:
+        validate_frame(pd.DataFrame(), 'pollution')
+    elif any(value is None for value in backfill.values()):
+        # Columns without any valid value stay null, as in the in-memory path
+        validate_frame(last_row, 'pollution')
+    if dups:
+        logger.info(f"Removed {dups} duplicates in pollution data")
+
+    for col, value in backfill.items():
+        if value is not None:
+            conn.execute(f'UPDATE "{table}" SET "{col}" = ? WHERE "{col}" IS NULL', (_sql_value(value),))
+    if backfill:
+        logger.info(f"Back-filled leading missing values in {len(backfill)} columns")
+    conn.commit()
+    return rows_in, rows_out
+
+def _duplicate_free_index(df):
+    """Index labels of the rows that are not duplicates of an earlier row"""
+    return df.index[~row_hashes(df).duplicated().values]
+
+def _partitions(df, column, n_partitions):
+    """Split a frame into at most n_partitions groups of whole column values"""
+    codes = pd.Series(pd.factorize(df[column])[0], index=df.index) % n_partitions
+    return [part for _, part in df.groupby(codes.values, sort=True)]
+
+@instrument()
+def preprocess_pollution_partitioned(df, executor, n_partitions=None):
+    """
+    Preprocess the pollution dataset with the work split by State across an executor.
+
+    Duplicate rows always share a State, so duplicates are found per partition. The
+    order-dependent forward/backward fill runs once on the merged frame, and the
+    row-local column derivation runs per partition again. Results are merged back
+    in the original row order, so the output matches preprocess_pollution exactly.
+    """
+    logger.info("Starting partitioned pollution data preprocessing")
+    logger.info(f"Initial pollution dataset size: {len(df)} rows")
+    memory_before = frame_memory(df)
+    n_partitions = n_partitions or getattr(executor, '_max_workers', None) or os.cpu_count()
+
+    kept = list(executor.map(_duplicate_free_index, _partitions(df, 'State', n_partitions)))
+    keep_mask = df.index.isin(kept[0].append(kept[1:]))
+    if not keep_mask.all():
+        logger.info(f"Found {(~keep_mask).sum()} duplicates in pollution data. Removing duplicates...")
+        df = df[keep_mask]
+        logger.info(f"After removing duplicates: {len(df)} rows")
+
+    df, missing = fill_missing(df)
+    if missing:
+        logger.info(f"Filled missing values in {len(missing)} columns of pollution data")
+
+    logger.info("Converting Date column and adding Year, Month, Day columns per partition")
+    parts = executor.map(derive_pollution_columns, _partitions(df, 'State', n_partitions))
+    df = optimize_pollution_dtypes(pd.concat(parts).reindex(df.index))
+    log_memory_reduction("pollution", memory_before, df)
+    validate_frame(df, 'pollution')
+
+    logger.info("Partitioned pollution preprocessing completed")
+    return df
+
+@instrument()
 def process_emissions_data(df_emissions):
     """
     Process emissions data by cleaning column names, reshaping data, and standardizing format
@@ -156,117 +565,318 @@ def process_emissions_data(df_emissions):
         if not year_columns:
             logger.error("No year columns found in the data")
             raise ValueError("No year columns found in the data")
-            
+        memory_before = frame_memory(df_emissions)
+
+        # Work on the wide frame, which has one row per state, source and pollutant
+        # instead of one per year: rank rows by abbreviation and pollutant for the
+        # final ordering, then map the abbreviations once per wide row
+        df_emissions = df_emissions[['State', 'Tier 1 Description', 'Pollutant'] + year_columns]
+        order = df_emissions.groupby(['State', 'Pollutant'], sort=True, dropna=False).ngroup()
+        logger.info("Replacing state abbreviations with full names")
+        df_emissions = pd.DataFrame({
+            '_order': order.astype('int32'),
+            'State': df_emissions['State'].map(STATE_ABBREVIATIONS).astype('category'),
+            'Source': df_emissions['Tier 1 Description'].astype('category'),
+            'Pollutant': df_emissions['Pollutant'].astype('category'),
+            **{int(col): df_emissions[col] for col in year_columns}
+        })
+
         df_emissions = df_emissions.melt(
-            id_vars=['State FIPS', 'State', 'Tier 1 Code', 'Tier 1 Description', 'Pollutant'],
-            value_vars=year_columns,
+            id_vars=['_order', 'State', 'Source', 'Pollutant'],
+            value_vars=[int(col) for col in year_columns],
             var_name='Year',
             value_name='Emissions'
         )
         logger.info(f"Data reshaped successfully. New shape: {df_emissions.shape}")
 
         logger.info("Converting and cleaning data")
-        df_emissions['Year'] = df_emissions['Year'].astype(int)
-        df_emissions = df_emissions.sort_values(['State', 'Pollutant', 'Year'])
+        df_emissions['Year'] = df_emissions['Year'].astype('int16')
+        df_emissions = df_emissions.sort_values(['_order', 'Year'], kind='stable')
         df_emissions['Emissions'] = df_emissions['Emissions'].fillna(0)
-        
-        logger.info("Dropping unnecessary columns and renaming")
-        df_emissions = df_emissions.drop(columns=['State FIPS', 'Tier 1 Code'])
-        df_emissions = df_emissions.rename(columns={'Tier 1 Description': 'Source'})
-        df_emissions = df_emissions.reset_index(drop=True)
-        
-        # Dictionary mapping state abbreviations to full names
-        abbreviation_to_name = {
-            "AK": "Alaska", "AL": "Alabama", "AR": "Arkansas", "AZ": "Arizona",
-            "CA": "California", "CO": "Colorado", "CT": "Connecticut", "DE": "Delaware",
-            "FL": "Florida", "GA": "Georgia", "HI": "Hawaii", "IA": "Iowa",
-            "ID": "Idaho", "IL": "Illinois", "IN": "Indiana", "KS": "Kansas",
-            "KY": "Kentucky", "LA": "Louisiana", "MA": "Massachusetts", "MD": "Maryland",
-            "ME": "Maine", "MI": "Michigan", "MN": "Minnesota", "MO": "Missouri",
-            "MS": "Mississippi", "MT": "Montana", "NC": "North Carolina", "ND": "North Dakota",
-            "NE": "Nebraska", "NH": "New Hampshire", "NJ": "New Jersey", "NM": "New Mexico",
-            "NV": "Nevada", "NY": "New York", "OH": "Ohio", "OK": "Oklahoma",
-            "OR": "Oregon", "PA": "Pennsylvania", "RI": "Rhode Island", "SC": "South Carolina",
-            "SD": "South Dakota", "TN": "Tennessee", "TX": "Texas", "UT": "Utah",
-            "VA": "Virginia", "VT": "Vermont", "WA": "Washington", "WI": "Wisconsin",
-            "WV": "West Virginia", "WY": "Wyoming", "DC": "District of Columbia",
-            "AS": "American Samoa", "GU": "Guam GU", "MP": "Northern Mariana Islands",
-            "PR": "Puerto Rico PR", "VI": "U.S. Virgin Islands"
-        }
-        
-        logger.info("Replacing state abbreviations with full names")
-        df_emissions['State'] = df_emissions['State'].map(abbreviation_to_name)
-        df_emissions = df_emissions[['Year', 'State', 'Source', 'Pollutant', 'Emissions']]
-        logger.info("Emissions data processing completed successfully")
-        return df_emissions
+        df_emissions = df_emissions[['Year', 'State', 'Source', 'Pollutant', 'Emissions']].reset_index(drop=True)
+        log_memory_reduction("emissions", memory_before, df_emissions)
 
     except Exception as e:
         logger.error(f"Error processing emissions data: {str(e)}")
         raise RuntimeError(f"Error processing emissions data: {str(e)}")
+
+    # Unmapped state abbreviations and non-numeric emissions fail here instead of loading as NULL
+    validate_frame(df_emissions, 'emissions')
+    logger.info("Emissions data processing completed successfully")
+    return df_emissions
     
-def main():
+def iter_emissions_records(workbook_path, sheet_name=EMISSIONS_SHEET, skiprows=1):
+    """
+    Yield long-format (Year, State, Source, Pollutant, Emissions) records from the
+    EPA workbook, reading the sheet one wide row at a time. sheet_name (a name or
+    an index) and skiprows are read as by pd.read_excel: skiprows is a number of
+    rows above the header (the EPA sheet has one title row), a list of row indices
+    or a function of the row index. Unmapped state
+    abbreviations are yielded as None and non-numeric cells as they are, for
+    validate_records() to reject.
+    """
+    import openpyxl
+
+    if skiprows is None or isinstance(skiprows, int):
+        skip = range(skiprows or 0).__contains__
+    elif callable(skiprows):
+        skip = skiprows
+    else:
+        skip = set(skiprows).__contains__
+    workbook = openpyxl.load_workbook(workbook_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name]
+        rows = (row for i, row in enumerate(sheet.iter_rows(values_only=True)) if not skip(i))
+        header = [str(name) if name is not None else '' for name in next(rows, ())]
+
+        required_cols = ['State FIPS', 'State', 'Tier 1 Code', 'Tier 1 Description', 'Pollutant']
+        missing_cols = [col for col in required_cols if col not in header]
+        if missing_cols:
+            logger.error(f"Missing required columns: {missing_cols}")
+            raise ValueError(f"Missing required columns: {missing_cols}")
+        year_columns = [(i, int(name[len('emissions'):])) for i, name in enumerate(header)
+                        if name.startswith('emissions') and name[len('emissions'):].isdigit()]
+        if not year_columns:
+            logger.error("No year columns found in the data")
+            raise ValueError("No year columns found in the data")
+
+        state_col, source_col, pollutant_col = (header.index(col) for col in ('State', 'Tier 1 Description', 'Pollutant'))
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            row = row + (None,) * (len(header) - len(row))
+            state = STATE_ABBREVIATIONS.get(row[state_col])
+            source, pollutant = row[source_col], row[pollutant_col]
+            for i, year in year_columns:
+                value = row[i]
+                if value is None:
+                    value = 0.0
+                elif isinstance(value, (int, float)):
+                    value = float(value)
+                yield year, state, source, pollutant, value
+    finally:
+        workbook.close()
+
+def validate_records(records, table, batch_size=50_000):
+    """Pass records through in batches, after checking every batch against the rules of the table"""
+    columns = [col for col, _ in TABLE_SCHEMAS[table]]
+    while batch := list(islice(records, batch_size)):
+        validate_frame(pd.DataFrame.from_records(batch, columns=columns), table)
+        yield from batch
+
+@instrument()
+def load_emissions_streaming(workbook_path, conn, table='emissions', batch_size=50_000, sheet_name=EMISSIONS_SHEET,
+                             skiprows=1):
+    """
+    Stream the EPA workbook into SQLite without building the wide or the long frame.
+    sheet_name and skiprows select the sheet and its header as in pd.read_excel.
+
+    Records are validated and inserted in batches as the rows are read, in workbook
+    order; uniqueness is only checked within a batch. Instead of sorting, ordered
+    reads by state, pollutant and year go through the table's (State, Pollutant,
+    Year) index, built once the rows are in.
+    """
+    logger.info(f"Starting streaming emissions load of {workbook_path}")
+    records = validate_records(iter_emissions_records(workbook_path, sheet_name, skiprows), table,
+                               batch_size=batch_size)
+    rows_out = bulk_insert(conn, table, records, batch_size=batch_size)
+    logger.info(f"Streaming emissions load completed: {rows_out} rows written")
+    return rows_out
+
+@instrument('export_table {table}')
+def export_table(store, conn, table, batch_size=50_000):
+    """
+    Export a table that was streamed into the database, reading it back in Arrow
+    batches rather than as one frame. Timestamps are exported as timestamps, like
+    the exports of processed frames.
+    """
+    conn.commit()
+    db_path = conn.execute("PRAGMA database_list").fetchone()[2]
+    query = query_table(table, db_path)
+    schema = query.arrow_schema()
+    for i, field in enumerate(schema):
+        if query.schema[field.name] == 'TIMESTAMP':
+            schema = schema.set(i, field.with_type(pa.timestamp('ns')))
+    store.export_batches(table, (batch.cast(schema) for batch in query.iter_batches(batch_size)), schema)
+
+def main(chunksize=None, incremental=False, workers=None, cache_dir='data/cache', offline=False,
+         columnar_dir='data/columnar', resume=False, checkpoint_dir='data/checkpoints', sources=None,
+         partition_by=None, export_dir='data/columnar'):
+    """
+    Run the full pipeline. With a chunksize the pollution CSV is streamed into
+    the database in chunks of that many rows instead of being loaded at once,
+    and the EPA workbook is streamed to disk and loaded row by row.
+    With incremental=True, sources whose fingerprint matches the last run are
+    skipped and only rows past the stored watermark are added to the others.
+    With workers the preprocessing runs in a process pool of that size.
+    Raw downloads go through a cache in cache_dir (None disables it); offline=True
+    serves them from the cache only. Raw sources are parsed once per version into
+    Arrow files in columnar_dir (None disables it). Every loaded table is exported
+    as an Arrow file to export_dir (None disables it). The rollup tables of every loaded table are rebuilt, or
+    refreshed from the first new year in incremental mode, and the three sources
+    are joined on Year, Month and State into the pollution_energy_emissions fact
+    table. Stage metrics of every run are appended to data/pipeline_runs.jsonl
+    and the pipeline_runs table.
+
+    The steps run as a graph (see dag.py) whose outputs are checkpointed in
+    checkpoint_dir. With resume=True, or in incremental mode, a rerun only executes
+    the steps that failed or whose inputs changed; otherwise the checkpoints are
+    cleared first.
+
+    sources maps every table to the configuration of its raw source (see SOURCES
+    and connectors.py), or to a connector.
+
+    With partition_by, e.g. ['Year'] or ['Year', 'State'], the pollution table is
+    stored as one table per partition behind a pollution view (see partitions.py),
+    a reload only rewrites the partitions whose rows changed, and queries filtered
+    on the partition columns skip the other partitions.
+    """
+    options = dict(chunksize=chunksize, incremental=incremental, workers=workers,
+                   cache_dir=cache_dir, offline=offline, columnar_dir=columnar_dir,
+                   resume=resume, checkpoint_dir=checkpoint_dir, partition_by=partition_by, export_dir=export_dir)
+    with track_run(**options):
+        run_pipeline(**options, sources=sources)
+
+def run_pipeline(chunksize=None, incremental=False, workers=None, cache_dir='data/cache', offline=False,
+                 columnar_dir='data/columnar', resume=False, checkpoint_dir='data/checkpoints', sources=None,
+                 partition_by=None, export_dir='data/columnar'):
+    """Build the pipeline graph with the options described in main() and run it"""
     logger.info("Starting pipeline execution")
+    connectors = build_connectors(SOURCES if sources is None else sources)
     # Setup
-    setup_kaggle_credentials()
+    if not offline and any(isinstance(connector, KaggleConnector) for connector in connectors.values()):
+        setup_kaggle_credentials()
     temp_dir = Path('data/temp')
     temp_dir.mkdir(parents=True, exist_ok=True)
     logger.info(f"Created temporary directory at {temp_dir}")
 
-    # Download datasets from Kaggle
-    datasets = {
-        'alistairking/renewable-energy-consumption-in-the-u-s': 'dataset.csv',
-        'guslovesmath/us-pollution-data-200-to-2022': 'pollution_2000_2023.csv'
+    # Create database connection
+    logger.info("Creating database")
+    conn = create_database()
+    if incremental:
+        ensure_metadata_table(conn)
+    cache = RawCache(cache_dir, offline=offline) if cache_dir else None
+    columnar = ColumnarStore(columnar_dir) if columnar_dir else None
+    exports = ColumnarStore(export_dir) if export_dir else None
+    db_lock = threading.Lock()
+
+    def load(table, source, fingerprint, df=None, raw_path=None, partition_by=None):
+        """Write a processed frame, or stream a raw file, into its table and refresh its rollups"""
+        fingerprint = dict(fingerprint)
+        with db_lock:
+            if incremental:
+                fingerprint['content_hash'] = (dataframe_content_hash(df) if raw_path is None
+                                               else file_content_hash(raw_path))
+                if source_unchanged(get_source_metadata(conn, source), content_hash=fingerprint['content_hash']):
+                    logger.info(f"Content of {source} is unchanged, skipping load")
+                    save_source_metadata(conn, source, table, **fingerprint)
+                    if exports is not None and not exports.path(table).exists():
+                        export_table(exports, conn, table)
+                    return 0
+
+            if df is None:
+                # Streaming always rewrites the table, so only the watermark is recorded
+                if table == 'pollution' and partition_by:
+                    rows = preprocess_pollution_chunked(raw_path, conn, table=table, chunksize=chunksize,
+                                                        keep_staging=True)
+                    partition_from_table(conn, staging_table(table), table, keys=partition_by)
+                elif table == 'pollution':
+                    rows = preprocess_pollution_chunked(raw_path, conn, chunksize=chunksize)
+                else:
+                    # The workbook is read as the connector's parser would read it
+                    options = connectors[table].parser_options
+                    rows = load_emissions_streaming(raw_path, conn, sheet_name=options.get('sheet_name', 0),
+                                                    skiprows=options.get('skiprows'))
+                refresh_rollups(conn, table)
+                if incremental:
+                    row_count, max_watermark = conn.execute(
+                        f"SELECT COUNT(*), {WATERMARK_SQL[table]} FROM {table}"
+                    ).fetchone()
+                    save_source_metadata(conn, source, table, **fingerprint,
+                                         row_count=row_count, max_watermark=max_watermark)
+                if exports is not None:
+                    export_table(exports, conn, table)
+                return rows
+
+            if not incremental:
+                write_table(conn, table, df, partition_by=partition_by)
+            else:
+                fields = load_incremental(conn, table, df, get_source_metadata(conn, source),
+                                          partition_by=partition_by)
+                save_source_metadata(conn, source, table, **fingerprint, **fields)
+        if exports is not None:
+            exports.export(table, df)
+        return len(df)
+
+    def load_frame(df, raw_path=None, **options):
+        return load(df=df, raw_path=raw_path, **options)
+
+    def load_file(raw_path, **options):
+        return load(raw_path=raw_path, **options)
+
+    # Pool workers start from the graph's threads while others hold logging, HTTP and
+    # SQLite locks; a forked child would inherit them locked, so workers are started
+    # from a clean forkserver process instead
+    executor = (ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver'))
+                if workers else None)
+    dag = DAG(checkpoint_dir, executor=executor)
+    # Checkpoints of earlier runs are reused when resuming or loading incrementally
+    if not (resume or incremental):
+        dag.clear()
+    deadline = time.monotonic() + ACQUISITION_TIMEOUT
+
+    # Every source is downloaded, parsed, preprocessed and loaded, or with a chunksize
+    # the pollution CSV and the emissions workbook are streamed straight into their tables
+    preprocessors = {
+        'renewable_energy': (preprocess_renewable_energy, True),
+        'pollution': (partial(preprocess_pollution_partitioned, executor=executor), False) if workers
+        else (preprocess_pollution, True),
+        'emissions': (process_emissions_data, True),
     }
+    for table, connector in connectors.items():
+        fingerprint = {}
+        if incremental:
+            fingerprint['remote_fingerprint'] = None if offline else connector.fingerprint()
+            if source_unchanged(get_source_metadata(conn, connector.name), remote_fingerprint=fingerprint['remote_fingerprint']):
+                logger.info(f"{connector.name} is unchanged since the last run, skipping")
+                continue
+        load_options = {'table': table, 'source': connector.name, 'fingerprint': fingerprint}
+        if partition_by and table in PARTITIONED_TABLES:
+            load_options['partition_by'] = list(partition_by)
+        # A cached file from before the fingerprint changed would be loaded as unchanged
+        dag.add(f'download {table}', partial(fetch_source, connector, temp_dir, cache=cache, deadline=deadline,
+                                             version=fingerprint.get('remote_fingerprint')),
+                version={**connector.describe(), **fingerprint})
+        if chunksize and table in STREAMING_LOADS:
+            dag.add(f'load {table}', load_file, [f'download {table}'], params=load_options)
+            continue
+        dag.add(f'read {table}', partial(read_source, connector, columnar=columnar),
+                [f'download {table}'], checkpoint=False)
+        default = (partial(preprocess_passthrough, table=table), False)
+        preprocess, in_process_pool = preprocessors.get(table, default)
+        dag.add(f'preprocess {table}', preprocess, [f'read {table}'], processes=in_process_pool)
+        dag.add(f'load {table}', load_frame, [f'preprocess {table}', f'download {table}'], params=load_options)
 
-    # Only download if files don't exist
-    max_retries = 3
-    for dataset_name, filename in datasets.items():
-        file_path = temp_dir / filename
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                download_dataset(dataset_name, temp_dir)
-                break
-            except Exception as e:
-                retry_count += 1
-                if retry_count == max_retries:
-                    logger.error(f"Failed to download {dataset_name} after {max_retries} attempts")
-                    raise RuntimeError(f"Failed to download {dataset_name}: {str(e)}")
-                logger.warning(f"Attempt {retry_count} failed, retrying download of {dataset_name}...")
-        
-    # Download and process emissions data with retries
-    logger.info("Downloading and processing emissions data")
-    retry_count = 0
-    while retry_count < max_retries:
-        try:
-            emissions_df = download_emissions_data()
-            if emissions_df is not None:
-                emissions_df = process_emissions_data(emissions_df)
-                break
-            retry_count += 1
-            if retry_count == max_retries:
-                logger.error("Failed to download emissions data after all retries")
-                raise RuntimeError("Failed to download emissions data")
-            logger.warning(f"Attempt {retry_count} failed, retrying emissions data download...")
-        except Exception as e:
-            retry_count += 1
-            if retry_count == max_retries:
-                logger.error(f"Failed to process emissions data after {max_retries} attempts")
-                raise RuntimeError(f"Failed to process emissions data: {str(e)}")
-            logger.warning(f"Attempt {retry_count} failed, retrying emissions data processing...")
-        
-    # Download and process datasets
-    logger.info("Processing renewable energy and pollution datasets")
-    renewable_df = preprocess_renewable_energy(pd.read_csv(temp_dir / 'dataset.csv'))
-    pollution_df = preprocess_pollution(pd.read_csv(temp_dir / 'pollution_2000_2023.csv'))
+    def join(*loaded):
+        """Rebuild the fact table once all three source tables are in the database"""
+        with db_lock:
+            missing = [table for table in ('renewable_energy', 'pollution', 'emissions')
+                       if not table_exists(conn, table)]
+            if missing:
+                logger.warning(f"Not building {FACT_TABLE}, missing tables: {missing}")
+                return 0
+            return build_fact_table(conn)
 
-    # Create database connection
-    logger.info("Creating database and saving data")
-    conn = create_database()
-    
-    renewable_df.to_sql('renewable_energy', conn, if_exists='replace', index=False)
-    pollution_df.to_sql('pollution', conn, if_exists='replace', index=False)
-    emissions_df.to_sql('emissions', conn, if_exists='replace', index=False)
+    # The fact table joins all three sources, so it follows every load of this run
+    loads = [name for name in dag.nodes if name.startswith('load ')]
+    if loads:
+        dag.add('join', join, loads)
+
+    try:
+        dag.run()
+    finally:
+        if executor is not None:
+            executor.shutdown()
     conn.close()
     logger.info("Database operations completed")
     
@@ -277,4 +887,37 @@ def main():
     logger.info("Pipeline execution completed successfully")
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the data pipeline")
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help="stream the pollution CSV into the database in chunks of this many rows "
+                             "and the emissions workbook row by row")
+    parser.add_argument('--incremental', action='store_true',
+                        help="skip unchanged sources and only add new rows to the others")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="run the preprocessing in a process pool of this many workers")
+    parser.add_argument('--cache-dir', default='data/cache',
+                        help="directory of the raw download cache")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always download sources instead of using the cache")
+    parser.add_argument('--offline', action='store_true',
+                        help="serve sources from the cache only, without network access")
+    parser.add_argument('--columnar-dir', default='data/columnar',
+                        help="directory of the Arrow copies of raw sources and processed tables")
+    parser.add_argument('--no-columnar', action='store_true',
+                        help="parse raw sources every run instead of using the columnar store; "
+                             "processed tables are still exported")
+    parser.add_argument('--resume', action='store_true',
+                        help="reuse the checkpoints of the last run and only redo failed or changed steps")
+    parser.add_argument('--checkpoint-dir', default='data/checkpoints',
+                        help="directory of the step checkpoints")
+    parser.add_argument('--partition-by', nargs='+', choices=PARTITIONED_TABLES['pollution']['keys'],
+                        help="store the pollution table in partitions by these columns, e.g. --partition-by Year")
+    parser.add_argument('--log-file', default='pipeline.log', help="file the run's log is written to")
+    args = parser.parse_args()
+    configure_logging(args.log_file)
+    main(chunksize=args.chunksize, incremental=args.incremental, workers=args.workers,
+         cache_dir=None if args.no_cache else args.cache_dir, offline=args.offline,
+         columnar_dir=None if args.no_columnar else args.columnar_dir, export_dir=args.columnar_dir,
+         resume=args.resume, checkpoint_dir=args.checkpoint_dir, partition_by=args.partition_by)
@@ -0,0 +1,355 @@
+"""
+Lazy read API over the tables the pipeline writes to data.db.
+
+Queries are built up without touching the database and compiled into a single
+SQL statement, so column projection, predicates and group-bys run in SQLite
+(using the tables' indexes) instead of in pandas:
+
+    from query import table
+
+    ohio = (table('pollution')
+            .where(State='Ohio', Date=slice('2020-01-01', '2020-12-31'))
+            .select('Date', 'O3 AQI'))
+    df = ohio.to_pandas()
+
+    yearly = table('emissions').where(Pollutant='CO').group_by('Year').agg(total=('Emissions', 'sum'))
+    for batch in yearly.iter_batches():
+        ...
+
+Filters on a partitioned table (see partitions.py) only read the partitions
+whose min/max stats can match them.
+
+Results of to_pandas() are kept in an LRU cache keyed by the SQL, its parameters
+and the version of the database file, so any write to data.db invalidates them.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from joins import FACT_TABLE
+from partitions import MAX_COMPOUND_SELECT, partition_catalog, prune_partitions
+from rollups import ROLLUPS
+from storage import TABLE_SCHEMAS, quote
+
+logger = logging.getLogger(__name__)
+
+# Aggregate name -> SQL function
+AGGREGATES = {'sum': 'SUM', 'mean': 'AVG', 'min': 'MIN', 'max': 'MAX', 'count': 'COUNT'}
+
+def table_columns(name, db_path=None):
+    """{column: SQL type} of a pipeline table or rollup, or of any other table in the database"""
+    if name in TABLE_SCHEMAS:
+        return dict(TABLE_SCHEMAS[name])
+    if name in ROLLUPS:
+        rollup = ROLLUPS[name]
+        source_types = dict(TABLE_SCHEMAS[rollup['source']])
+        columns = {key: source_types[key] for key in rollup['keys']}
+        columns.update({col: col_type for col, col_type, _ in rollup['measures']})
+        return columns
+    if db_path is not None and Path(db_path).exists():
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            columns = {row[1]: row[2] for row in conn.execute("SELECT * FROM pragma_table_info(?)", (name,))}
+        finally:
+            conn.close()
+        if columns:
+            return columns
+    raise ValueError(f"Unknown table {name}, expected one of {sorted(TABLE_SCHEMAS) + sorted(ROLLUPS) + [FACT_TABLE]}")
+
+def arrow_type(column_type):
+    """Arrow type of a column from its declared SQL type, by SQLite's type affinity rules"""
+    column_type = (column_type or '').upper()
+    if 'INT' in column_type:
+        return pa.int64()
+    if any(name in column_type for name in ('CHAR', 'CLOB', 'TEXT', 'TIMESTAMP')):
+        return pa.string()
+    return pa.float64()
+
+def _sql_literal(value, column_type):
+    """Bind value the way the pipeline stores it; timestamps are stored as text"""
+    if column_type == 'TIMESTAMP' and value is not None:
+        return pd.Timestamp(value).strftime('%Y-%m-%d %H:%M:%S')
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+def database_version(db_path):
+    """Modification time and SQLite's file change counter, which every committed write bumps"""
+    with open(db_path, 'rb') as f:
+        header = f.read(28)
+    return os.stat(db_path).st_mtime_ns, int.from_bytes(header[24:28], 'big')
+
+class QueryCache:
+    """LRU cache of query results"""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key].copy()
+
+    def put(self, key, df):
+        with self._lock:
+            self._entries[key] = df.copy()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+query_cache = QueryCache()
+
+class Query:
+    """
+    A lazy query over one table. Every method returns a new Query; nothing runs
+    until the result is read with to_pandas(), iter_chunks() or iter_batches().
+    """
+
+    def __init__(self, name, db_path='data/data.db', columns=None, predicates=(), filters=(), keys=None,
+                 aggregates=None, order=None, limit_rows=None):
+        self.name = name
+        self.db_path = Path(db_path)
+        self.schema = table_columns(name, self.db_path)
+        self.columns = columns
+        self.predicates = tuple(predicates)
+        # (column, bound value) of every where() condition, for partition pruning
+        self.filters = tuple(filters)
+        self.keys = keys
+        self.aggregates = aggregates
+        self.order = order
+        self.limit_rows = limit_rows
+
+    def _replace(self, **changes):
+        fields = dict(name=self.name, db_path=self.db_path, columns=self.columns, predicates=self.predicates,
+                      filters=self.filters, keys=self.keys, aggregates=self.aggregates, order=self.order,
+                      limit_rows=self.limit_rows)
+        fields.update(changes)
+        return Query(**fields)
+
+    def _check(self, columns):
+        unknown = [col for col in columns if col not in self.schema]
+        if unknown:
+            raise ValueError(f"Unknown columns for table {self.name}: {unknown}")
+
+    def select(self, *columns):
+        """Only read these columns"""
+        self._check(columns)
+        return self._replace(columns=list(columns))
+
+    def where(self, **conditions):
+        """
+        Keep rows matching every condition: a value for equality, a list, tuple or set
+        for membership, or a slice(low, high) for an inclusive range (either end may be
+        None). Column names with spaces can be passed with **{'O3 AQI': ...}.
+        """
+        self._check(conditions)
+        predicates, filters = list(self.predicates), list(self.filters)
+        for col, value in conditions.items():
+            column_type = self.schema[col]
+            if isinstance(value, slice):
+                start, stop = _sql_literal(value.start, column_type), _sql_literal(value.stop, column_type)
+                if start is not None:
+                    predicates.append((f"{quote(col)} >= ?", [start]))
+                if stop is not None:
+                    predicates.append((f"{quote(col)} <= ?", [stop]))
+                filters.append((col, slice(start, stop)))
+            elif isinstance(value, (list, tuple, set, frozenset, pd.Index, pd.Series)):
+                values = [_sql_literal(v, column_type) for v in value]
+                placeholders = ', '.join('?' * len(values))
+                predicates.append((f"{quote(col)} IN ({placeholders})" if values else "0", values))
+                filters.append((col, values))
+            elif value is None:
+                predicates.append((f"{quote(col)} IS NULL", []))
+            else:
+                predicates.append((f"{quote(col)} = ?", [_sql_literal(value, column_type)]))
+                filters.append((col, _sql_literal(value, column_type)))
+        return self._replace(predicates=predicates, filters=filters)
+
+    def group_by(self, *keys):
+        """Group by these columns; follow with agg()"""
+        self._check(keys)
+        return self._replace(keys=list(keys), aggregates=self.aggregates or {})
+
+    def agg(self, **aggregates):
+        """Aggregate per group, e.g. agg(avg_o3=('O3 AQI', 'mean'), days=('Date', 'count'))"""
+        if self.keys is None:
+            raise ValueError("agg() needs group_by() first")
+        for output, (col, func) in aggregates.items():
+            if col != '*':
+                self._check([col])
+            if func not in AGGREGATES:
+                raise ValueError(f"Unknown aggregate {func}, expected one of {sorted(AGGREGATES)}")
+        return self._replace(aggregates={**self.aggregates, **aggregates})
+
+    def order_by(self, *columns):
+        """Sort by these output columns, prefixed with '-' for descending"""
+        return self._replace(order=list(columns))
+
+    def limit(self, rows):
+        """Return at most this many rows"""
+        return self._replace(limit_rows=int(rows))
+
+    def output_columns(self):
+        """Names of the result columns"""
+        if self.keys is not None:
+            return self.keys + list(self.aggregates)
+        return self.columns or list(self.schema)
+
+    def _source(self):
+        """
+        The FROM clause: the table, or for a partitioned table with filters a union
+        of only the partitions whose min/max stats can match them (see partitions.py)
+        """
+        if not self.filters or not self.db_path.exists():
+            return quote(self.name)
+        conn = self._connect()
+        try:
+            catalog = partition_catalog(conn, self.name)
+        finally:
+            conn.close()
+        tables = prune_partitions(catalog, self.filters)
+        if not catalog or len(tables) == len(catalog) or len(tables) > MAX_COMPOUND_SELECT:
+            return quote(self.name)
+        if not tables:
+            return f"(SELECT * FROM {quote(catalog[0]['partition_table'])} WHERE 0) AS {quote(self.name)}"
+        logger.debug(f"Reading {len(tables)} of {len(catalog)} partitions of {self.name}")
+        union = ' UNION ALL '.join(f"SELECT * FROM {quote(name)}" for name in tables)
+        return f"({union}) AS {quote(self.name)}"
+
+    def arrow_schema(self):
+        """Arrow schema of the result, from the declared column types rather than the values read"""
+        if self.keys is None:
+            return pa.schema([(col, arrow_type(self.schema[col])) for col in self.output_columns()])
+        fields = [(key, arrow_type(self.schema[key])) for key in self.keys]
+        for output, (col, func) in self.aggregates.items():
+            if func == 'count':
+                fields.append((output, pa.int64()))
+            elif func == 'mean':
+                fields.append((output, pa.float64()))
+            else:
+                fields.append((output, arrow_type(self.schema[col])))
+        return pa.schema(fields)
+
+    def sql(self):
+        """The SELECT statement and its parameters"""
+        if self.keys is not None:
+            select = [quote(key) for key in self.keys] + [
+                f"{AGGREGATES[func]}({'*' if col == '*' else quote(col)}) AS {quote(output)}"
+                for output, (col, func) in self.aggregates.items()
+            ]
+        else:
+            select = [quote(col) for col in self.output_columns()]
+        sql = f"SELECT {', '.join(select)} FROM {self._source()}"
+        params = []
+        if self.predicates:
+            sql += " WHERE " + " AND ".join(predicate for predicate, _ in self.predicates)
+            params = [value for _, values in self.predicates for value in values]
+        if self.keys:
+            sql += f" GROUP BY {', '.join(quote(key) for key in self.keys)}"
+        if self.order:
+            outputs = self.output_columns()
+            terms = []
+            for col in self.order:
+                name = col.lstrip('-')
+                if name not in outputs:
+                    raise ValueError(f"Cannot order by {name}, it is not in the result")
+                terms.append(f"{quote(name)}{' DESC' if col.startswith('-') else ''}")
+            sql += f" ORDER BY {', '.join(terms)}"
+        if self.limit_rows is not None:
+            sql += f" LIMIT {self.limit_rows}"
+        return sql, params
+
+    def _connect(self):
+        if not self.db_path.exists():
+            raise FileNotFoundError(f"Database {self.db_path} does not exist, run the pipeline first")
+        return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+
+    def _parse_dates(self, df):
+        for col in df.columns:
+            if self.schema.get(col) == 'TIMESTAMP' and (self.keys is None or col in self.keys):
+                df[col] = pd.to_datetime(df[col])
+        return df
+
+    def iter_chunks(self, chunksize=50_000):
+        """Stream the result as DataFrames of at most chunksize rows"""
+        sql, params = self.sql()
+        conn = self._connect()
+        try:
+            for chunk in pd.read_sql(sql, conn, params=params, chunksize=chunksize):
+                yield self._parse_dates(chunk)
+        finally:
+            conn.close()
+
+    def iter_batches(self, batch_size=50_000):
+        """
+        Stream the result as Arrow record batches, without going through pandas. Every
+        batch has arrow_schema(), so a column that is NULL across one batch keeps its type.
+        """
+        sql, params = self.sql()
+        schema = self.arrow_schema()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(sql, params)
+            while rows := cursor.fetchmany(batch_size):
+                yield pa.RecordBatch.from_pydict({name: list(values) for name, values in zip(schema.names, zip(*rows))},
+                                                 schema=schema)
+        finally:
+            conn.close()
+
+    def to_arrow(self, batch_size=50_000):
+        """The whole result as an Arrow table"""
+        return pa.Table.from_batches(list(self.iter_batches(batch_size)), schema=self.arrow_schema())
+
+    def to_pandas(self, cache=True):
+        """The whole result as a DataFrame, served from the LRU cache while the database is unchanged"""
+        sql, params = self.sql()
+        key = (str(self.db_path.resolve()), database_version(self.db_path), sql, tuple(params)) \
+            if cache and self.db_path.exists() else None
+        if key is not None:
+            df = query_cache.get(key)
+            if df is not None:
+                return df
+        conn = self._connect()
+        try:
+            df = self._parse_dates(pd.read_sql(sql, conn, params=params))
+        finally:
+            conn.close()
+        if key is not None:
+            query_cache.put(key, df)
+        return df
+
+    def count(self):
+        """Number of rows in the result"""
+        sql, params = self.sql()
+        conn = self._connect()
+        try:
+            return conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+        finally:
+            conn.close()
+
+    def explain(self):
+        """SQLite's query plan, to check which index a query uses"""
+        sql, params = self.sql()
+        conn = self._connect()
+        try:
+            return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        finally:
+            conn.close()
+
+def table(name, db_path='data/data.db'):
+    """Start a lazy query over a pipeline table or rollup"""
+    return Query(name, db_path)
@@ -0,0 +1,104 @@
+import logging
+
+from storage import TABLE_SCHEMAS, index_name, quote
+
+logger = logging.getLogger(__name__)
+
+POLLUTANTS = ['O3', 'CO', 'SO2', 'NO2']
+
+def _pollution_measures():
+    """Row count plus sum, count and max of every pollutant's mean and AQI"""
+    measures = [('Readings', 'INTEGER', 'COUNT(*)')]
+    for pollutant in POLLUTANTS:
+        for column in (f'{pollutant} Mean', f'{pollutant} AQI'):
+            measures += [(f'{column} Sum', 'REAL', f'SUM({quote(column)})'),
+                         (f'{column} Count', 'INTEGER', f'COUNT({quote(column)})')]
+        measures.append((f'{pollutant} AQI Max', 'REAL', f'MAX({quote(pollutant + " AQI")})'))
+    return measures
+
+def _renewable_measures():
+    """Month count plus the yearly sum of every energy column"""
+    return [('Months', 'INTEGER', 'COUNT(*)')] + [
+        (col, 'REAL', f'SUM({quote(col)})') for col, col_type in TABLE_SCHEMAS['renewable_energy'] if col_type == 'REAL'
+    ]
+
+# Rollup table -> source table, group keys, (column, type, aggregate) measures and the
+# key orders of its covering indexes. Averages are kept as sum and count so that
+# groups can be recomputed independently when new rows arrive.
+ROLLUPS = {
+    'pollution_monthly': {
+        'source': 'pollution',
+        'keys': ['State', 'Year', 'Month'],
+        'measures': _pollution_measures(),
+        'indexes': [('State', 'Year', 'Month'), ('Year', 'Month', 'State')],
+    },
+    'renewable_energy_yearly': {
+        'source': 'renewable_energy',
+        'keys': ['Year', 'Sector'],
+        'measures': _renewable_measures(),
+        'indexes': [('Year', 'Sector'), ('Sector', 'Year')],
+    },
+    'emissions_yearly': {
+        'source': 'emissions',
+        'keys': ['State', 'Year', 'Pollutant'],
+        'measures': [('Emissions', 'REAL', 'SUM("Emissions")'), ('Sources', 'INTEGER', 'COUNT(*)')],
+        'indexes': [('State', 'Year', 'Pollutant'), ('Pollutant', 'Year', 'State')],
+    },
+}
+
+def create_rollup_sql(name):
+    """Build the CREATE TABLE statement of a rollup, typed like its source keys"""
+    rollup = ROLLUPS[name]
+    source_types = dict(TABLE_SCHEMAS[rollup['source']])
+    columns = [f"{quote(key)} {source_types[key]}" for key in rollup['keys']]
+    columns += [f"{quote(col)} {col_type}" for col, col_type, _ in rollup['measures']]
+    return f"CREATE TABLE IF NOT EXISTS {quote(name)} ({', '.join(columns)})"
+
+def create_rollup_indexes(conn, name):
+    """Create the covering indexes of a rollup: each key order followed by every measure"""
+    rollup = ROLLUPS[name]
+    measures = [col for col, _, _ in rollup['measures']]
+    for keys in rollup['indexes']:
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {quote(index_name(name, keys))} "
+            f"ON {quote(name)} ({', '.join(quote(col) for col in list(keys) + measures)})"
+        )
+
+def refresh_rollup(conn, name, since_year=None):
+    """
+    Recompute a rollup from its source table.
+
+    With since_year only the groups from that year on are deleted and rebuilt,
+    which is all that changes when rows past the load watermark are appended.
+    """
+    rollup = ROLLUPS[name]
+    keys = ', '.join(quote(key) for key in rollup['keys'])
+    measures = ', '.join(expression for _, _, expression in rollup['measures'])
+    where = '' if since_year is None else ' WHERE "Year" >= ?'
+    params = () if since_year is None else (int(since_year),)
+
+    conn.commit()
+    try:
+        conn.execute("BEGIN")
+        if since_year is None:
+            conn.execute(f"DROP TABLE IF EXISTS {quote(name)}")
+        conn.execute(create_rollup_sql(name))
+        conn.execute(f"DELETE FROM {quote(name)}{where}", params)
+        conn.execute(
+            f"INSERT INTO {quote(name)} SELECT {keys}, {measures} FROM {quote(rollup['source'])}{where} GROUP BY {keys}",
+            params
+        )
+        create_rollup_indexes(conn, name)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    rows = conn.execute(f"SELECT COUNT(*) FROM {quote(name)}").fetchone()[0]
+    logger.info(f"Refreshed rollup {name} ({'full' if since_year is None else f'from {since_year}'}, {rows} rows)")
+    return rows
+
+def refresh_rollups(conn, table, since_year=None):
+    """Refresh every rollup built on a source table"""
+    for name, rollup in ROLLUPS.items():
+        if rollup['source'] == table:
+            refresh_rollup(conn, name, since_year=since_year)
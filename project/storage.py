@@ -0,0 +1,175 @@
+import logging
+from contextlib import contextmanager
+from itertools import chain, islice
+
+import numpy as np
+import pandas as pd
+
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Explicit column types for every table the pipeline writes, in table order
+TABLE_SCHEMAS = {
+    'renewable_energy': [
+        ('Year', 'INTEGER'), ('Month', 'INTEGER'), ('Sector', 'TEXT'),
+        ('Hydroelectric Power', 'REAL'), ('Geothermal Energy', 'REAL'),
+        ('Solar Energy', 'REAL'), ('Wind Energy', 'REAL'), ('Wood Energy', 'REAL'),
+        ('Waste Energy', 'REAL'), ('Fuel Ethanol, Excluding Denaturant', 'REAL'),
+        ('Biomass Losses and Co-products', 'REAL'), ('Biomass Energy', 'REAL'),
+        ('Total Renewable Energy', 'REAL'), ('Renewable Diesel Fuel', 'REAL'),
+        ('Other Biofuels', 'REAL'), ('Conventional Hydroelectric Power', 'REAL'),
+        ('Biodiesel', 'REAL')
+    ],
+    'pollution': [
+        ('Date', 'TIMESTAMP'), ('Address', 'TEXT'), ('State', 'TEXT'),
+        ('County', 'TEXT'), ('City', 'TEXT'), ('O3 Mean', 'REAL'),
+        ('O3 1st Max Value', 'REAL'), ('O3 1st Max Hour', 'INTEGER'),
+        ('O3 AQI', 'INTEGER'), ('CO Mean', 'REAL'), ('CO 1st Max Value', 'REAL'),
+        ('CO 1st Max Hour', 'INTEGER'), ('CO AQI', 'REAL'), ('SO2 Mean', 'REAL'),
+        ('SO2 1st Max Value', 'REAL'), ('SO2 1st Max Hour', 'INTEGER'),
+        ('SO2 AQI', 'REAL'), ('NO2 Mean', 'REAL'), ('NO2 1st Max Value', 'REAL'),
+        ('NO2 1st Max Hour', 'INTEGER'), ('NO2 AQI', 'INTEGER'),
+        ('Year', 'INTEGER'), ('Month', 'INTEGER'), ('Day', 'INTEGER')
+    ],
+    'emissions': [
+        ('Year', 'INTEGER'), ('State', 'TEXT'), ('Source', 'TEXT'),
+        ('Pollutant', 'TEXT'), ('Emissions', 'REAL')
+    ]
+}
+
+# Indexes on the keys analysts filter and join on, built after the data is loaded
+TABLE_INDEXES = {
+    'renewable_energy': [('Year', 'Month'), ('Sector',)],
+    'pollution': [('State', 'Date'), ('Year', 'Month'), ('Date',)],
+    'emissions': [('State', 'Year'), ('Pollutant', 'Year'), ('Year',), ('State', 'Pollutant', 'Year')]
+}
+
+# Pragmas that trade durability for speed while a load is running
+LOAD_PRAGMAS = {
+    'journal_mode': 'MEMORY',
+    'synchronous': 'OFF',
+    'cache_size': -262144,  # 256 MB
+    'temp_store': 'MEMORY'
+}
+
+def quote(name):
+    """Quote an identifier for use in SQL"""
+    return '"' + name.replace('"', '""') + '"'
+
+def base_table(table):
+    """The table whose schema and indexes a table uses: partitions and staging tables are named <table>__<suffix>"""
+    return table.split('__', 1)[0]
+
+def create_table_sql(table):
+    """Build the typed CREATE TABLE statement for a table"""
+    columns = ', '.join(f"{quote(col)} {col_type}" for col, col_type in TABLE_SCHEMAS[base_table(table)])
+    return f"CREATE TABLE IF NOT EXISTS {quote(table)} ({columns})"
+
+def index_name(table, columns):
+    """Name of the index on the given columns of a table"""
+    return 'idx_' + '_'.join([table] + [col.lower().replace(' ', '_') for col in columns])
+
+def create_indexes(conn, table):
+    """Create the query-key indexes of a table if they do not exist yet"""
+    for columns in TABLE_INDEXES.get(base_table(table), []):
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {quote(index_name(table, columns))} "
+            f"ON {quote(table)} ({', '.join(quote(col) for col in columns)})"
+        )
+    conn.commit()
+    logger.info(f"Indexes on {table} are in place")
+
+@contextmanager
+def load_pragmas(conn):
+    """Apply the load-time pragmas and restore the previous settings afterwards"""
+    previous = {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in LOAD_PRAGMAS}
+    for name, value in LOAD_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    try:
+        yield conn
+    finally:
+        for name, value in previous.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+
+def _rows(df):
+    """
+    Turn a DataFrame into tuples sqlite3 can bind. Each column is converted to Python
+    values in one to_numpy().tolist() call and missing values are replaced with None
+    only in the columns that have any, instead of boxing every cell of the frame.
+    Timestamps are formatted once per distinct value.
+    """
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            codes, uniques = pd.factorize(series)
+            # Missing timestamps have code -1, which picks the trailing None
+            formatted = np.append(uniques.strftime('%Y-%m-%d %H:%M:%S').to_numpy(dtype=object), None)
+            columns.append(formatted[codes].tolist())
+            continue
+        if series.hasnans:
+            columns.append(series.to_numpy(dtype=object, na_value=None).tolist())
+        else:
+            columns.append(series.to_numpy().tolist())
+    return zip(*columns)
+
+def bulk_insert(conn, table, rows, if_exists='replace', batch_size=50_000, indexes=True):
+    """
+    Insert an iterable of row tuples, in schema column order, into a typed table.
+
+    Rows are consumed in executemany batches inside a single transaction with the
+    load-time pragmas applied, so a generator is never materialized in full.
+    Indexes are created after the rows are in. Returns the number of rows inserted.
+    """
+    columns = [col for col, _ in TABLE_SCHEMAS[base_table(table)]]
+    insert_sql = (
+        f"INSERT INTO {quote(table)} ({', '.join(quote(col) for col in columns)}) "
+        f"VALUES ({', '.join('?' * len(columns))})"
+    )
+    rows = iter(rows)
+    inserted = 0
+
+    conn.commit()
+    with stage(f'bulk_load {table}') as record, load_pragmas(conn):
+        try:
+            conn.execute("BEGIN")
+            if if_exists == 'replace':
+                conn.execute(f"DROP TABLE IF EXISTS {quote(table)}")
+            conn.execute(create_table_sql(table))
+            while batch := list(islice(rows, batch_size)):
+                conn.executemany(insert_sql, batch)
+                inserted += len(batch)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if indexes:
+            create_indexes(conn, table)
+        record['rows_in'] = record['rows_out'] = inserted
+    return inserted
+
+def bulk_load(conn, table, df, if_exists='replace', batch_size=50_000, indexes=True):
+    """
+    Load a DataFrame into a table with an explicit typed schema.
+
+    All rows are inserted with executemany batches inside a single transaction,
+    with the load-time pragmas applied. Indexes are created after the rows are in.
+    Tables without a schema fall back to DataFrame.to_sql.
+    """
+    if base_table(table) not in TABLE_SCHEMAS:
+        df.to_sql(table, conn, if_exists=if_exists, index=False)
+        return len(df)
+
+    columns = [col for col, _ in TABLE_SCHEMAS[base_table(table)]]
+    missing_cols = [col for col in columns if col not in df.columns]
+    if missing_cols:
+        logger.error(f"Missing columns for table {table}: {missing_cols}")
+        raise ValueError(f"Missing columns for table {table}: {missing_cols}")
+
+    df = df[columns]
+    logger.info(f"Bulk loading {len(df)} rows into {table} ({if_exists})")
+    rows = chain.from_iterable(
+        _rows(df.iloc[start:start + batch_size]) for start in range(0, len(df), batch_size)
+    )
+    return bulk_insert(conn, table, rows, if_exists=if_exists, batch_size=batch_size, indexes=indexes)
@@ -0,0 +1,159 @@
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+from acquisition import backoff_delay, call_with_deadline, retry
+from cache import RawCache
+from connectors import HttpFileConnector, KaggleConnector
+from dag import DAG
+from pipeline import fetch_source
+
+
+class FakeKaggleApi:
+    """Stand-in for kaggle.api that writes a CSV after a delay"""
+
+    def __init__(self, delay=0.0, failures=0):
+        self.delay = delay
+        self.failures = failures
+        self.calls = []
+
+    def dataset_download_files(self, dataset, path=None, unzip=False):
+        self.calls.append(dataset)
+        attempt = len(self.calls)
+        time.sleep(self.delay)
+        if attempt <= self.failures:
+            raise ConnectionError("simulated network error")
+        pd.DataFrame({'Year': [2000], 'Month': [1]}).to_csv(f"{path}/{dataset.split('/')[-1]}.csv", index=False)
+
+
+@pytest.fixture
+def emissions_server():
+    """Serve a small EPA-style workbook from a local HTTP server"""
+    buffer = BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        pd.DataFrame({'State': ['AL'], 'Pollutant': ['CO'], 'emissions2023': [1.5]}).to_excel(
+            writer, sheet_name='State_Trends', startrow=1, index=False)
+    workbook = buffer.getvalue()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(0.3)
+            if self.path != '/emissions.xlsx':
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(workbook)))
+            self.end_headers()
+            self.wfile.write(workbook)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def test_backoff_delay_is_bounded():
+    """Backoff grows exponentially but never exceeds the cap"""
+    for attempt in range(1, 10):
+        assert 0 <= backoff_delay(attempt, base_delay=1.0, max_delay=8.0) <= min(8.0, 2 ** (attempt - 1))
+
+def test_retry_recovers_and_gives_up():
+    """Transient failures are retried, persistent ones raise after max_retries"""
+    sleeps = []
+    attempts = iter([ConnectionError("boom"), ConnectionError("boom"), 'ok'])
+
+    def flaky():
+        result = next(attempts)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert retry(flaky, 'flaky', max_retries=3, sleep=sleeps.append) == 'ok'
+    assert len(sleeps) == 2
+
+    with pytest.raises(RuntimeError, match="Failed to acquire broken"):
+        retry(partial(int, 'x'), 'broken', max_retries=2, sleep=sleeps.append)
+
+def test_call_with_deadline():
+    """A call that does not return before the deadline raises TimeoutError, other outcomes pass through"""
+    assert call_with_deadline(partial(int, '3'), 'fast', time.monotonic() + 1) == 3
+    with pytest.raises(ValueError):
+        call_with_deadline(partial(int, 'x'), 'broken', time.monotonic() + 1)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        call_with_deadline(partial(time.sleep, 5), 'hung', started + 0.1)
+    assert time.monotonic() - started < 1
+
+def test_fetch_source_gives_up_on_a_hung_download(tmp_path):
+    """A download that hangs is abandoned at the deadline instead of blocking its node"""
+    connector = KaggleConnector('owner/renewable', 'renewable.csv', 'renewable_energy', api=FakeKaggleApi(delay=5))
+    started = time.monotonic()
+    with pytest.raises(RuntimeError, match="did not finish before the deadline"):
+        fetch_source(connector, tmp_path, deadline=started + 0.2, base_delay=0.01)
+    assert time.monotonic() - started < 1
+
+def test_sources_download_concurrently(tmp_path, emissions_server):
+    """Download steps of the pipeline graph run in parallel against local stand-ins, retrying failures"""
+    api = FakeKaggleApi(delay=0.3, failures=1)
+    connectors = [KaggleConnector('owner/renewable', 'renewable.csv', 'renewable_energy', api=api),
+                  KaggleConnector('owner/pollution', 'pollution.csv', 'pollution', api=api),
+                  HttpFileConnector(f"{emissions_server}/emissions.xlsx", 'workbook.xlsx', 'emissions', parser='excel',
+                                    sheet_name='State_Trends', skiprows=1)]
+    dag = DAG(tmp_path / 'checkpoints')
+    for connector in connectors:
+        dag.add(f'download {connector.table}', partial(fetch_source, connector, tmp_path, base_delay=0.01))
+
+    started = time.monotonic()
+    dag.run()
+    elapsed = time.monotonic() - started
+
+    assert (tmp_path / 'renewable.csv').exists()
+    assert (tmp_path / 'pollution.csv').exists()
+    assert len(api.calls) == 3  # one simulated failure was retried
+    assert connectors[2].parse(dag.value('download emissions'))['emissions2023'].tolist() == [1.5]
+    assert elapsed < 0.3 * 4
+
+def test_fetch_source_http_failure(tmp_path, emissions_server):
+    """A missing workbook is retried and then reported"""
+    connector = HttpFileConnector(f"{emissions_server}/missing.xlsx", 'workbook.xlsx', 'emissions')
+    with pytest.raises(RuntimeError, match="Failed to acquire"):
+        fetch_source(connector, tmp_path, max_retries=2, base_delay=0.01)
+
+def test_fetch_source_through_cache(tmp_path, emissions_server):
+    """A second run is served from the cache, even offline, and a cache miss offline fails at once"""
+    api = FakeKaggleApi()
+    renewable = KaggleConnector('owner/renewable', 'renewable.csv', 'renewable_energy', api=api)
+    emissions = HttpFileConnector(f"{emissions_server}/emissions.xlsx", 'workbook.xlsx', 'emissions')
+    cache = RawCache(tmp_path / 'cache')
+    for connector in (renewable, emissions):
+        fetch_source(connector, tmp_path / 'first', cache=cache)
+
+    offline_cache = RawCache(tmp_path / 'cache', offline=True)
+    assert fetch_source(renewable, tmp_path / 'second', cache=offline_cache) == tmp_path / 'second' / 'renewable.csv'
+    workbook_path = fetch_source(emissions, tmp_path / 'second', cache=offline_cache)
+    assert workbook_path.read_bytes() == (tmp_path / 'first' / 'workbook.xlsx').read_bytes()
+    assert api.calls == ['owner/renewable']
+
+    pollution = KaggleConnector('owner/pollution', 'pollution.csv', 'pollution', api=api)
+    with pytest.raises(RuntimeError, match="not in the cache"):
+        fetch_source(pollution, tmp_path / 'third', cache=offline_cache)
+    assert len(api.calls) == 1
+
+def test_fetch_source_refreshes_other_versions(tmp_path):
+    """A cached download is reused at the same remote version and downloaded again once it changes"""
+    api = FakeKaggleApi()
+    renewable = KaggleConnector('owner/renewable', 'renewable.csv', 'renewable_energy', api=api)
+    cache = RawCache(tmp_path / 'cache')
+    for version in ('renewable.csv:1:1', 'renewable.csv:1:1', 'renewable.csv:2:2'):
+        fetch_source(renewable, tmp_path, cache=cache, version=version)
+    assert api.calls == ['owner/renewable', 'owner/renewable']
@@ -0,0 +1,71 @@
+import json
+
+from benchmark import (
+    STAGES,
+    find_regressions,
+    main,
+    measure_import_time,
+    run_benchmarks,
+    synthetic_emissions_wide,
+    synthetic_pollution,
+    synthetic_renewable,
+)
+
+
+def test_generators_match_source_shapes():
+    """Synthetic frames have the columns the preprocessors expect"""
+    renewable_df = synthetic_renewable(100)
+    pollution_df = synthetic_pollution(1000)
+    emissions_df = synthetic_emissions_wide(29 * 10)
+
+    assert len(renewable_df) == 100
+    assert renewable_df.columns[:3].tolist() == ['Year', 'Month', 'Sector']
+    assert len(renewable_df.columns) == 17
+    assert len(pollution_df) == 1010  # includes duplicates
+    assert pollution_df['Unnamed: 0'].duplicated().sum() == 10
+    assert pollution_df['CO AQI'].isnull().any()
+    assert len(pollution_df.columns) == 22
+    assert len(emissions_df) == 10
+    assert emissions_df.columns[-1] == 'emissions2023'
+
+def test_run_benchmarks_reports_every_stage():
+    """Every stage is timed and memory-profiled at every size"""
+    report = run_benchmarks([500], repeat=1)
+    assert {r['stage'] for r in report['results']} == set(STAGES)
+    for result in report['results']:
+        assert result['rows'] == 500
+        assert result['seconds'] > 0
+        assert result['peak_bytes'] > 0
+    assert [r['module'] for r in report['imports']] == ['pipeline', 'query']
+    json.dumps(report)
+
+def test_measure_import_time():
+    """Import time is read from a fresh interpreter, with the slowest direct imports"""
+    result = measure_import_time('pipeline', repeat=1)
+    assert result['seconds'] > 0
+    slowest = [i['module'] for i in result['slowest_imports']]
+    assert 'pandas' in slowest
+    assert not {'kaggle', 'openpyxl', 'requests'} & set(slowest)
+
+def test_find_regressions():
+    """Only changes beyond the threshold are flagged"""
+    baseline = {'results': [{'stage': 'a', 'rows': 10, 'seconds': 1.0, 'peak_bytes': 100}],
+                'imports': [{'module': 'pipeline', 'seconds': 0.5}]}
+    report = {'results': [{'stage': 'a', 'rows': 10, 'seconds': 1.1, 'peak_bytes': 200},
+                          {'stage': 'b', 'rows': 10, 'seconds': 5.0, 'peak_bytes': 100}],
+              'imports': [{'module': 'pipeline', 'seconds': 1.5}]}
+    regressions = find_regressions(report, baseline, threshold=0.2)
+    assert [(r['stage'], r['metric']) for r in regressions] == [('a', 'peak_bytes'), ('import pipeline', 'seconds')]
+
+def test_main_against_baseline(tmp_path):
+    """The CLI writes results and fails when a baseline is beaten by a wide margin"""
+    output = tmp_path / 'results.json'
+    assert main(['--rows', '300', '--stages', 'emissions_melt', '--repeat', '1', '--output', str(output)]) == 0
+    report = json.loads(output.read_text())
+
+    for result in report['results']:
+        result['seconds'] /= 100
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps(report))
+    assert main(['--rows', '300', '--stages', 'emissions_melt', '--repeat', '1',
+                 '--output', str(output), '--baseline', str(baseline)]) == 1
@@ -0,0 +1,64 @@
+import pytest
+
+from cache import CacheMissError, RawCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """Create an empty cache in a temporary directory"""
+    return RawCache(tmp_path / 'cache', max_bytes=1000)
+
+def test_store_and_restore(cache, tmp_path):
+    """Stored files are restored byte for byte and survive a reload of the index"""
+    source = tmp_path / 'dataset.csv'
+    source.write_text('Year,Month\n2000,1\n')
+    cache.store('owner/dataset', {'dataset.csv': source, 'extra.txt': b'hello'})
+
+    reloaded = RawCache(tmp_path / 'cache')
+    assert reloaded.restore('owner/dataset', tmp_path / 'out')
+    assert (tmp_path / 'out' / 'dataset.csv').read_text() == 'Year,Month\n2000,1\n'
+    assert reloaded.lookup('owner/dataset')['extra.txt'].read_bytes() == b'hello'
+    assert not reloaded.restore('other/dataset', tmp_path / 'out')
+
+def test_identical_content_is_stored_once(cache):
+    """Objects are addressed by content, so duplicates share storage"""
+    cache.store('a', {'file': b'x' * 100})
+    cache.store('b', {'file': b'x' * 100})
+    assert cache.size() == 100
+
+def test_integrity_check(cache, tmp_path):
+    """A corrupted object is detected and the entry dropped"""
+    cache.store('url', {'workbook.xlsx': b'original'})
+    for path in (tmp_path / 'cache' / 'objects').rglob('*'):
+        if path.is_file():
+            path.write_bytes(b'tampered')
+    assert cache.lookup('url') is None
+    assert not cache.restore('url', tmp_path / 'out')
+
+def test_lru_eviction(cache):
+    """The least recently used entry is evicted when the cache is full"""
+    cache.store('old', {'file': b'a' * 400})
+    cache.store('recent', {'file': b'b' * 400})
+    cache.lookup('old')  # touch, so 'recent' becomes the LRU entry
+    cache.store('new', {'file': b'c' * 400})
+    assert cache.lookup('recent') is None
+    assert cache.lookup('old') is not None
+    assert cache.size() <= 1000
+
+def test_max_age_and_offline(tmp_path):
+    """Stale entries are refreshed online but still served offline"""
+    RawCache(tmp_path / 'cache', max_age=0).store('url', {'file': b'data'})
+    assert RawCache(tmp_path / 'cache', max_age=-1).lookup('url') is None
+    assert RawCache(tmp_path / 'cache', max_age=-1, offline=True).lookup('url')['file'].read_bytes() == b'data'
+    with pytest.raises(CacheMissError):
+        RawCache(tmp_path / 'cache', offline=True).restore('missing', tmp_path / 'out')
+
+def test_entries_of_another_version_are_refreshed(cache):
+    """An entry is only served for the remote version it was stored at, except offline"""
+    cache.store('owner/dataset', {'dataset.csv': b'old'}, version='dataset.csv:1:1')
+    assert cache.lookup('owner/dataset', version='dataset.csv:1:1') is not None
+    assert cache.lookup('owner/dataset') is not None
+    assert cache.lookup('owner/dataset', version='dataset.csv:2:2') is None
+    cache.store('url', {'file': b'data'})
+    assert cache.lookup('url', version='etag') is None
+    assert RawCache(cache.root, offline=True).lookup('owner/dataset', version='dataset.csv:2:2') is not None
@@ -0,0 +1,32 @@
+import pandas as pd
+
+from cleaning import clean_frame, fill_missing, row_hashes
+
+
+def test_clean_frame_matches_pandas():
+    """Hash-based cleaning gives the same frame as drop_duplicates, ffill and bfill"""
+    df = pd.DataFrame({
+        'Year': [1973, 1973, 1973, 1974, 1974],
+        'Sector': ['Commerical', 'Commerical', 'Industrial', None, 'Industrial'],
+        'Solar Energy': [None, None, 1.5, 2.0, None],
+        'Wind Energy': [0.0, 0.0, 0.1, 0.2, 0.3],
+    })
+    cleaned, stats = clean_frame(df, 'renewable energy')
+
+    pd.testing.assert_frame_equal(cleaned, df.drop_duplicates().ffill().bfill())
+    assert stats == {'rows_in': 5, 'duplicates': 1, 'rows_out': 4,
+                     'missing_filled': {'Sector': 1, 'Solar Energy': 2}}
+    assert df['Solar Energy'].isna().sum() == 3  # the input is left alone
+
+def test_fill_missing_skips_complete_frames():
+    """A frame without missing values is returned as is"""
+    df = pd.DataFrame({'a': [1, 2]})
+    filled, missing = fill_missing(df)
+    assert filled is df
+    assert missing == {}
+
+def test_row_hashes_ignore_integer_float_difference():
+    """Rows hash the same whether a chunk parsed a column as int or float"""
+    ints = pd.DataFrame({'AQI': [37, 30], 'State': ['Arizona', 'Ohio']})
+    floats = ints.astype({'AQI': 'float64'})
+    assert row_hashes(ints).tolist() == row_hashes(floats).tolist()
@@ -0,0 +1,49 @@
+import pandas as pd
+import pyarrow as pa
+
+from columnar import ColumnarStore, read_columnar
+
+
+def test_load_parses_once_per_version(tmp_path):
+    """A source version is parsed once, later loads read the Arrow file"""
+    store = ColumnarStore(tmp_path)
+    df = pd.DataFrame({'State': ['Arizona', None], 'O3 AQI': [37, 30], 'CO Mean': [0.87, 1.06]})
+    calls = []
+
+    def parse():
+        calls.append(1)
+        return df
+
+    pd.testing.assert_frame_equal(store.load('owner/pollution', 'a' * 64, parse), df)
+    pd.testing.assert_frame_equal(store.load('owner/pollution', 'a' * 64, parse), df)
+    assert store.load('owner/pollution', 'a' * 64, parse, columns=['O3 AQI']).columns.tolist() == ['O3 AQI']
+    assert len(calls) == 1
+
+    # A new version replaces the old file
+    store.load('owner/pollution', 'b' * 64, parse)
+    assert len(calls) == 2
+    assert [path.name for path in tmp_path.glob('*.arrow')] == [store.path('owner/pollution', 'b' * 64).name]
+
+def test_unsupported_frames_are_not_stored(tmp_path):
+    """Frames Arrow cannot type are returned but not written"""
+    store = ColumnarStore(tmp_path)
+    df = pd.DataFrame({'State FIPS': ['01', 2]})
+    assert store.load('epa', 'c' * 64, lambda: df) is df
+    assert not list(tmp_path.glob('*.arrow'))
+
+def test_export_keeps_types(tmp_path):
+    """Exported tables keep their dtypes and can be read by column"""
+    store = ColumnarStore(tmp_path)
+    df = pd.DataFrame({'Date': pd.to_datetime(['2000-01-01', '2000-01-02']), 'Year': [2000, 2000]}, index=[0, 5])
+    store.export('pollution', df)
+    pd.testing.assert_frame_equal(read_columnar(store.path('pollution')), df)
+    assert read_columnar(store.path('pollution'), columns=['Year']).columns.tolist() == ['Year']
+
+def test_export_batches(tmp_path):
+    """Tables exported batch by batch read back like exported frames"""
+    store = ColumnarStore(tmp_path)
+    schema = pa.schema([('State', pa.string()), ('Year', pa.int64())])
+    batches = (pa.RecordBatch.from_pydict({'State': [state], 'Year': [2000]}, schema=schema) for state in ['Ohio', None])
+    store.export_batches('pollution', batches, schema)
+    pd.testing.assert_frame_equal(read_columnar(store.path('pollution')),
+                                  pd.DataFrame({'State': ['Ohio', None], 'Year': [2000, 2000]}))
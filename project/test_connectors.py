@@ -0,0 +1,136 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from cache import RawCache
+from connectors import (
+    HttpFileConnector,
+    KaggleConnector,
+    LocalFileConnector,
+    build_connectors,
+    download_file,
+    http_session,
+)
+
+
+@pytest.fixture
+def file_server():
+    """Serve CSV files over keep-alive HTTP/1.1 with ETags and range requests"""
+    files = {f'/{name}.csv': pd.DataFrame({'Year': [2000, 2001], 'Value': [i, i + 1]}).to_csv(index=False).encode()
+             for i, name in enumerate(['a', 'b', 'c'])}
+    clients, ranges = set(), []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            clients.add(self.client_address)
+            body = files.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            etag = f'"{len(body)}-{body[-2]}"'
+            start = 0
+            if self.headers.get('Range') and self.headers.get('If-Range') == etag:
+                start = int(self.headers['Range'].split('=')[1].rstrip('-'))
+                ranges.append(start)
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{len(body) - 1}/{len(body)}')
+            else:
+                self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body) - start))
+            self.end_headers()
+            self.wfile.write(body[start:])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", files, clients, ranges
+    server.shutdown()
+    server.server_close()
+
+def test_build_connectors_from_configuration(tmp_path):
+    """Source configurations become connectors by type, unknown types are rejected"""
+    connectors = build_connectors({
+        'renewable_energy': {'type': 'kaggle', 'dataset': 'owner/renewable', 'filename': 'dataset.csv'},
+        'emissions': {'type': 'http', 'url': 'https://example.com/x.xlsx', 'filename': 'workbook.xlsx',
+                      'parser': 'excel', 'sheet_name': 'State_Trends'},
+        'pollution': {'type': 'local', 'path': tmp_path / 'pollution.csv'},
+    })
+    assert isinstance(connectors['renewable_energy'], KaggleConnector)
+    assert connectors['emissions'].describe() == {
+        'type': 'http', 'name': 'https://example.com/x.xlsx', 'table': 'emissions', 'filename': 'workbook.xlsx',
+        'parser': 'excel', 'sheet_name': 'State_Trends'
+    }
+    assert connectors['pollution'].filename == 'pollution.csv'
+    with pytest.raises(ValueError, match="Unknown connector type ftp"):
+        build_connectors({'pollution': {'type': 'ftp'}})
+
+def test_local_file_connector(tmp_path):
+    """A local file is fetched in place, parsed and fingerprinted from its size and mtime"""
+    path = tmp_path / 'renewable.csv'
+    pd.DataFrame({'Year': [2000], 'Month': [1]}).to_csv(path, index=False)
+    connector = LocalFileConnector(path, 'renewable_energy')
+    assert connector.fetch(tmp_path / 'temp') == path
+    assert connector.parse(path).to_dict('records') == [{'Year': 2000, 'Month': 1}]
+    assert connector.fingerprint() == f"{path.stat().st_size}:{path.stat().st_mtime_ns}"
+    with pytest.raises(FileNotFoundError):
+        LocalFileConnector(tmp_path / 'missing.csv', 'pollution').fetch(tmp_path)
+
+def test_kaggle_connector_uses_its_client(tmp_path):
+    """An injected Kaggle client is used for fingerprints and downloads instead of the default one"""
+    class FakeApi:
+        def dataset_list_files(self, dataset):
+            return SimpleNamespace(files=[SimpleNamespace(ref='dataset.csv', totalBytes=10, creationDate='2024')])
+
+        def dataset_download_files(self, dataset, path, unzip):
+            (Path(path) / 'dataset.csv').write_text('Year\n2000\n')
+
+    connector = KaggleConnector('owner/renewable', 'dataset.csv', 'renewable_energy', api=FakeApi())
+    assert connector.fingerprint() == 'dataset.csv:10:2024'
+    assert connector.parse(connector.fetch(tmp_path))['Year'].tolist() == [2000]
+
+def test_http_downloads_reuse_connections(tmp_path, file_server):
+    """Files from one host download over one pooled keep-alive connection and go through the cache"""
+    url, files, clients, _ = file_server
+    cache = RawCache(tmp_path / 'cache')
+    for name in ['a', 'b', 'c']:
+        connector = HttpFileConnector(f'{url}/{name}.csv', f'{name}.csv', 'renewable_energy')
+        path = connector.fetch(tmp_path / 'temp', cache=cache)
+        assert path.read_bytes() == files[f'/{name}.csv']
+    assert len(clients) == 1
+    assert connector.parse(path)['Value'].tolist() == [2, 3]
+    assert connector.fingerprint() is None  # the server has no HEAD handler
+
+    offline = HttpFileConnector(f'{url}/a.csv', 'a.csv', 'renewable_energy')
+    assert offline.fetch(tmp_path / 'offline', cache=RawCache(tmp_path / 'cache', offline=True)).exists()
+    with pytest.raises(RuntimeError, match="Failed to download"):
+        HttpFileConnector(f'{url}/missing.csv', 'missing.csv', 'pollution').fetch(tmp_path / 'temp')
+
+def test_interrupted_download_is_resumed(tmp_path, file_server):
+    """A partial download resumes with a range request, unless the remote file changed"""
+    url, files, _, ranges = file_server
+    body = files['/a.csv']
+    target = tmp_path / 'a.csv'
+    (tmp_path / 'a.csv.part').write_bytes(body[:10])
+    (tmp_path / 'a.csv.validator').write_text(f'"{len(body)}-{body[-2]}"')
+    assert download_file(f'{url}/a.csv', target, session=http_session())
+    assert target.read_bytes() == body
+    assert ranges == [10]
+    assert not (tmp_path / 'a.csv.part').exists()
+
+    (tmp_path / 'a.csv.part').write_bytes(b'stale')
+    (tmp_path / 'a.csv.validator').write_text('"old-version"')
+    assert download_file(f'{url}/a.csv', target)
+    assert target.read_bytes() == body
+    assert ranges == [10]
@@ -0,0 +1,128 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from dag import DAG
+from metrics import instrument, track_run
+
+
+class Calls:
+    """Records which node functions ran"""
+
+    def __init__(self):
+        self.names = []
+        self._lock = threading.Lock()
+
+    def node(self, name, result=None, fail=False, delay=0):
+        def func(*inputs, **params):
+            with self._lock:
+                self.names.append(name)
+            time.sleep(delay)
+            if fail:
+                raise ValueError(f"{name} broke")
+            return result if result is not None else (name, inputs, params)
+        func.__qualname__ = f'node_{name}'
+        return func
+
+@instrument('scale {factor}')
+def scale(values, factor):
+    if factor < 0:
+        raise ValueError("negative factor")
+    return [value * factor for value in values]
+
+def build(tmp_path, calls, fail_load=False, scale=1):
+    dag = DAG(tmp_path / 'checkpoints')
+    dag.add('download', calls.node('download', result=[1, 2, 3]))
+    dag.add('read', calls.node('read'), ['download'], checkpoint=False)
+    dag.add('transform', calls.node('transform'), ['read'], params={'scale': scale})
+    dag.add('load', calls.node('load', fail=fail_load), ['transform'])
+    return dag
+
+def test_resume_runs_only_failed_nodes(tmp_path):
+    """After a failure only the failed node runs again, upstream outputs come from checkpoints"""
+    calls = Calls()
+    with pytest.raises(RuntimeError, match="Pipeline node load failed"):
+        build(tmp_path, calls, fail_load=True).run()
+    assert calls.names == ['download', 'read', 'transform', 'load']
+
+    calls.names.clear()
+    status = build(tmp_path, calls).run()
+    assert calls.names == ['load']
+    assert status == {'download': 'cached', 'read': 'deferred', 'transform': 'cached', 'load': 'ran'}
+
+def test_changed_params_rerun_downstream(tmp_path):
+    """Changing a node's params reruns it and everything that depends on it"""
+    calls = Calls()
+    build(tmp_path, calls).run()
+    calls.names.clear()
+    build(tmp_path, calls, scale=2).run()
+    assert calls.names == ['read', 'transform', 'load']
+
+def test_independent_nodes_run_concurrently(tmp_path):
+    """Nodes without a dependency between them overlap in time"""
+    calls = Calls()
+    dag = DAG(tmp_path / 'checkpoints')
+    for name in ['a', 'b', 'c']:
+        dag.add(name, calls.node(name, delay=0.3))
+    dag.add('join', calls.node('join'), ['a', 'b', 'c'])
+
+    started = time.monotonic()
+    dag.run()
+    assert time.monotonic() - started < 0.3 * 2
+    assert calls.names[-1] == 'join'
+    assert dag.value('join')[1] == (('a', (), {}), ('b', (), {}), ('c', (), {}))
+
+def test_file_outputs_are_checked(tmp_path):
+    """A checkpointed file output is only reused while the file is unchanged"""
+    calls = Calls()
+    target = tmp_path / 'raw.csv'
+
+    def download():
+        calls.names.append('download')
+        target.write_text('a,b\n1,2\n')
+        return target
+
+    def build_dag():
+        dag = DAG(tmp_path / 'checkpoints')
+        dag.add('download', download)
+        dag.add('parse', calls.node('parse'), ['download'])
+        return dag
+
+    build_dag().run()
+    assert build_dag().run()['download'] == 'cached'
+    target.unlink()
+    calls.names.clear()
+    build_dag().run()
+    assert calls.names == ['download']  # same contents again, so parse stays cached
+
+def test_invalid_graphs_are_rejected(tmp_path):
+    """Unknown inputs and cycles are reported before anything runs"""
+    calls = Calls()
+    dag = DAG(tmp_path / 'checkpoints')
+    dag.add('a', calls.node('a'), ['b'])
+    dag.add('b', calls.node('b'), ['a'])
+    with pytest.raises(ValueError, match="Cycle"):
+        dag.run()
+
+    dag = DAG(tmp_path / 'checkpoints')
+    dag.add('a', calls.node('a'), ['missing'])
+    with pytest.raises(ValueError, match="Unknown input"):
+        dag.run()
+    assert calls.names == []
+
+def test_process_nodes_record_stages(tmp_path):
+    """Stages recorded in the process pool end up in the parent's run, also when the node fails"""
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        dag = DAG(tmp_path / 'checkpoints', executor=executor)
+        dag.add('values', lambda: [1, 2])
+        dag.add('double', scale, ['values'], params={'factor': 2}, processes=True)
+        dag.add('negate', scale, ['values'], params={'factor': -1}, processes=True)
+        with pytest.raises(RuntimeError, match="negate"):
+            with track_run(db_path=None, jsonl_path=None) as run:
+                dag.run()
+    assert dag.value('double') == [2, 4]
+    assert sorted((record['stage'], record['status']) for record in run.stages) == [
+        ('scale -1', 'failed'), ('scale 2', 'succeeded')
+    ]
@@ -0,0 +1,59 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from joins import FACT_TABLE, build_fact_table
+from storage import TABLE_SCHEMAS, bulk_load
+
+
+@pytest.fixture
+def conn():
+    """A database with two years of pollution, renewables and emissions"""
+    conn = sqlite3.connect(':memory:')
+    dates = pd.to_datetime(['2022-12-31', '2023-01-01', '2023-01-01', '2023-02-01'])
+    pollution = pd.DataFrame({'Date': dates, 'Address': 'Site', 'State': ['Ohio', 'Ohio', 'Utah', 'Utah'],
+                              'County': 'County', 'City': 'City'})
+    for pollutant in ['O3', 'CO', 'SO2', 'NO2']:
+        for column in ['Mean', '1st Max Value', '1st Max Hour', 'AQI']:
+            pollution[f'{pollutant} {column}'] = [1.0, 2.0, 3.0, 4.0]
+    bulk_load(conn, 'pollution', pollution.assign(Year=dates.year, Month=dates.month, Day=dates.day))
+
+    renewable = pd.DataFrame({'Year': [2022, 2023, 2023], 'Month': [12, 1, 1],
+                              'Sector': ['Commerical', 'Commerical', 'Industrial']})
+    for col, _ in TABLE_SCHEMAS['renewable_energy'][3:]:
+        renewable[col] = [1.0, 2.0, 3.0]
+    bulk_load(conn, 'renewable_energy', renewable)
+
+    bulk_load(conn, 'emissions', pd.DataFrame({
+        'Year': [2022, 2023, 2023, 2023],
+        'State': ['Ohio', 'Ohio', 'Ohio', 'Utah'],
+        'Source': ['Highway Vehicles', 'Highway Vehicles', 'Off-Highway', 'Highway Vehicles'],
+        'Pollutant': ['CO', 'CO', 'CO', 'SO2'],
+        'Emissions': [1.0, 2.0, 3.0, 4.0]
+    }))
+    yield conn
+    conn.close()
+
+@pytest.mark.parametrize('partition_by', [('Year',), ('Year', 'State')])
+def test_fact_table_aligns_sources(conn, partition_by):
+    """Every pollution reading gets its month's national renewables and its state's yearly emissions"""
+    assert build_fact_table(conn, partition_by=partition_by) == 4
+    facts = pd.read_sql(f'SELECT * FROM {FACT_TABLE} ORDER BY Date, State', conn)
+
+    assert facts['State'].tolist() == ['Ohio', 'Ohio', 'Utah', 'Utah']
+    assert facts['National Solar Energy'].tolist()[:3] == [1.0, 5.0, 5.0]  # summed over sectors
+    assert pd.isna(facts['National Solar Energy'].iloc[3])  # no renewables for February
+    assert facts['CO Emissions'].fillna(-1).tolist() == [1.0, 5.0, -1, -1]  # summed over sources
+    assert facts['SO2 Emissions'].fillna(-1).tolist() == [-1, -1, 4.0, 4.0]
+    assert facts['O3 AQI'].tolist() == [1.0, 2.0, 3.0, 4.0]
+
+def test_fact_table_is_rebuilt(conn):
+    """A rebuild replaces the previous fact table and keeps its indexes"""
+    build_fact_table(conn)
+    conn.execute("DELETE FROM pollution WHERE Year = 2022")
+    conn.commit()
+    assert build_fact_table(conn) == 3
+    indexes = {row[1] for row in conn.execute(f"PRAGMA index_list({FACT_TABLE})")}
+    assert len(indexes) == 2
+    assert conn.execute("SELECT name FROM sqlite_temp_master").fetchall() == []
@@ -0,0 +1,54 @@
+import json
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from metrics import instrument, stage, track_run
+
+
+@instrument()
+def double_rows(df):
+    return pd.concat([df, df])
+
+def test_track_run_records_stages(tmp_path):
+    """Instrumented calls and stage blocks end up in the JSON lines file and the table"""
+    db_path, jsonl_path = tmp_path / 'data.db', tmp_path / 'runs.jsonl'
+    with track_run(db_path=db_path, jsonl_path=jsonl_path, workers=2) as run:
+        double_rows(pd.DataFrame({'a': range(5)}))
+        with stage('write', rows_in=3) as record:
+            (tmp_path / 'out.txt').write_bytes(b'x' * 10_000)
+            record['rows_out'] = 3
+
+    record = json.loads(jsonl_path.read_text().splitlines()[0])
+    assert record['run_id'] == run.run_id
+    assert record['status'] == 'succeeded'
+    assert record['details'] == {'workers': 2}
+    first, second = record['stages']
+    assert (first['stage'], first['rows_in'], first['rows_out']) == ('double_rows', 5, 10)
+    assert first['wall_seconds'] >= 0 and first['cpu_seconds'] >= 0
+    assert 'rss_delta_bytes' in first
+    assert second['bytes_written'] is None or second['bytes_written'] >= 10_000
+
+    conn = sqlite3.connect(db_path)
+    status, stages = conn.execute("SELECT status, stages FROM pipeline_runs").fetchone()
+    conn.close()
+    assert status == 'succeeded'
+    assert len(json.loads(stages)) == 2
+
+def test_failed_run_is_saved(tmp_path):
+    """A failing stage marks the stage and the run as failed and still saves the record"""
+    jsonl_path = tmp_path / 'runs.jsonl'
+    with pytest.raises(ValueError):
+        with track_run(db_path=None, jsonl_path=jsonl_path):
+            with stage('broken'):
+                raise ValueError("bad data")
+
+    record = json.loads(jsonl_path.read_text())
+    assert record['status'] == 'failed'
+    assert record['error'] == 'bad data'
+    assert record['stages'][0]['status'] == 'failed'
+
+def test_instrument_without_run():
+    """Outside a run the decorated function just runs"""
+    assert len(double_rows(pd.DataFrame({'a': [1]}))) == 2
@@ -0,0 +1,100 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from partitions import drop_partitions, partition_catalog, partition_from_table, prune_partitions, write_partitions
+from query import query_cache, table
+from storage import bulk_load
+
+
+def pollution_frame(dates, states):
+    """Processed pollution rows for the given dates and states"""
+    dates = pd.to_datetime(dates)
+    df = pd.DataFrame({'Date': dates, 'Address': 'Site', 'State': states, 'County': 'County', 'City': 'City'})
+    for pollutant in ['O3', 'CO', 'SO2', 'NO2']:
+        for column in ['Mean', '1st Max Value', '1st Max Hour', 'AQI']:
+            df[f'{pollutant} {column}'] = range(len(df))
+    return df.assign(Year=dates.year, Month=dates.month, Day=dates.day)
+
+@pytest.fixture
+def pollution_df():
+    return pollution_frame(['2019-03-01', '2020-01-01', '2020-06-01', '2021-01-01'], ['Ohio', 'Ohio', 'Utah', 'Utah'])
+
+def test_only_changed_partitions_are_rewritten(pollution_df):
+    """A reload skips unchanged partitions, rewrites changed ones and drops those without rows"""
+    conn = sqlite3.connect(':memory:')
+    result = write_partitions(conn, 'pollution', pollution_df)
+    assert result['written'] == ['pollution__2019', 'pollution__2020', 'pollution__2021']
+    assert conn.execute("SELECT COUNT(*) FROM pollution").fetchone()[0] == 4
+
+    catalog = {entry['partition_table']: entry for entry in partition_catalog(conn, 'pollution')}
+    assert catalog['pollution__2020']['row_count'] == 2
+    assert catalog['pollution__2020']['keys'] == {'Year': 2020}
+    assert catalog['pollution__2020']['stats'] == {
+        'Date': ['2020-01-01 00:00:00', '2020-06-01 00:00:00'], 'Year': [2020, 2020], 'State': ['Ohio', 'Utah']
+    }
+
+    changed = pollution_df.iloc[1:].copy()
+    changed.loc[3, 'O3 AQI'] = 99
+    result = write_partitions(conn, 'pollution', changed)
+    assert (result['written'], result['skipped'], result['dropped']) == (['pollution__2021'], 1, ['pollution__2019'])
+    assert result['since_year'] == 2019 and not result['rebuilt']
+    assert conn.execute("SELECT \"O3 AQI\" FROM pollution WHERE Year = 2021").fetchone()[0] == 99
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'pollution__2019'").fetchone()[0] == 0
+
+    write_partitions(conn, 'pollution', pollution_frame(['2022-01-01'], ['Ohio']), mode='append')
+    assert conn.execute("SELECT COUNT(*) FROM pollution").fetchone()[0] == 4
+    conn.close()
+
+def test_partition_keys_and_modes(pollution_df):
+    """Partitions by Year and State replace an unpartitioned table, and dropping them allows a plain load again"""
+    conn = sqlite3.connect(':memory:')
+    bulk_load(conn, 'pollution', pollution_df)
+    result = write_partitions(conn, 'pollution', pollution_df, keys=['State', 'Year'])
+    assert result['rebuilt']
+    assert result['written'][0] == 'pollution__2019__ohio'
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'pollution'").fetchone()[0] == 'view'
+    with pytest.raises(ValueError, match="Cannot partition pollution"):
+        write_partitions(conn, 'pollution', pollution_df, keys=['City'])
+    with pytest.raises(ValueError, match="Cannot append to pollution"):
+        write_partitions(conn, 'pollution', pollution_df, keys=['Year'], mode='append')
+
+    drop_partitions(conn, 'pollution')
+    bulk_load(conn, 'pollution', pollution_df)
+    assert partition_catalog(conn, 'pollution') == []
+
+    bulk_load(conn, 'pollution__staging', pollution_df)
+    assert partition_from_table(conn, 'pollution__staging', 'pollution', keys=['Year']) == 3
+    assert conn.execute("SELECT COUNT(*) FROM pollution").fetchone()[0] == 4
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'pollution__staging'").fetchone()[0] == 0
+    conn.close()
+
+def test_prune_partitions():
+    """Partitions are kept when their min/max range can match every filter"""
+    catalog = [{'partition_table': f'pollution__{year}', 'stats': {'Year': [year, year], 'State': ['Ohio', 'Utah']}}
+               for year in (2019, 2020, 2021)]
+    assert prune_partitions(catalog, [('Year', 2020)]) == ['pollution__2020']
+    assert prune_partitions(catalog, [('Year', slice(2020, None))]) == ['pollution__2020', 'pollution__2021']
+    assert prune_partitions(catalog, [('Year', [2019, 2021]), ('State', 'Ohio')]) == ['pollution__2019',
+                                                                                       'pollution__2021']
+    assert prune_partitions(catalog, [('State', 'Alabama')]) == []
+    assert len(prune_partitions(catalog, [('City', 'Phoenix')])) == 3
+
+def test_queries_skip_other_partitions(pollution_df, tmp_path):
+    """A query filtered by year reads only the matching partitions and returns the unpartitioned result"""
+    db_path = tmp_path / 'data.db'
+    conn = sqlite3.connect(db_path)
+    write_partitions(conn, 'pollution', pollution_df)
+    conn.close()
+    query_cache.clear()
+
+    query = table('pollution', db_path).where(Year=2020).select('Date', 'State')
+    plan = ' '.join(query.explain())
+    assert 'pollution__2020' in plan
+    assert 'pollution__2019' not in plan and 'pollution__2021' not in plan
+    assert query.to_pandas()['State'].tolist() == ['Ohio', 'Utah']
+
+    assert table('pollution', db_path).where(Date=slice('2020-03-01', '2021-12-31')).count() == 2
+    assert table('pollution', db_path).where(Year=1999).count() == 0
+    assert table('pollution', db_path).where(State='Ohio').count() == 2
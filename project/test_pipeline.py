@@ -5,6 +5,9 @@ import pandas as pd
 import sqlite3
 from pathlib import Path
 import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
 
 # Filter warnings more specifically
 warnings.filterwarnings("ignore", category=urllib3.exceptions.NotOpenSSLWarning)
@@ -15,13 +18,25 @@ warnings.filterwarnings("ignore", category=ResourceWarning)
 
 from pipeline import (
     setup_kaggle_credentials,
-    download_dataset,
-    download_emissions_data,
     process_emissions_data,
     preprocess_renewable_energy,
     preprocess_pollution,
+    preprocess_pollution_chunked,
+    ensure_metadata_table,
+    get_source_metadata,
+    save_source_metadata,
+    source_unchanged,
+    load_incremental,
+    preprocess_pollution_partitioned,
+    load_emissions_streaming,
+    iter_emissions_records,
+    DATASETS,
+    EMISSIONS_URL,
     main
 )
+from cache import RawCache
+from columnar import read_columnar
+from validation import SchemaViolationError
 
 
 
@@ -126,6 +141,11 @@ def test_process_emissions_data(sample_emissions_df):
     assert len(processed_df) == 58
     assert 'Alabama' in processed_df['State'].values
     assert 'Alaska' in processed_df['State'].values
+    # Rows stay ordered by state abbreviation, pollutant and year
+    assert processed_df['State'].iloc[0] == 'Alaska'
+    assert processed_df['Year'].is_monotonic_increasing is False
+    assert processed_df['Year'].iloc[:29].is_monotonic_increasing
+    assert processed_df['State'].dtype == 'category'
 
 def test_preprocess_renewable_energy(sample_renewable_df):
     """Test renewable energy data preprocessing"""
@@ -145,6 +165,260 @@ def test_preprocess_pollution(sample_pollution_df):
     assert processed_df['State'].str.contains(r'\s+$').sum() == 0  # No trailing spaces
     assert not processed_df.isnull().any().any()
 
+def test_pollution_dtypes_are_compact(multi_state_pollution_df):
+    """Repeated text fields become categoricals and integers are downcast"""
+    processed_df = preprocess_pollution(multi_state_pollution_df)
+
+    assert processed_df['State'].dtype == 'category'
+    assert sorted(processed_df['State'].cat.categories) == ['Arizona', 'Ohio', 'Texas']
+    assert processed_df['Address'].dtype == 'category'
+    assert processed_df['Month'].dtype == 'int8'
+    assert processed_df['O3 1st Max Hour'].dtype == 'int8'
+    assert processed_df['CO Mean'].dtype == 'float64'  # floats keep full precision
+
+def test_preprocess_pollution_chunked(sample_pollution_df, tmp_path):
+    """Chunked pollution preprocessing matches the in-memory version"""
+    extra_row = sample_pollution_df.iloc[[1]].assign(**{'Date': '2000-01-03', 'Unnamed: 0': 2, 'SO2 Mean': float('nan')})
+    # Row 2 duplicates row 1 from an earlier chunk, row 3 needs forward fill across chunks
+    df = pd.concat([sample_pollution_df, sample_pollution_df.iloc[[1]], extra_row], ignore_index=True)
+    df.loc[0, 'CO AQI'] = None  # leading NaN needs back fill
+    df.loc[0, 'City'] = None  # a leading NaN in a required column is back-filled, not rejected
+    csv_path = tmp_path / 'pollution.csv'
+    df.to_csv(csv_path, index=False)
+
+    conn = sqlite3.connect(tmp_path / 'test.db')
+    rows = preprocess_pollution_chunked(csv_path, conn, chunksize=1)
+    chunked_df = pd.read_sql('SELECT * FROM pollution', conn, parse_dates=['Date'])
+    conn.close()
+
+    expected_df = preprocess_pollution(pd.read_csv(csv_path)).reset_index(drop=True)
+    expected_df = expected_df.astype({col: object for col in expected_df.select_dtypes('category').columns})
+    assert rows == len(expected_df) == 3
+    pd.testing.assert_frame_equal(chunked_df, expected_df, check_dtype=False)
+
+def test_preprocess_pollution_chunked_failure_keeps_table(sample_pollution_df, tmp_path):
+    """A chunk failing validation part way leaves the table of the last load in place"""
+    csv_path = tmp_path / 'pollution.csv'
+    sample_pollution_df.to_csv(csv_path, index=False)
+    conn = sqlite3.connect(tmp_path / 'test.db')
+    preprocess_pollution_chunked(csv_path, conn, chunksize=1)
+
+    extra_row = sample_pollution_df.iloc[[1]].assign(**{'Date': '2000-01-03', 'Unnamed: 0': 2, 'O3 1st Max Hour': 25})
+    pd.concat([sample_pollution_df.iloc[[0]], extra_row, sample_pollution_df.iloc[[1]]]).to_csv(csv_path, index=False)
+    with pytest.raises(SchemaViolationError):
+        preprocess_pollution_chunked(csv_path, conn, chunksize=1)
+    assert conn.execute("SELECT COUNT(*) FROM pollution").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'pollution__staging'").fetchone()[0] == 0
+    conn.close()
+
+def test_load_emissions_streaming(sample_emissions_df, tmp_path):
+    """Streaming the workbook row by row loads the same records as the in-memory path"""
+    workbook_path = tmp_path / 'emissions.xlsx'
+    with pd.ExcelWriter(workbook_path, engine='openpyxl') as writer:
+        pd.DataFrame([['State Tier 1 emissions']]).to_excel(writer, sheet_name='State_Trends', header=False, index=False)
+        sample_emissions_df.to_excel(writer, sheet_name='State_Trends', startrow=1, index=False)
+
+    conn = sqlite3.connect(tmp_path / 'test.db')
+    rows = load_emissions_streaming(workbook_path, conn, batch_size=7)
+    streamed_df = pd.read_sql('SELECT * FROM emissions ORDER BY State, Pollutant, Year', conn)
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT * FROM emissions ORDER BY State, Pollutant, Year").fetchall()
+    conn.close()
+
+    expected_df = process_emissions_data(sample_emissions_df)
+    expected_df = expected_df.astype({col: object for col in expected_df.select_dtypes('category').columns})
+    expected_df = expected_df.sort_values(['State', 'Pollutant', 'Year']).reset_index(drop=True)
+    assert rows == len(expected_df) == 58
+    pd.testing.assert_frame_equal(streamed_df, expected_df, check_dtype=False)
+    assert 'TEMP B-TREE' not in str(plan)
+    records = list(iter_emissions_records(workbook_path, 'State_Trends'))
+    assert list(iter_emissions_records(workbook_path, 0, skiprows=[0])) == records
+    assert list(iter_emissions_records(workbook_path, 'State_Trends', skiprows=lambda i: i == 0)) == records
+
+def test_load_emissions_streaming_validates(sample_emissions_df, tmp_path):
+    """Unmapped states and non-numeric cells fail the streaming load like the in-memory one"""
+    sample_emissions_df['State'] = ['AL', 'XX']
+    sample_emissions_df['emissions1990'] = pd.Series([1.0, 'n/a'], dtype=object)
+    workbook_path = tmp_path / 'emissions.xlsx'
+    with pd.ExcelWriter(workbook_path, engine='openpyxl') as writer:
+        sample_emissions_df.to_excel(writer, sheet_name='State_Trends', startrow=1, index=False)
+
+    conn = sqlite3.connect(tmp_path / 'test.db')
+    with pytest.raises(SchemaViolationError) as error:
+        load_emissions_streaming(workbook_path, conn)
+    assert {violation['check'] for violation in error.value.report.violations} == {'not_null', 'numeric'}
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'emissions'").fetchone()[0] == 0
+    conn.close()
+
+def test_source_metadata_roundtrip():
+    """Stored fingerprints are found again and compared correctly"""
+    conn = sqlite3.connect(':memory:')
+    ensure_metadata_table(conn)
+    assert get_source_metadata(conn, 'epa') is None
+
+    save_source_metadata(conn, 'epa', 'emissions', remote_fingerprint='"etag-1"', content_hash='abc')
+    save_source_metadata(conn, 'epa', 'emissions', row_count=10, max_watermark=2023, year_hashes='{}')
+    metadata = get_source_metadata(conn, 'epa')
+    conn.close()
+
+    assert metadata['remote_fingerprint'] == '"etag-1"'
+    assert metadata['row_count'] == 10
+    assert source_unchanged(metadata, remote_fingerprint='"etag-1"')
+    assert source_unchanged(metadata, remote_fingerprint='"etag-2"', content_hash='abc')
+    assert not source_unchanged(metadata, remote_fingerprint='"etag-2"', content_hash='def')
+    assert not source_unchanged(None, remote_fingerprint='"etag-1"')
+
+def test_load_incremental(sample_pollution_df):
+    """Only rows past the watermark are appended unless history changed"""
+    conn = sqlite3.connect(':memory:')
+    first_df = preprocess_pollution(sample_pollution_df.copy())
+    fields = load_incremental(conn, 'pollution', first_df.iloc[:1], None)
+    assert (fields['row_count'], fields['max_watermark']) == (1, 20000101)
+
+    # A new day is appended without touching the existing row
+    conn.execute("UPDATE pollution SET City = 'marker'")
+    fields = load_incremental(conn, 'pollution', first_df, fields)
+    cities = [row[0] for row in conn.execute("SELECT City FROM pollution ORDER BY Date")]
+    assert cities == ['marker', 'Phoenix']
+    assert (fields['row_count'], fields['max_watermark']) == (2, 20000102)
+
+    # A revised value in an earlier day replaces the rows of its year
+    revised_df = first_df.copy()
+    revised_df.loc[0, 'O3 AQI'] = 99
+    fields = load_incremental(conn, 'pollution', revised_df, fields)
+    rows = conn.execute('SELECT City, "O3 AQI" FROM pollution ORDER BY Date').fetchall()
+    assert rows == [('Phoenix', 99), ('Phoenix', 30)]
+
+    # Fewer rows up to the watermark than stored means history changed, so replace
+    load_incremental(conn, 'pollution', first_df.iloc[1:], fields)
+    assert conn.execute("SELECT COUNT(*) FROM pollution").fetchone()[0] == 1
+
+    # Loads that only stored a row count fall back to comparing it
+    fields = {'row_count': 1, 'max_watermark': 20000102, 'year_hashes': None}
+    load_incremental(conn, 'pollution', first_df, fields)
+    assert [row[0] for row in conn.execute("SELECT Day FROM pollution ORDER BY Date")] == [1, 2]
+    conn.close()
+
+def test_load_incremental_across_storage_layouts(sample_pollution_df):
+    """Switching between plain and partitioned storage rewrites the whole table instead of appending"""
+    conn = sqlite3.connect(':memory:')
+    df = preprocess_pollution(sample_pollution_df.copy())
+    fields = load_incremental(conn, 'pollution', df.iloc[:1], None)
+
+    fields = load_incremental(conn, 'pollution', df, fields, partition_by=['Year'])
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'pollution'").fetchone()[0] == 'view'
+    assert conn.execute("SELECT COUNT(*) FROM pollution").fetchone()[0] == 2
+
+    later = df.assign(Date=df['Date'] + pd.DateOffset(years=1), Year=df['Year'] + 1)
+    both = pd.concat([df, later], ignore_index=True)
+    fields = load_incremental(conn, 'pollution', both, fields)
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'pollution'").fetchone()[0] == 'table'
+    assert conn.execute("SELECT COUNT(*) FROM pollution").fetchone()[0] == fields['row_count'] == 4
+    conn.close()
+
+@pytest.fixture
+def multi_state_pollution_df(sample_pollution_df):
+    """Pollution rows across several states with duplicates and gaps"""
+    frames = []
+    for i, state in enumerate(['Arizona', ' Texas', 'Ohio ', 'Arizona']):
+        frames.append(sample_pollution_df.assign(State=state, **{'Unnamed: 0': [2 * i, 2 * i + 1]}))
+    df = pd.concat(frames + [frames[1]], ignore_index=True)  # last two rows duplicate Texas
+    df.loc[0, 'CO AQI'] = None  # leading NaN
+    df.loc[4, 'SO2 Mean'] = None  # forward fill crosses a state boundary
+    return df
+
+def test_preprocess_pollution_partitioned(multi_state_pollution_df):
+    """Partitioned preprocessing matches the serial path exactly"""
+    expected_df = preprocess_pollution(multi_state_pollution_df.copy())
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        partitioned_df = preprocess_pollution_partitioned(multi_state_pollution_df.copy(), executor, n_partitions=3)
+    assert len(partitioned_df) == 8
+    pd.testing.assert_frame_equal(partitioned_df, expected_df)
+
+@pytest.mark.parametrize('chunksize, partition_by', [(None, None), (1, None), (None, ['Year']), (1, ['Year'])])
+def test_pipeline_offline_resume(sample_renewable_df, sample_pollution_df, sample_emissions_df,
+                                 tmp_path, monkeypatch, chunksize, partition_by):
+    """The pipeline runs from the raw cache, and a resumed run skips the steps whose inputs did not change"""
+    monkeypatch.chdir(tmp_path)
+    cache = RawCache('data/cache')
+    frames = {'renewable_energy': sample_renewable_df, 'pollution': sample_pollution_df}
+    for dataset_name, (filename, table) in DATASETS.items():
+        cache.store(dataset_name, {filename: frames[table].to_csv(index=False).encode()})
+    workbook_path = tmp_path / 'emissions.xlsx'
+    with pd.ExcelWriter(workbook_path, engine='openpyxl') as writer:
+        pd.DataFrame([['State Tier 1 emissions']]).to_excel(writer, sheet_name='State_Trends', header=False, index=False)
+        sample_emissions_df.to_excel(writer, sheet_name='State_Trends', startrow=1, index=False)
+    cache.store(EMISSIONS_URL, {'workbook.xlsx': workbook_path})
+
+    main(offline=True, chunksize=chunksize, columnar_dir=None, partition_by=partition_by)
+    conn = sqlite3.connect('data/data.db')
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ['renewable_energy', 'pollution', 'emissions', 'pollution_monthly', 'emissions_yearly',
+                            'pollution_energy_emissions']}
+    pollution_type = conn.execute("SELECT type FROM sqlite_master WHERE name = 'pollution'").fetchone()[0]
+    conn.close()
+    assert pollution_type == ('view' if partition_by else 'table')
+    assert counts == {'renewable_energy': 3, 'pollution': 2, 'emissions': 58, 'pollution_monthly': 1, 'emissions_yearly': 58,
+                      'pollution_energy_emissions': 2}
+    # Streamed tables are exported too, read back from the database
+    exported = read_columnar('data/columnar/pollution.arrow')
+    assert len(exported) == 2 and exported['Date'].dtype == 'datetime64[ns]'
+    assert len(read_columnar('data/columnar/emissions.arrow')) == 58
+
+    main(offline=True, chunksize=chunksize, columnar_dir=None, resume=True, partition_by=partition_by)
+    runs = pd.read_json('data/pipeline_runs.jsonl', lines=True)
+    assert runs['status'].tolist() == ['succeeded', 'succeeded']
+    first, second = ({stage['stage'] for stage in stages} for stages in runs['stages'])
+    assert [stage['stage'] for stage in runs['stages'][0]].count('process_emissions_data') == (0 if chunksize else 1)
+    assert {f'download_dataset {name}' for name in DATASETS} <= second
+    assert not {'preprocess_renewable_energy', 'bulk_load renewable_energy'} & second
+    assert {'preprocess_renewable_energy', 'bulk_load renewable_energy'} <= first
+
+def test_pipeline_from_local_sources(sample_renewable_df, sample_pollution_df, sample_emissions_df,
+                                    tmp_path, monkeypatch):
+    """Local file sources run through the pipeline without Kaggle or the network, serially or in a process pool"""
+    monkeypatch.chdir(tmp_path)
+    sample_renewable_df.to_csv('renewable.csv', index=False)
+    sample_pollution_df.to_csv('pollution.csv', index=False)
+    with pd.ExcelWriter('emissions.xlsx', engine='openpyxl') as writer:
+        pd.DataFrame({'Notes': ['About this file']}).to_excel(writer, sheet_name='Notes', index=False)
+        sample_emissions_df.to_excel(writer, sheet_name='Emissions', index=False)
+    sample_emissions_df.to_csv('tier2.csv', index=False)
+    sources = {
+        'renewable_energy': {'type': 'local', 'path': tmp_path / 'renewable.csv'},
+        'pollution': {'type': 'local', 'path': tmp_path / 'pollution.csv'},
+        'emissions': {'type': 'local', 'path': tmp_path / 'emissions.xlsx', 'parser': 'excel',
+                      'sheet_name': 1},
+        # A table without its own preprocessing or watermark is loaded as parsed
+        'emissions_tier2': {'type': 'local', 'path': tmp_path / 'tier2.csv'},
+    }
+
+    # The streamed workbook is read with the connector's sheet_name and skiprows, as in memory
+    for incremental, workers, chunksize in ((False, None, None), (False, 2, None), (False, None, 1), (True, 2, None)):
+        main(cache_dir=None, columnar_dir=None, sources=sources, incremental=incremental, workers=workers,
+             chunksize=chunksize)
+        conn = sqlite3.connect('data/data.db')
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ['renewable_energy', 'pollution', 'emissions', 'emissions_tier2']}
+        conn.close()
+        assert counts == {'renewable_energy': 3, 'pollution': 2, 'emissions': 58, 'emissions_tier2': 2}
+        # Stages run in the process pool are recorded too, and per-source stages by table
+        stages = [stage['stage'] for stage in pd.read_json('data/pipeline_runs.jsonl', lines=True)['stages'].iloc[-1]]
+        if not (incremental or chunksize):
+            assert {'preprocess_renewable_energy', 'process_emissions_data', 'clean renewable energy',
+                    'validate emissions', 'read_source pollution', 'preprocess_passthrough emissions_tier2'} <= set(stages)
+            assert stages.count('preprocess_renewable_energy') == 1
+
+def test_import_has_no_side_effects(tmp_path):
+    """Importing the pipeline neither loads the network and Excel clients nor creates a log file"""
+    env = {key: value for key, value in os.environ.items() if not key.startswith('KAGGLE_')}
+    env['PYTHONPATH'] = str(Path(__file__).parent)
+    result = subprocess.run(
+        [sys.executable, '-c', "import sys, pipeline; print(sorted({'kaggle', 'openpyxl', 'requests'} & set(sys.modules)))"],
+        cwd=tmp_path, env=env, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == '[]'
+    assert list(tmp_path.iterdir()) == []
+
 @pytest.mark.integration
 def test_full_pipeline():
     """System-level test for the complete pipeline"""
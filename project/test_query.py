@@ -0,0 +1,99 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from query import query_cache, table
+from storage import bulk_load
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A database with a small emissions and pollution table"""
+    path = tmp_path / 'data.db'
+    conn = sqlite3.connect(path)
+    bulk_load(conn, 'emissions', pd.DataFrame({
+        'Year': [2021, 2022, 2022, 2023],
+        'State': ['Alabama', 'Alabama', 'Alaska', 'Alaska'],
+        'Source': ['Highway Vehicles'] * 4,
+        'Pollutant': ['CO', 'CO', 'CO', 'SO2'],
+        'Emissions': [1.0, 2.0, 3.0, 4.0]
+    }))
+    dates = pd.to_datetime(['2020-01-01', '2020-01-02', '2020-02-01', '2021-01-01'])
+    pollution = pd.DataFrame({'Date': dates, 'Address': 'Site', 'State': ['Ohio', 'Ohio', 'Ohio', 'Utah'],
+                              'County': 'County', 'City': 'City'})
+    for pollutant in ['O3', 'CO', 'SO2', 'NO2']:
+        for column in ['Mean', '1st Max Value', '1st Max Hour', 'AQI']:
+            pollution[f'{pollutant} {column}'] = [10, 20, 30, 40]
+    bulk_load(conn, 'pollution', pollution.assign(Year=dates.year, Month=dates.month, Day=dates.day))
+    conn.close()
+    query_cache.clear()
+    return path
+
+def test_projection_and_predicates(db_path):
+    """Only the selected columns and matching rows are read"""
+    query = (table('pollution', db_path)
+             .where(State='Ohio', Date=slice('2020-01-01', '2020-01-31'))
+             .select('Date', 'O3 AQI'))
+    df = query.to_pandas()
+    assert df.columns.tolist() == ['Date', 'O3 AQI']
+    assert df['Date'].tolist() == [pd.Timestamp('2020-01-01'), pd.Timestamp('2020-01-02')]
+    assert any('idx_pollution_state_date' in step for step in query.explain())
+
+    assert table('emissions', db_path).where(Year=[2021, 2023]).count() == 2
+    assert table('emissions', db_path).where(Year=slice(2022, None), State='Alaska').count() == 2
+
+def test_group_by_is_pushed_down(db_path):
+    """Group-bys and aggregates run in SQL"""
+    query = (table('emissions', db_path).where(Pollutant='CO')
+             .group_by('Year').agg(total=('Emissions', 'sum'), rows=('*', 'count'))
+             .order_by('-Year'))
+    assert 'GROUP BY "Year"' in query.sql()[0]
+    assert query.to_pandas().to_dict('records') == [
+        {'Year': 2022, 'total': 5.0, 'rows': 2}, {'Year': 2021, 'total': 1.0, 'rows': 1}
+    ]
+
+def test_streaming_chunks_and_arrow_batches(db_path):
+    """Results stream in bounded chunks or Arrow record batches"""
+    query = table('emissions', db_path).select('Year', 'Emissions')
+    chunks = list(query.iter_chunks(chunksize=3))
+    assert [len(chunk) for chunk in chunks] == [3, 1]
+    batches = list(query.iter_batches(batch_size=3))
+    assert [batch.num_rows for batch in batches] == [3, 1]
+    assert query.to_arrow().column('Emissions').to_pylist() == [1.0, 2.0, 3.0, 4.0]
+    assert query.where(Year=1999).to_arrow().schema == query.arrow_schema()
+
+def test_arrow_batches_share_one_schema(db_path):
+    """A column that is NULL across a whole batch keeps its declared type"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE emissions SET Emissions = NULL WHERE Year < 2023")
+    conn.commit()
+    conn.close()
+    arrow = table('emissions', db_path).to_arrow(batch_size=2)
+    assert arrow.schema.field('Year').type == 'int64' and arrow.schema.field('Emissions').type == 'double'
+    assert arrow.column('Emissions').to_pylist() == [None, None, None, 4.0]
+
+    grouped = table('emissions', db_path).group_by('State').agg(total=('Emissions', 'sum'), rows=('*', 'count'),
+                                                                 mean=('Year', 'mean'))
+    assert [str(field.type) for field in grouped.to_arrow(batch_size=1).schema] == ['string', 'double', 'int64',
+                                                                                     'double']
+
+def test_results_are_cached_until_the_database_changes(db_path):
+    """Repeated queries are served from the LRU cache, writes invalidate it"""
+    query = table('emissions', db_path).where(State='Alabama')
+    first = query.to_pandas()
+    first.loc[0, 'Emissions'] = -1.0  # callers get copies
+    assert query.to_pandas()['Emissions'].tolist() == [1.0, 2.0]
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM emissions WHERE Year = 2021")
+    conn.commit()
+    conn.close()
+    assert query.to_pandas()['Emissions'].tolist() == [2.0]
+
+def test_unknown_columns_are_rejected(db_path):
+    """Column names are checked against the table schema before any SQL is built"""
+    with pytest.raises(ValueError, match="Unknown columns"):
+        table('emissions', db_path).where(**{'State; DROP TABLE emissions': 'x'})
+    with pytest.raises(ValueError, match="Unknown table"):
+        table('nope', db_path)
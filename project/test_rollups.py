@@ -0,0 +1,80 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from rollups import ROLLUPS, refresh_rollup, refresh_rollups
+from storage import TABLE_SCHEMAS, bulk_load
+
+
+@pytest.fixture
+def emissions_df():
+    """Create a small processed emissions DataFrame for testing"""
+    return pd.DataFrame({
+        'Year': [2022, 2022, 2023, 2023],
+        'State': ['Alabama', 'Alabama', 'Alabama', 'Alaska'],
+        'Source': ['Highway Vehicles', 'Off-Highway', 'Highway Vehicles', 'Highway Vehicles'],
+        'Pollutant': ['CO', 'CO', 'CO', 'SO2'],
+        'Emissions': [1.5, 2.0, 3.0, 0.5]
+    })
+
+@pytest.fixture
+def pollution_df():
+    """Create a small processed pollution DataFrame spanning two years"""
+    dates = pd.to_datetime(['2022-12-30', '2022-12-31', '2023-01-01', '2023-01-02'])
+    df = pd.DataFrame({'Date': dates, 'Address': 'Site', 'State': ['Arizona', 'Arizona', 'Arizona', 'Ohio'],
+                       'County': 'County', 'City': 'City'})
+    for pollutant in ['O3', 'CO', 'SO2', 'NO2']:
+        for column in ['Mean', '1st Max Value', '1st Max Hour', 'AQI']:
+            df[f'{pollutant} {column}'] = [1.0, 2.0, 3.0, 4.0]
+    df.loc[1, 'CO AQI'] = None
+    return df.assign(Year=dates.year, Month=dates.month, Day=dates.day)
+
+def test_emissions_rollup(emissions_df):
+    """Emissions are summed per state, year and pollutant"""
+    conn = sqlite3.connect(':memory:')
+    bulk_load(conn, 'emissions', emissions_df)
+    refresh_rollups(conn, 'emissions')
+
+    rollup = pd.read_sql('SELECT * FROM emissions_yearly ORDER BY State, Year, Pollutant', conn)
+    assert rollup.to_dict('records') == [
+        {'State': 'Alabama', 'Year': 2022, 'Pollutant': 'CO', 'Emissions': 3.5, 'Sources': 2},
+        {'State': 'Alabama', 'Year': 2023, 'Pollutant': 'CO', 'Emissions': 3.0, 'Sources': 1},
+        {'State': 'Alaska', 'Year': 2023, 'Pollutant': 'SO2', 'Emissions': 0.5, 'Sources': 1},
+    ]
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT Year, SUM(Emissions) FROM emissions_yearly "
+                        "WHERE Pollutant = 'CO' GROUP BY Year").fetchall()
+    assert 'COVERING INDEX' in str(plan)
+
+def test_pollution_rollup_averages(pollution_df):
+    """Monthly sums and counts give the same averages as the raw rows"""
+    conn = sqlite3.connect(':memory:')
+    bulk_load(conn, 'pollution', pollution_df)
+    refresh_rollup(conn, 'pollution_monthly')
+
+    rollup = pd.read_sql('SELECT * FROM pollution_monthly', conn)
+    assert rollup['Readings'].sum() == len(pollution_df)
+    yearly = rollup.groupby('Year')[['CO AQI Sum', 'CO AQI Count']].sum()
+    pd.testing.assert_series_equal(yearly['CO AQI Sum'] / yearly['CO AQI Count'],
+                                   pollution_df.groupby('Year')['CO AQI'].mean(), check_names=False,
+                                   check_index_type=False)
+
+def test_incremental_refresh_matches_rebuild(pollution_df):
+    """Refreshing from the first appended year gives the same rollup as a full rebuild"""
+    conn = sqlite3.connect(':memory:')
+    bulk_load(conn, 'pollution', pollution_df.iloc[:3])
+    refresh_rollups(conn, 'pollution')
+    bulk_load(conn, 'pollution', pollution_df.iloc[3:], if_exists='append')
+    refresh_rollups(conn, 'pollution', since_year=2023)
+    incremental = pd.read_sql('SELECT * FROM pollution_monthly ORDER BY State, Year, Month', conn)
+
+    refresh_rollups(conn, 'pollution')
+    rebuilt = pd.read_sql('SELECT * FROM pollution_monthly ORDER BY State, Year, Month', conn)
+    pd.testing.assert_frame_equal(incremental, rebuilt)
+    assert len(rebuilt) == 3
+
+def test_every_rollup_has_a_source():
+    """Rollup keys exist in their source tables"""
+    for rollup in ROLLUPS.values():
+        columns = {col for col, _ in TABLE_SCHEMAS[rollup['source']]}
+        assert set(rollup['keys']) <= columns
@@ -0,0 +1,71 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from storage import TABLE_SCHEMAS, _rows, bulk_load, index_name
+
+
+@pytest.fixture
+def emissions_df():
+    """Create a small processed emissions DataFrame for testing"""
+    return pd.DataFrame({
+        'Year': [2022, 2023, 2023],
+        'State': ['Alabama', 'Alabama', 'Alaska'],
+        'Source': ['Fuel Comb. Elec. Util.'] * 3,
+        'Pollutant': ['CO', 'CO', None],
+        'Emissions': [1.5, 2.0, float('nan')]
+    })
+
+def test_bulk_load_typed_schema_and_indexes(emissions_df):
+    """Tables are created with the declared types and query-key indexes"""
+    conn = sqlite3.connect(':memory:')
+    assert bulk_load(conn, 'emissions', emissions_df[['Emissions', 'Pollutant', 'Source', 'State', 'Year']]) == 3
+
+    types = [(row[1], row[2]) for row in conn.execute("PRAGMA table_info(emissions)")]
+    assert types == TABLE_SCHEMAS['emissions']
+
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(emissions)")}
+    assert index_name('emissions', ('State', 'Year')) in indexes
+
+    rows = conn.execute("SELECT * FROM emissions ORDER BY Year, State").fetchall()
+    assert rows[0] == (2022, 'Alabama', 'Fuel Comb. Elec. Util.', 'CO', 1.5)
+    assert rows[2][3:] == (None, None)  # NaN and None become NULL
+    conn.close()
+
+def test_bulk_load_replace_and_append(emissions_df):
+    """Replace drops the previous rows, append keeps them"""
+    conn = sqlite3.connect(':memory:')
+    bulk_load(conn, 'emissions', emissions_df, batch_size=2)
+    bulk_load(conn, 'emissions', emissions_df.iloc[:1], if_exists='append')
+    assert conn.execute("SELECT COUNT(*) FROM emissions").fetchone()[0] == 4
+
+    bulk_load(conn, 'emissions', emissions_df.iloc[:1])
+    assert conn.execute("SELECT COUNT(*) FROM emissions").fetchone()[0] == 1
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 2  # load pragmas are restored
+    conn.close()
+
+def test_bulk_load_missing_columns(emissions_df):
+    """Frames missing schema columns are rejected without touching the table"""
+    conn = sqlite3.connect(':memory:')
+    bulk_load(conn, 'emissions', emissions_df)
+    with pytest.raises(ValueError, match="Missing columns"):
+        bulk_load(conn, 'emissions', emissions_df.drop(columns=['Source']))
+    assert conn.execute("SELECT COUNT(*) FROM emissions").fetchone()[0] == 3
+    conn.close()
+
+def test_rows_bind_missing_values_as_null():
+    """Every kind of missing value becomes None, the other values plain Python values"""
+    df = pd.DataFrame({
+        'Date': pd.to_datetime(['2020-01-01', None, '2020-01-01']),
+        'State': pd.Categorical(['Ohio', None, 'Utah']),
+        'Count': pd.array([1, None, 3], dtype='Int64'),
+        'Small': pd.Series([1, 2, 3], dtype='int8'),
+        'Mean': [0.5, float('nan'), 1.5],
+    })
+    assert list(_rows(df)) == [
+        ('2020-01-01 00:00:00', 'Ohio', 1, 1, 0.5),
+        (None, None, None, 2, None),
+        ('2020-01-01 00:00:00', 'Utah', 3, 3, 1.5),
+    ]
+    assert all(type(value) is int for value in next(_rows(df))[2:4])
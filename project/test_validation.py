@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from validation import SchemaViolationError, validate_frame
+
+
+@pytest.fixture
+def emissions_df():
+    """A small valid emissions frame"""
+    return pd.DataFrame({
+        'Year': pd.Series([2020, 2021, 2020, 2021], dtype='int16'),
+        'State': pd.Categorical(['Ohio', 'Ohio', 'Utah', 'Utah']),
+        'Source': 'Highway Vehicles',
+        'Pollutant': 'CO',
+        'Emissions': [1.0, 2.0, 3.0, 4.0]
+    })
+
+def test_valid_frame_passes(emissions_df):
+    """A frame following its rules gives an empty report"""
+    report = validate_frame(emissions_df, 'emissions')
+    assert report.violations == []
+    assert report.rows == report.rows_checked == 4
+
+def test_violations_are_reported(emissions_df):
+    """Unmapped states, non-numeric values, out of range years and duplicate keys are all reported"""
+    emissions_df['State'] = emissions_df['State'].cat.set_categories(['Ohio'])  # Utah became NaN
+    emissions_df['Emissions'] = pd.Series([1.0, 'n/a', 3.0, 4.0], dtype=object)
+    emissions_df.loc[0, 'Year'] = 1900
+    emissions_df = pd.concat([emissions_df, emissions_df.iloc[[1]]], ignore_index=True)
+
+    with pytest.raises(SchemaViolationError, match="emissions failed validation") as error:
+        validate_frame(emissions_df, 'emissions')
+    report = error.value.report
+    assert {(str(violation['column']), violation['check']): violation['count'] for violation in report.violations} == {
+        ('Year', 'min'): 1,
+        ('State', 'not_null'): 2,
+        ('Emissions', 'numeric'): 2,
+        ("['Year', 'State', 'Source', 'Pollutant']", 'unique'): 1,
+    }
+    assert report.violations[0]['examples'] == [1900]
+    assert report.to_dict()['rows'] == 5
+
+def test_warnings_and_empty_frames():
+    """Warn rules do not raise, empty frames do"""
+    renewable = pd.DataFrame({'Year': [2020], 'Month': [1], 'Sector': ['Commerical'], 'Solar Energy': [-1.0]})
+    report = validate_frame(renewable, 'renewable_energy', raise_on_error=False)
+    assert {(violation['column'], violation['check'], violation['severity']) for violation in report.violations} >= {
+        ('Solar Energy', 'min', 'warn'), ('Wind Energy', 'present', 'error')
+    }
+    with pytest.raises(SchemaViolationError, match="not_empty"):
+        validate_frame(pd.DataFrame(), 'pollution')
+
+def test_large_frames_are_sampled(emissions_df):
+    """Value checks run on a sample of a large frame, uniqueness on all of it"""
+    df = pd.concat([emissions_df.iloc[[0, 2]].assign(Year=year) for year in range(1970, 2070)], ignore_index=True)
+    df['Year'] = df['Year'].astype('int16')
+    report = validate_frame(df, 'emissions', sample_rows=50)
+    assert (report.rows, report.rows_checked) == (200, 50)
+    assert report.violations == []
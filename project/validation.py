@@ -0,0 +1,170 @@
+import logging
+
+import pandas as pd
+
+from metrics import stage
+from storage import TABLE_SCHEMAS
+
+logger = logging.getLogger(__name__)
+
+# Frames longer than this have their value checks run on a random sample of this many rows
+SAMPLE_ROWS = 1_000_000
+# Examples of offending values kept per violation
+MAX_EXAMPLES = 5
+
+SECTORS = ['Commerical', 'Electric Power', 'Industrial', 'Residential', 'Transportation']
+POLLUTANTS = ['O3', 'CO', 'SO2', 'NO2']
+
+# Declarative rules per table. Every column rule has a dtype kind ('integer', 'number',
+# 'text' or 'datetime') and may add min/max bounds, allowed values and nullable=True.
+# Violations of rules with severity 'warn' are reported but do not fail the stage.
+TABLE_RULES = {
+    'renewable_energy': {
+        'columns': {
+            'Year': {'dtype': 'integer', 'min': 1949, 'max': 2100},
+            'Month': {'dtype': 'integer', 'min': 1, 'max': 12},
+            'Sector': {'dtype': 'text', 'allowed': SECTORS},
+            **{col: {'dtype': 'number', 'min': 0, 'severity': 'warn'}
+               for col, _ in TABLE_SCHEMAS['renewable_energy'][3:]},
+        },
+        'unique': ['Year', 'Month', 'Sector'],
+    },
+    'pollution': {
+        'columns': {
+            'Date': {'dtype': 'datetime'},
+            **{col: {'dtype': 'text'} for col in ['Address', 'State', 'County', 'City']},
+            **{f'{pollutant} {measure}': {'dtype': 'number', 'nullable': True}
+               for pollutant in POLLUTANTS for measure in ['Mean', '1st Max Value']},
+            **{f'{pollutant} 1st Max Hour': {'dtype': 'number', 'nullable': True, 'min': 0, 'max': 23}
+               for pollutant in POLLUTANTS},
+            **{f'{pollutant} AQI': {'dtype': 'number', 'nullable': True, 'min': 0, 'max': 500, 'severity': 'warn'}
+               for pollutant in POLLUTANTS},
+            'Year': {'dtype': 'integer', 'min': 1980, 'max': 2100},
+            'Month': {'dtype': 'integer', 'min': 1, 'max': 12},
+            'Day': {'dtype': 'integer', 'min': 1, 'max': 31},
+        },
+    },
+    'emissions': {
+        'columns': {
+            'Year': {'dtype': 'integer', 'min': 1970, 'max': 2100},
+            'State': {'dtype': 'text'},
+            'Source': {'dtype': 'text'},
+            'Pollutant': {'dtype': 'text'},
+            'Emissions': {'dtype': 'number'},
+        },
+        'unique': ['Year', 'State', 'Source', 'Pollutant'],
+    },
+}
+
+class SchemaViolationError(ValueError):
+    """Raised when a frame breaks an error-severity rule of its table"""
+
+    def __init__(self, report):
+        self.report = report
+        super().__init__(f"{report.table} failed validation: " + '; '.join(
+            f"{violation['check']} on {violation['column']} ({violation['count']} rows)" for violation in report.errors
+        ))
+
+class ValidationReport:
+    """Violations found in one frame"""
+
+    def __init__(self, table, rows, rows_checked):
+        self.table = table
+        self.rows = rows
+        self.rows_checked = rows_checked
+        self.violations = []
+
+    @property
+    def errors(self):
+        return [violation for violation in self.violations if violation['severity'] == 'error']
+
+    def add(self, column, check, mask_or_count, values=None, severity='error'):
+        """Record a violation from a boolean mask over values, or from a plain count"""
+        if values is None:
+            count, examples = int(mask_or_count), []
+        else:
+            count = int(mask_or_count.sum())
+            examples = values[mask_or_count].drop_duplicates().head(MAX_EXAMPLES).tolist()
+        if count:
+            self.violations.append({'column': column, 'check': check, 'count': count,
+                                    'examples': examples, 'severity': severity})
+
+    def to_dict(self):
+        return {'table': self.table, 'rows': self.rows, 'rows_checked': self.rows_checked,
+                'violations': self.violations}
+
+def _check_dtype(report, col, values, kind, severity):
+    """Check the column's type; returns the values as numbers for the range checks, if numeric"""
+    dtype = values.dtype
+    if kind == 'datetime':
+        if not pd.api.types.is_datetime64_any_dtype(dtype):
+            report.add(col, 'dtype', len(values), severity=severity)
+        return None
+    if kind == 'text':
+        if not (pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)
+                or isinstance(dtype, pd.CategoricalDtype)):
+            report.add(col, 'dtype', len(values), severity=severity)
+        return None
+
+    if pd.api.types.is_bool_dtype(dtype):
+        report.add(col, 'dtype', len(values), severity=severity)
+        return None
+    numbers = values if pd.api.types.is_numeric_dtype(dtype) else pd.to_numeric(values, errors='coerce')
+    report.add(col, 'numeric', numbers.isna() & values.notna(), values, severity)
+    if kind == 'integer' and not pd.api.types.is_integer_dtype(numbers.dtype):
+        report.add(col, 'integer', numbers.notna() & (numbers % 1 != 0), values, severity)
+    return numbers
+
+def validate_frame(df, table, sample_rows=SAMPLE_ROWS, raise_on_error=True, seed=0, exempt=()):
+    """
+    Check a frame against the rules of its table in one vectorized pass per column.
+
+    Types are checked from the dtypes; nulls, bounds and allowed values are checked
+    with column-wide masks, on a random sample of sample_rows rows when the frame is
+    longer. Uniqueness keys are always checked on the whole frame, since duplicates
+    cannot be found from a sample. Returns a ValidationReport and records it in the
+    current run's metrics; with raise_on_error, error violations raise a
+    SchemaViolationError and warnings are logged. The column rules of the exempt
+    columns are skipped, e.g. for values that are only filled in later.
+    """
+    rules = TABLE_RULES[table]
+    with stage(f'validate {table}', rows_in=len(df)) as record:
+        sample = df.sample(n=sample_rows, random_state=seed) if len(df) > sample_rows else df
+        report = ValidationReport(table, len(df), len(sample))
+        if df.empty:
+            report.add(None, 'not_empty', 1)
+        column_rules = {} if df.empty else rules['columns']
+
+        for col, rule in column_rules.items():
+            if col in exempt:
+                continue
+            severity = rule.get('severity', 'error')
+            if col not in df.columns:
+                report.add(col, 'present', len(df))
+                continue
+            values = sample[col]
+            if not rule.get('nullable', False):
+                report.add(col, 'not_null', values.isna(), values, severity)
+            numbers = _check_dtype(report, col, values, rule['dtype'], severity)
+            if numbers is not None and 'min' in rule:
+                report.add(col, 'min', numbers < rule['min'], values, severity)
+            if numbers is not None and 'max' in rule:
+                report.add(col, 'max', numbers > rule['max'], values, severity)
+            if 'allowed' in rule:
+                report.add(col, 'allowed', values.notna() & ~values.isin(rule['allowed']), values, severity)
+
+        keys = rules.get('unique')
+        if keys and not df.empty and all(col in df.columns for col in keys):
+            report.add(keys, 'unique', df.duplicated(subset=keys).sum())
+
+        record.update(rows_checked=report.rows_checked, violations=len(report.violations))
+
+    for violation in report.violations:
+        if violation['severity'] == 'warn':
+            logger.warning(f"{table}: {violation['count']} rows fail {violation['check']} "
+                           f"on {violation['column']}, e.g. {violation['examples']}")
+    if report.errors:
+        logger.error(f"{table} failed validation: {report.errors}")
+        if raise_on_error:
+            raise SchemaViolationError(report)
+    return report